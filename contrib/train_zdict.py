@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Train a compression dictionary for cached blocks and report its gain
+
+Fetches random blocks from a jsonrpc url, trains a dictionary on half of
+them and compares plain zlib with the dictionary on the other half, with
+and without the block codec. With --redis_url the dictionary is stored as
+the one jefferson workers started with --redis_compression_dictionary load.
+
+    python contrib/train_zdict.py https://api.dpays.io --count 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from zlib import compress
+from zlib import decompress
+
+import requests
+import ujson
+from aredis import StrictRedis
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from jefferson.cache.backends.redis import Cache
+from jefferson.cache.codec import decode_block_response
+from jefferson.cache.codec import encode_block_response
+from jefferson.cache.zdict import CompressionDictionaries
+from jefferson.cache.zdict import CompressionDictionary
+from jefferson.cache.zdict import DEFAULT_DICTIONARY_SIZE
+from jefferson.cache.zdict import store_dictionary
+from jefferson.cache.zdict import train_dictionary
+
+session = requests.Session()
+
+
+def fetch_blocks(url, block_nums):
+    blocks = []
+    for i, block_num in enumerate(block_nums, 1):
+        response = session.post(url, json={'id': block_num, 'jsonrpc': '2.0',
+                                           'method': 'get_block', 'params': [block_num]})
+        response_json = response.json()
+        if response_json.get('result'):
+            blocks.append(response_json)
+        print(f'\rfetched {i}/{len(block_nums)}', end='', file=sys.stderr)
+    print(file=sys.stderr)
+    return blocks
+
+
+def measure(name, blocks, pack, unpack):
+    start = time.perf_counter()
+    packed = [pack(block) for block in blocks]
+    pack_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for data in packed:
+        unpack(data)
+    unpack_time = time.perf_counter() - start
+    size = sum(len(data) for data in packed)
+    return {'name': name,
+            'bytes_per_block': size / len(blocks),
+            'pack_us': pack_time / len(blocks) * 1_000_000,
+            'unpack_us': unpack_time / len(blocks) * 1_000_000}
+
+
+def display(results):
+    baseline = results[0]['bytes_per_block']
+    print(f'{"":<20}{"bytes/block":>14}{"ratio":>8}{"pack us":>10}{"unpack us":>11}')
+    for result in results:
+        print(f'{result["name"]:<20}{result["bytes_per_block"]:>14.0f}'
+              f'{result["bytes_per_block"] / baseline:>8.2f}'
+              f'{result["pack_us"]:>10.0f}{result["unpack_us"]:>11.0f}')
+
+
+def json_bytes(block):
+    return ujson.dumps(block, ensure_ascii=False).encode('utf8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='train a block compression dictionary')
+    parser.add_argument('url', type=str, help='jsonrpc url to fetch blocks from')
+    parser.add_argument('--count', type=int, default=1000, help='blocks to sample')
+    parser.add_argument('--start', type=int, default=1)
+    parser.add_argument('--end', type=int, default=20_000_000)
+    parser.add_argument('--size', type=int, default=DEFAULT_DICTIONARY_SIZE,
+                        help='dictionary size in bytes')
+    parser.add_argument('--redis_url', type=str, default=None,
+                        help='store the dictionary in this redis as the current one')
+    args = parser.parse_args()
+
+    block_nums = random.sample(range(args.start, args.end + 1), args.count)
+    blocks = fetch_blocks(args.url, block_nums)
+    training, testing = blocks[::2], blocks[1::2]
+
+    start = time.perf_counter()
+    data = train_dictionary([json_bytes(block) for block in training], size=args.size)
+    dictionary = CompressionDictionary(data)
+    print(f'trained {len(data)} byte dictionary {dictionary.version} '
+          f'on {len(training)} blocks in {time.perf_counter() - start:.1f}s')
+
+    dictionaries = CompressionDictionaries()
+    dictionaries.add(dictionary)
+    display([
+        measure('zlib', testing,
+                lambda block: compress(json_bytes(block)),
+                lambda data: ujson.loads(decompress(data))),
+        measure('zlib+dictionary', testing,
+                lambda block: dictionaries.compress(json_bytes(block)),
+                lambda data: ujson.loads(dictionaries.decompress(data))),
+        measure('codec', testing,
+                encode_block_response,
+                decode_block_response),
+        measure('codec+dictionary', testing,
+                lambda block: encode_block_response(block, dictionaries),
+                lambda data: decode_block_response(data, dictionaries)),
+    ])
+
+    if args.redis_url:
+        cache = Cache(StrictRedis().from_url(args.redis_url))
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(store_dictionary(cache, dictionary))
+        print(f'stored dictionary {dictionary.version} as current')
+
+
+if __name__ == '__main__':
+    main()
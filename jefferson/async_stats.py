@@ -1,18 +1,20 @@
 # -*- coding: utf-8 -*-
 import asyncio
+from collections import Counter
 from collections import deque
 from random import random
+from time import perf_counter
 from typing import List
-from typing import Tuple
 
 import structlog
-# pylint: disable=no-name-in-module
-from cytoolz import sliding_window
 
-# pylint: enable=no-name-in-module
+from .timings import Timings
 
 logger = structlog.get_logger('stats')
 
+# seconds between sends of aggregated counters when no request is sampled
+COUNTER_FLUSH_INTERVAL = 1.0
+
 
 __all__ = ['AsyncStatsClient']
 
@@ -53,6 +55,8 @@ class AsyncStatsClient:
         self._prefix = prefix
         self._maxudpsize = maxudpsize
         self._stats = deque()
+        self._counters = Counter()
+        self._last_flush = perf_counter()
         if prefix is not None:
             prefix = f'{prefix}.'
         else:
@@ -88,6 +92,23 @@ class AsyncStatsClient:
             prefix = '+' if delta and value >= 0 else ''
             self.put(stat, f'{prefix}{value}|g', rate)
 
+    def count(self, stat: str, count=1):
+        """Aggregate a counter locally, it is sent with the next flush."""
+        self._counters[stat] += count
+
+    def flush_due(self) -> bool:
+        return perf_counter() - self._last_flush >= COUNTER_FLUSH_INTERVAL
+
+    def flush(self):
+        """Send aggregated counters and queued stats."""
+        for stat, count in self._counters.items():
+            if count:
+                self.put(stat, f'{count}|c', 1)
+        self._counters.clear()
+        self._last_flush = perf_counter()
+        if self._stats:
+            self._sendbatch()
+
     def set(self, stat: str, value, rate=1):
         """Set a set value."""
         self.put(stat, f'{value}|s', rate)
@@ -101,14 +122,11 @@ class AsyncStatsClient:
                 value = f'{value}|@{rate}'
         self._stats.append(f'{self._prefix}{stat}:{value}')
 
-    def from_timings(self, timings: List[Tuple[float, str]]):
-        self._stats.extend(
-            f'{self._prefix}{t2[1]}:{((t2[0] - t1[0]) * 1000):0.6f}|ms' for t1, t2 in sliding_window(2, timings)
-        )
+    def from_timings(self, timings: Timings):
+        self._stats.extend(timings.format(self._prefix))
 
-    def serialize_timings(self, timings: List[Tuple[float, str]]) -> List:
-        return [f'{self._prefix}{t2[1]}:{((t2[0] - t1[0]) * 1000):0.6f}|ms' for t1,
-                t2 in sliding_window(2, timings)]
+    def serialize_timings(self, timings: Timings) -> List:
+        return timings.format(self._prefix)
 
     def _sendbatch(self, stats: deque = None):
         try:
@@ -130,5 +148,5 @@ class AsyncStatsClient:
         return self._transport is not None
 
 
-def fmt_timings(timings: List[Tuple[float, str]]):
-    return [f'{t2[1]}:{((t2[0] - t1[0]) * 1000):0.6f}|ms' for t1, t2 in sliding_window(2, timings)]
+def fmt_timings(timings: Timings):
+    return timings.format()
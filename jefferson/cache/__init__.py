@@ -3,6 +3,7 @@
 from urllib.parse import urlparse
 from collections import namedtuple
 from typing import Any
+from typing import List
 from enum import IntEnum
 
 import structlog
@@ -11,8 +12,15 @@ from aredis import StrictRedis
 
 
 from .cache_group import CacheGroup
+from .key_filter import KeyFilter
+from .zdict import CompressionDictionaries
+from ..executors import PayloadExecutor
 from ..typedefs import WebApp
+from .backends.coalesce import CoalescingCache
 from .backends.redis import Cache
+from .backends.sharded import Shard
+from .backends.sharded import ShardedCache
+from .backends.write_behind import WriteBehindCache
 
 logger = structlog.get_logger(__name__)
 
@@ -31,10 +39,31 @@ def setup_caches(app: WebApp, loop) -> Any:
     logger.info('cache.setup_caches', when='before_server_start')
     args = app.config.args
     caches = []
-    if args.redis_url:
+    executor = app.config.payload_executor
+    dictionaries = None
+    if args.redis_compression_dictionary:
+        dictionaries = CompressionDictionaries()
+    if args.redis_shard_urls:
+        if args.redis_url:
+            logger.warning('redis_shard_urls is set, ignoring redis_url')
+        if args.redis_read_replica_urls:
+            logger.warning('redis_shard_urls is set, ignoring redis_read_replica_urls')
+        sharded_cache = setup_sharded_cache(args.redis_shard_urls,
+                                            coalesce_window=args.redis_read_coalesce_window,
+                                            block_codec=args.redis_block_codec,
+                                            dictionaries=dictionaries,
+                                            executor=executor)
+        caches.append(CacheGroupItem(cache=sharded_cache,
+                                     read=True,
+                                     write=True,
+                                     speed_tier=SpeedTier.SLOW))
+    elif args.redis_url:
         try:
-            redis_client = StrictRedis().from_url(args.redis_url)
-            redis_cache = Cache(redis_client)
+            redis_cache = build_redis_cache(args.redis_url,
+                                            coalesce_window=args.redis_read_coalesce_window,
+                                            block_codec=args.redis_block_codec,
+                                            dictionaries=dictionaries,
+                                            executor=executor)
             if redis_cache:
                 caches.append(CacheGroupItem(cache=redis_cache,
                                              read=False,
@@ -49,8 +78,11 @@ def setup_caches(app: WebApp, loop) -> Any:
                             read_replica=url,
                             host=url.hostname,
                             port=url.port)
-                redis_client = StrictRedis().from_url(url_string)
-                redis_cache = Cache(redis_client)
+                redis_cache = build_redis_cache(url_string,
+                                                coalesce_window=args.redis_read_coalesce_window,
+                                                block_codec=args.redis_block_codec,
+                                                dictionaries=dictionaries,
+                                                executor=executor)
                 if redis_cache:
                     caches.append(
                         CacheGroupItem(cache=redis_cache,
@@ -58,5 +90,73 @@ def setup_caches(app: WebApp, loop) -> Any:
                                        write=False,
                                        speed_tier=SpeedTier.SLOW))
 
-    configured_cache_group = CacheGroup(caches=caches)
+    if args.cache_write_behind_interval:
+        caches = [item._replace(cache=WriteBehindCache(
+            item.cache,
+            flush_interval=args.cache_write_behind_interval,
+            max_batch_size=args.cache_write_behind_batch_size,
+            max_queue_size=args.cache_write_behind_queue_size)) if item.write else item
+            for item in caches]
+
+    key_filter = None
+    if args.cache_key_filter_capacity:
+        key_filter = KeyFilter(args.cache_key_filter_capacity,
+                               error_rate=args.cache_key_filter_error_rate,
+                               sync_interval=args.cache_key_filter_sync_interval)
+
+    configured_cache_group = CacheGroup(
+        caches=caches,
+        error_grace_period=args.cache_error_grace_period,
+        negative_ttl=args.cache_negative_ttl,
+        hashed_keys=args.cache_hashed_keys,
+        read_hedge_delay=args.cache_read_hedge_delay,
+        memory_cache_admission=args.cache_memory_admission,
+        memory_cache_max_entry_size=args.cache_memory_max_entry_size,
+        key_filter=key_filter,
+        breaker_failure_threshold=args.cache_breaker_failure_threshold,
+        breaker_cooldown=args.cache_breaker_cooldown,
+        breaker_call_timeout=args.cache_breaker_call_timeout,
+        promote_irreversible_blocks=args.cache_promote_irreversible_blocks,
+        reversible_block_ttl=args.cache_reversible_block_ttl,
+        derive_block_headers=args.cache_derive_block_headers,
+        transaction_index_size=args.cache_transaction_index,
+        compression_dictionaries=dictionaries)
     return configured_cache_group
+
+
+def build_redis_cache(url_string: str, coalesce_window: int = None,
+                      block_codec: bool = False,
+                      dictionaries: CompressionDictionaries = None,
+                      executor: PayloadExecutor = None) -> Any:
+    """coalesce_window is in microseconds, None disables read coalescing"""
+    redis_cache = Cache(StrictRedis().from_url(url_string),
+                        block_codec=block_codec,
+                        dictionaries=dictionaries,
+                        executor=executor)
+    if coalesce_window is None:
+        return redis_cache
+    return CoalescingCache(redis_cache, window=coalesce_window / 1_000_000)
+
+
+def setup_sharded_cache(shard_url_strings: List[str],
+                        coalesce_window: int = None,
+                        block_codec: bool = False,
+                        dictionaries: CompressionDictionaries = None,
+                        executor: PayloadExecutor = None) -> ShardedCache:
+    """each shard is a comma separated primary url followed by its read replica urls"""
+    shards = []
+    for shard_url_string in shard_url_strings:
+        primary_url, *replica_urls = [url.strip() for url in shard_url_string.split(',')]
+        url = urlparse(primary_url)
+        logger.info('Adding redis shard',
+                    host=url.hostname,
+                    port=url.port,
+                    replicas=len(replica_urls))
+        # the name places the shard on the hash ring, keep it stable and password free
+        shards.append(Shard(name=f'{url.hostname}:{url.port}{url.path}',
+                            primary=build_redis_cache(primary_url, coalesce_window,
+                                                      block_codec, dictionaries, executor),
+                            replicas=tuple(build_redis_cache(replica_url, coalesce_window,
+                                                             block_codec, dictionaries, executor)
+                                           for replica_url in replica_urls)))
+    return ShardedCache(shards)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from typing import Any
+from typing import Dict
+
+import structlog
+
+from .redis import CacheKey
+from .redis import CacheKeys
+from .redis import CacheResult
+from .redis import CacheResults
+
+logger = structlog.get_logger(__name__)
+
+# flush early when this many distinct keys are waiting
+DEFAULT_MAX_BATCH_KEYS = 1000
+
+
+def _consume_exception(future: asyncio.Future) -> None:
+    # a batch error may reach a future none of whose waiters are left
+    if not future.cancelled():
+        future.exception()
+
+
+class CoalescingCache:
+    """gathers concurrent get/mget keys into one mget per window
+
+    Keys requested within `window` seconds (or the same event loop tick when
+    window is 0) are read with a single MGET, each key once, and the results
+    are handed back to every waiter. All other calls go straight to the
+    wrapped cache.
+    """
+
+    def __init__(self,
+                 cache: Any,
+                 window: float = 0,
+                 max_batch_keys: int = DEFAULT_MAX_BATCH_KEYS) -> None:
+        self.cache = cache
+        self.window = window
+        self.max_batch_keys = max_batch_keys
+        self.keys_requested = 0
+        self.batches = 0
+        self._pending = {}
+        self._flush_handle = None
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+    async def get(self, key: CacheKey) -> CacheResult:
+        return await self._enqueue(key)
+
+    async def mget(self, keys: CacheKeys) -> CacheResults:
+        if not keys:
+            return []
+        return list(await asyncio.gather(*[self._enqueue(key) for key in keys]))
+
+    def _enqueue(self, key: CacheKey) -> asyncio.Future:
+        self.keys_requested += 1
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_event_loop()
+            future = loop.create_future()
+            future.add_done_callback(_consume_exception)
+            self._pending[key] = future
+            if len(self._pending) >= self.max_batch_keys:
+                self._flush()
+            elif self._flush_handle is None:
+                if self.window:
+                    self._flush_handle = loop.call_later(self.window, self._flush)
+                else:
+                    self._flush_handle = loop.call_soon(self._flush)
+        # one waiter giving up mustn't cancel the read for the others
+        return asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            self.batches += 1
+            asyncio.ensure_future(self._read(pending))
+
+    async def _read(self, pending: Dict[CacheKey, asyncio.Future]) -> None:
+        keys = list(pending)
+        try:
+            results = await self.cache.mget(keys)
+        except Exception as e:
+            logger.warning('coalesced cache read failed', keys=len(keys), e=e)
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, result in zip(keys, results):
+            future = pending[key]
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            'keys_requested': self.keys_requested,
+            'batches': self.batches
+        }
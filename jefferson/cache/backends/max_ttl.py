@@ -8,6 +8,9 @@ from typing import Tuple
 from typing import TypeVar
 
 import structlog
+from ujson import dumps
+
+from ..probabilistic import FrequencySketch
 
 logger = structlog.get_logger(__name__)
 
@@ -27,7 +30,17 @@ CacheResults = List[CacheResult]
 
 
 class SimplerMaxTTLMemoryCache:
-    def __init__(self, max_ttl: int = None, max_size: int=None):
+    """in-process cache with a maximum ttl and size
+
+    With `admission` set, a new key only replaces the oldest entry of a full
+    cache if it has been asked for more often recently, so keys read once
+    (eg by a crawler) don't push out popular ones. Values larger than
+    `max_entry_size` characters of JSON are not stored, callers which
+    already know a value's encoded size pass it to save encoding it again.
+    """
+
+    def __init__(self, max_ttl: int = None, max_size: int=None,
+                 admission: bool=False, max_entry_size: int=None):
 
         self._cache = {}
 
@@ -37,8 +50,13 @@ class SimplerMaxTTLMemoryCache:
         self._items = self._cache.items()
         self._max_ttl = max_ttl or MEMORY_CACHE_MAX_TTL
         self._max_size = max_size or MEMORY_CACHE_MAX_SIZE
+        self._max_entry_size = max_entry_size
+        self._sketch = FrequencySketch(self._max_size) if admission else None
+        self.rejected = 0
 
     def gets(self, key: CacheKey) -> CacheResult:
+        if self._sketch:
+            self._sketch.increment(key)
         if key in self._cache:
             timestamp, result = self._cache[key]
             if timestamp - perf_counter() > 0:
@@ -56,18 +74,37 @@ class SimplerMaxTTLMemoryCache:
     async def mget(self, keys: CacheKeys) -> CacheResults:
         return [self.gets(k) for k in keys]
 
-    def sets(self, key: CacheKey, value: CacheValue, expire_time: CacheTTLValue) -> NoReturn:
+    def sets(self, key: CacheKey, value: CacheValue, expire_time: CacheTTLValue,
+             size: int = None) -> NoReturn:
         if expire_time is None or expire_time > self._max_ttl:
             expire_time = self._max_ttl
+        if self._max_entry_size and self.entry_size(value, size) > self._max_entry_size:
+            # don't leave an outdated smaller value behind
+            self.deletes(key)
+            self.rejected += 1
+            return
         self.prune()
+        if key not in self._cache and len(self._cache) >= self._max_size:
+            victim = next(iter(self._cache))
+            if self._sketch and not self._sketch.admit(key, victim):
+                self.rejected += 1
+                return
+            del self._cache[victim]
         self._cache[key] = (perf_counter() + expire_time), value
         return
 
+    @staticmethod
+    def entry_size(value: CacheValue, size: int = None) -> int:
+        if size is not None:
+            return size
+        return len(dumps(value, ensure_ascii=False))
+
     async def set(self, key: CacheKey, value: CacheValue, expire_time: CacheTTLValue) -> NoReturn:
         return self.sets(key, value, expire_time)
 
-    def set_manys(self, data: CachePairs, expire_time: CacheTTLValue) -> NoReturn:
-        _ = [self.sets(k, v, expire_time) for k, v, in data.items()]
+    def set_manys(self, data: CachePairs, expire_time: CacheTTLValue,
+                  size: int = None) -> NoReturn:
+        _ = [self.sets(k, v, expire_time, size=size) for k, v, in data.items()]
         return
 
     async def set_many(self, data: CachePairs, expire_time: CacheTTLValue) -> NoReturn:
@@ -87,12 +124,11 @@ class SimplerMaxTTLMemoryCache:
         pruned = [k for k, v in self._items if (v[0] - now) < 0]
         for k in pruned:
             del self._cache[k]
-        if len(self._items) >= self._max_size:
-            del self._cache[next(iter(self._cache))]
         return
 
     def clears(self) -> NoReturn:
-        self._cache = {}
+        # clear in place, the key/value/item views must stay attached
+        self._cache.clear()
         return
 
     async def clear(self) -> NoReturn:
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
+import struct
+import zlib
 from zlib import compress
-from zlib import decompress
 from typing import Dict
 from typing import List
 from typing import NoReturn
@@ -8,10 +9,19 @@ from typing import Optional
 from typing import Tuple
 from typing import TypeVar
 
+import structlog
 
 from ujson import dumps
 from ujson import loads
 
+from ..codec import BLOCK_MAGIC
+from ..codec import decode_block_response
+from ..codec import encode_block_response
+from ..zdict import CompressionDictionaries
+from ..zdict import decompress_value
+from ..zdict import is_block_family
+from ...executors import PayloadExecutor
+
 CacheTTLValue = TypeVar('CacheTTL', int, float, type(None))
 CacheKey = str
 CacheKeys = List[CacheKey]
@@ -22,43 +32,132 @@ CacheResultValue = TypeVar('CacheValue', int, float, str, dict)
 CacheResult = Optional[CacheResultValue]
 CacheResults = List[CacheResult]
 
+logger = structlog.get_logger(__name__)
+
+# stored values are compressed, estimate the size of the payload they decode to
+COMPRESSION_RATIO = 8
+
+# raised by values which are corrupt or written in a format this worker can't read
+DECODE_ERRORS = (zlib.error, struct.error, ValueError, KeyError, TypeError, IndexError)
+
+
+def expire_kwargs(expire_time: CacheTTLValue) -> dict:
+    # redis only accepts integer expiries, use milliseconds for fractional ones
+    if isinstance(expire_time, float):
+        if expire_time.is_integer():
+            return {'ex': int(expire_time)}
+        return {'px': int(expire_time * 1000)}
+    return {'ex': expire_time}
+
 
 class Cache:
     """cache provides basic function"""
 
-    def __init__(self, client):
+    def __init__(self, client, block_codec: bool = False,
+                 dictionaries: CompressionDictionaries = None,
+                 executor: PayloadExecutor = None):
         self.client = client
+        # packs and unpacks large values off the event loop
+        self.executor = executor
+        # blocks are always decodable, only written in the block encoding when set
+        self.block_codec = block_codec
+        # shared by all of a worker's caches, used for block responses
+        self.dictionaries = dictionaries
+
+    def _pack_block(self, value) -> Optional[bytes]:
+        if self.block_codec:
+            return encode_block_response(value, self.dictionaries)
+        return None
+
+    def _compress(self, value, data: bytes) -> bytes:
+        if self.dictionaries and is_block_family(value):
+            return self.dictionaries.compress(data)
+        return compress(data)
+
+    def _decompress(self, value: bytes) -> Optional[bytes]:
+        return decompress_value(value, self.dictionaries)
 
-    # pylint: disable=no-self-use
     def _pack(self, value) -> bytes:
-        return compress(dumps(value, ensure_ascii=False).encode('utf8'))
+        encoded = self._pack_block(value)
+        if encoded is not None:
+            return encoded
+        return self._compress(value, dumps(value, ensure_ascii=False).encode('utf8'))
 
     def _unpack(self, value: bytes) -> CacheResult:
         if not value:
             return None
-        return loads(decompress(value))
-
-    # pylint: enable=no-self-use
+        if value.startswith(BLOCK_MAGIC):
+            return decode_block_response(value, self.dictionaries)
+        data = self._decompress(value)
+        return loads(data) if data is not None else None
+
+    # ujson holds the GIL for a whole call, running it in the pool wouldn't
+    # free the event loop, so only (de)compression, which releases it, moves there
+    async def pack(self, value) -> bytes:
+        if self.executor is None:
+            return self._pack(value)
+        encoded = self._pack_block(value)
+        if encoded is not None:
+            return encoded
+        data = dumps(value, ensure_ascii=False).encode('utf8')
+        return await self.executor.run(len(data), self._compress, value, data)
+
+    async def unpack(self, value: bytes) -> CacheResult:
+        if self.executor is None or not value or value.startswith(BLOCK_MAGIC):
+            return self._unpack(value)
+        data = await self.executor.run(len(value) * COMPRESSION_RATIO, self._decompress, value)
+        return loads(data) if data is not None else None
+
+    async def unpack_or_miss(self, key: CacheKey, value: bytes) -> CacheResult:
+        # one bad value is a miss, not an error for the whole read
+        try:
+            return await self.unpack(value)
+        except DECODE_ERRORS as e:
+            logger.warning('undecodable cached value', key=key, e=e)
+            return None
 
     async def get(self, key: CacheKey) -> CacheResult:
         res = await self.client.get(key)
         if res:
-            return self._unpack(res)
+            return await self.unpack_or_miss(key, res)
         return None
 
-    async def set(self, key: str, value, expire_time: CacheTTLValue=None) -> NoReturn:
-        value = self._pack(value)
-        await self.client.set(key, value, ex=expire_time)
+    async def set(self, key: str, value, expire_time: CacheTTLValue=None,
+                  nx: bool=False) -> NoReturn:
+        value = await self.pack(value)
+        await self.client.set(key, value, nx=nx, **expire_kwargs(expire_time))
 
-    async def set_many(self, data: CachePairs, expire_time: CacheTTLValue=None) -> NoReturn:
+    async def set_many(self, data: CachePairs, expire_time: CacheTTLValue=None,
+                       nx: bool=False) -> NoReturn:
         async with await self.client.pipeline() as pipeline:
             for key, value in data.items():
-                value = self._pack(value)
-                await pipeline.set(key, value, expire_time)
+                value = await self.pack(value)
+                await pipeline.set(key, value, nx=nx, **expire_kwargs(expire_time))
+            return await pipeline.execute()
+
+    async def set_many_by_ttl(self, data: Dict[CacheTTLValue, CachePairs],
+                              nx: bool=False) -> NoReturn:
+        """write several groups of pairs, each with its own expiry, in one pipeline"""
+        async with await self.client.pipeline() as pipeline:
+            for expire_time, pairs in data.items():
+                for key, value in pairs.items():
+                    value = await self.pack(value)
+                    await pipeline.set(key, value, nx=nx, **expire_kwargs(expire_time))
             return await pipeline.execute()
 
     async def mget(self, keys: CacheKeys) -> CacheResults:
-        return [self._unpack(r) for r in await self.client.mget(keys)]
+        return [await self.unpack_or_miss(key, r)
+                for key, r in zip(keys, await self.client.mget(keys))]
+
+    async def merge_bits(self, key: CacheKey, bits: bytes) -> bytes:
+        """OR raw bits into those stored at key in one transaction, returning the result"""
+        incoming = f'{key}.incoming'
+        async with await self.client.pipeline() as pipeline:
+            await pipeline.set(incoming, bits)
+            await pipeline.bitop('OR', key, key, incoming)
+            await pipeline.delete(incoming)
+            await pipeline.execute()
+        return await self.client.get(key)
 
     async def clear(self):
         return await self.client.clear()
@@ -85,7 +184,12 @@ class MockClient:
     async def execute(self):
         pass
 
-    async def set(self, key, value, ex: CacheTTLValue=None) -> NoReturn:
+    async def set(self, key, value, ex: CacheTTLValue=None, px: int=None,
+                  nx: bool=False) -> NoReturn:
+        if nx and self.cache.gets(key) is not None:
+            return
+        if px is not None:
+            ex = px / 1000
         self.cache.sets(key, value, ex)
 
     async def get(self, key) -> CacheResult:
@@ -97,6 +201,15 @@ class MockClient:
     async def pipeline(self):
         return self
 
+    async def bitop(self, operation, dest, *keys):
+        assert operation == 'OR'
+        values = [self.cache.gets(key) or b'' for key in keys]
+        result = bytearray(max(map(len, values)))
+        for value in values:
+            for i, byte in enumerate(value):
+                result[i] |= byte
+        self.cache.sets(dest, bytes(result), None)
+
     async def clear(self):
         self.cache.clears()
 
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import bisect
+import hashlib
+import itertools
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import NoReturn
+from typing import Tuple
+
+import structlog
+
+from .redis import Cache
+from .redis import CacheKey
+from .redis import CacheKeys
+from .redis import CachePairs
+from .redis import CacheResult
+from .redis import CacheResults
+from .redis import CacheTTLValue
+
+logger = structlog.get_logger(__name__)
+
+# points on the ring per shard, more points spread keys more evenly
+DEFAULT_VNODES = 160
+
+
+def ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class Shard(NamedTuple):
+    name: str
+    primary: Cache
+    replicas: Tuple[Cache, ...] = ()
+
+
+class ShardedCache:
+    """spreads keys across several redis primaries using consistent hashing
+
+    Each shard is placed on a hash ring at `vnodes` points derived from its
+    name, so adding a shard only moves the keys which land on its points.
+    Writes go to a shard's primary, reads to its replicas if it has any.
+    """
+
+    def __init__(self, shards: List[Shard], vnodes: int = DEFAULT_VNODES) -> None:
+        self.vnodes = vnodes
+        self.shards = []
+        self._shards_by_name = {}
+        self._ring_hashes = []
+        self._ring_shards = []
+        self._readers = {}
+        for shard in shards:
+            self.add_shard(shard)
+
+    def add_shard(self, shard: Shard) -> None:
+        if shard.name in self._shards_by_name:
+            raise ValueError(f'duplicate shard name: {shard.name}')
+        self.shards.append(shard)
+        self._shards_by_name[shard.name] = shard
+        self._readers[shard.name] = itertools.cycle(shard.replicas or [shard.primary])
+        points = sorted(itertools.chain(
+            zip(self._ring_hashes, self._ring_shards),
+            ((ring_hash(f'{shard.name}-{i}'), shard) for i in range(self.vnodes))),
+            key=lambda point: point[0])
+        self._ring_hashes = [h for h, _ in points]
+        self._ring_shards = [s for _, s in points]
+        logger.info('added cache shard', shard=shard.name,
+                    replicas=len(shard.replicas), shards=len(self.shards))
+
+    def shard_for_key(self, key: CacheKey) -> Shard:
+        index = bisect.bisect(self._ring_hashes, ring_hash(key))
+        if index == len(self._ring_hashes):
+            index = 0
+        return self._ring_shards[index]
+
+    def group_keys(self, keys: CacheKeys) -> Dict[str, List[int]]:
+        """map shard names to the positions of their keys"""
+        groups = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(self.shard_for_key(key).name, []).append(i)
+        return groups
+
+    def reader(self, shard: Shard) -> Cache:
+        return next(self._readers[shard.name])
+
+    async def get(self, key: CacheKey) -> CacheResult:
+        return await self.reader(self.shard_for_key(key)).get(key)
+
+    async def mget(self, keys: CacheKeys) -> CacheResults:
+        groups = self.group_keys(keys)
+        shard_results = await asyncio.gather(
+            *[self.reader(self._shards_by_name[name]).mget([keys[i] for i in positions])
+              for name, positions in groups.items()],
+            return_exceptions=True)
+        results = [None for key in keys]
+        for (name, positions), shard_result in zip(groups.items(), shard_results):
+            if isinstance(shard_result, Exception):
+                # one unavailable shard shouldn't fail reads from the others
+                logger.warning('cache shard mget failed', shard=name, e=shard_result)
+                continue
+            for i, result in zip(positions, shard_result):
+                results[i] = result
+        return results
+
+    async def set(self, key: CacheKey, value, expire_time: CacheTTLValue = None,
+                  nx: bool = False) -> NoReturn:
+        await self.shard_for_key(key).primary.set(key, value, expire_time=expire_time, nx=nx)
+
+    async def set_many(self, data: CachePairs, expire_time: CacheTTLValue = None,
+                       nx: bool = False) -> NoReturn:
+        keys = list(data.keys())
+        groups = self.group_keys(keys)
+        await asyncio.gather(
+            *[self._shards_by_name[name].primary.set_many(
+                {keys[i]: data[keys[i]] for i in positions}, expire_time=expire_time, nx=nx)
+              for name, positions in groups.items()])
+
+    async def set_many_by_ttl(self, data: Dict[CacheTTLValue, CachePairs],
+                              nx: bool = False) -> NoReturn:
+        shard_data = {}
+        for expire_time, pairs in data.items():
+            for key, value in pairs.items():
+                shard = self.shard_for_key(key)
+                shard_data.setdefault(shard.name, {}).setdefault(expire_time, {})[key] = value
+        await asyncio.gather(
+            *[self._shards_by_name[name].primary.set_many_by_ttl(grouped, nx=nx)
+              for name, grouped in shard_data.items()])
+
+    async def delete(self, key: CacheKey) -> NoReturn:
+        await self.shard_for_key(key).primary.delete(key)
+
+    async def merge_bits(self, key: CacheKey, bits: bytes) -> bytes:
+        return await self.shard_for_key(key).primary.merge_bits(key, bits)
+
+    async def clear(self):
+        return await asyncio.gather(*[shard.primary.clear() for shard in self.shards])
+
+    async def close(self):
+        for shard in self.shards:
+            for cache in itertools.chain([shard.primary], shard.replicas):
+                await cache.close()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import NoReturn
+from typing import Optional
+
+import structlog
+
+from .redis import CacheKey
+from .redis import CachePairs
+from .redis import CacheTTLValue
+
+logger = structlog.get_logger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 0.05
+DEFAULT_MAX_BATCH_SIZE = 500
+DEFAULT_MAX_QUEUE_SIZE = 10000
+
+
+class WriteBehindCache:
+    """queues writes and flushes them to the wrapped cache in one pipeline
+
+    Pending writes are merged by key, the newest value wins, and flushed
+    grouped by expire time every `flush_interval` seconds or as soon as
+    `max_batch_size` keys are waiting. Once `max_queue_size` keys are
+    waiting, writes of new keys are dropped and counted. Reads go straight
+    to the wrapped cache. Deletes drop the key's pending write and wait for
+    any flush already writing it. Flushes and deletes are awaited through
+    `guard` when one is set, so a circuit breaker sees their failures.
+    """
+
+    def __init__(self,
+                 cache: Any,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE) -> None:
+        self.cache = cache
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self.max_queue_size = max(max_queue_size, max_batch_size)
+        self.queued = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self._pending = {}
+        self._flush_handle = None
+        # in-flight flushes and the writes they carry
+        self._flushing = {}  # type: Dict[asyncio.Future, Dict[CacheKey, tuple]]
+        self.guard = None  # type: Optional[Callable[[Awaitable], Awaitable]]
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+    async def set(self, key: CacheKey, value, expire_time: CacheTTLValue = None,
+                  nx: bool = False) -> NoReturn:
+        self._enqueue(key, value, expire_time, nx)
+
+    async def set_many(self, data: CachePairs, expire_time: CacheTTLValue = None,
+                       nx: bool = False) -> NoReturn:
+        for key, value in data.items():
+            self._enqueue(key, value, expire_time, nx)
+
+    def _enqueue(self, key: CacheKey, value, expire_time: CacheTTLValue, nx: bool) -> None:
+        if key not in self._pending and len(self._pending) >= self.max_queue_size:
+            self.dropped += 1
+            return
+        self.queued += 1
+        self._pending[key] = (expire_time, nx, value)
+        if len(self._pending) >= self.max_batch_size:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_event_loop().call_later(self.flush_interval,
+                                                                     self.flush)
+
+    def flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            task = asyncio.ensure_future(self._write(pending))
+            self._flushing[task] = pending
+            task.add_done_callback(self._flushed)
+
+    def _flushed(self, task: asyncio.Future) -> None:
+        self._flushing.pop(task, None)
+
+    async def _guarded(self, call: Awaitable) -> Any:
+        if self.guard is None:
+            return await call
+        return await self.guard(call)
+
+    async def _write(self, pending: Dict[CacheKey, tuple]) -> None:
+        # set-if-absent writes go in their own batch
+        grouped = {False: {}, True: {}}
+        for key, (expire_time, nx, value) in pending.items():
+            grouped[nx].setdefault(expire_time, {})[key] = value
+        self.flushes += 1
+        try:
+            if hasattr(self.cache, 'set_many_by_ttl'):
+                writes = [self.cache.set_many_by_ttl(data, nx=nx)
+                          for nx, data in grouped.items() if data]
+            else:
+                writes = [self.cache.set_many(pairs, expire_time=expire_time, nx=nx)
+                          for nx, data in grouped.items()
+                          for expire_time, pairs in data.items()]
+            await self._guarded(asyncio.gather(*writes))
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.warning('write-behind flush failed', keys=len(pending), e=e)
+
+    async def drain(self) -> None:
+        self.flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    async def delete(self, key: CacheKey) -> NoReturn:
+        self._pending.pop(key, None)
+        # a flush still writing the key would otherwise land after the delete
+        writing = [task for task, pending in self._flushing.items() if key in pending]
+        if writing:
+            await asyncio.gather(*writing, return_exceptions=True)
+        await self._guarded(self.cache.delete(key))
+
+    async def clear(self):
+        self._pending.clear()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+        return await self.cache.clear()
+
+    async def close(self):
+        await self.drain()
+        await self.cache.close()
+
+    def stats(self) -> dict:
+        return {
+            'pending': len(self._pending),
+            'queued': self.queued,
+            'dropped': self.dropped,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes
+        }
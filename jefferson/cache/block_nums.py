@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Block numbers of historical responses
+
+A response cached with `NO_EXPIRE_IF_IRREVERSIBLE` is stored without
+expiry once every block it depends on is irreversible. For blocks and
+block headers the block number is in the result itself, other methods
+have an extractor here returning the highest block number the response
+depends on, or None when the response can still change. They only apply
+to methods configured with a ttl of -2, eg:
+
+    get_ops_in_block [1000, false]          -> 1000
+    get_transaction ["c6f0..."]             -> result["block_num"]
+    get_account_history ["dpay", 500, 100]  -> highest op block, if op 500 exists
+"""
+from typing import Any
+from typing import Callable
+from typing import Optional
+
+BlockNumExtractor = Callable[[Any, Any], Optional[int]]
+
+
+def param(params: Any, index: int, name: str) -> Any:
+    if isinstance(params, list) and len(params) > index:
+        return params[index]
+    if isinstance(params, dict):
+        return params.get(name)
+    return None
+
+
+def ops_in_block_block_num(params: Any, result: Any) -> Optional[int]:
+    return int(param(params, 0, 'block_num'))
+
+
+def block_range_block_num(params: Any, result: Any) -> Optional[int]:
+    count = int(param(params, 1, 'count'))
+    if count < 1:
+        return None
+    return int(param(params, 0, 'starting_block_num')) + count - 1
+
+
+def transaction_block_num(params: Any, result: Any) -> Optional[int]:
+    return int(result['block_num'])
+
+
+def account_history_block_num(params: Any, result: Any) -> Optional[int]:
+    start = int(param(params, 1, 'start'))
+    history = result['history'] if isinstance(result, dict) else result
+    # a page ending before `start` grows as new operations are applied
+    if start < 0 or not history or max(seq for seq, _ in history) != start:
+        return None
+    return max(int(op['block']) for _, op in history)
+
+
+# keyed by api and method, other apis' methods of the same name return other things
+BLOCK_NUM_EXTRACTORS = {
+    ('database_api', 'get_ops_in_block'): ops_in_block_block_num,
+    ('condenser_api', 'get_ops_in_block'): ops_in_block_block_num,
+    ('account_history_api', 'get_ops_in_block'): ops_in_block_block_num,
+    ('block_api', 'get_block_range'): block_range_block_num,
+    ('database_api', 'get_transaction'): transaction_block_num,
+    ('condenser_api', 'get_transaction'): transaction_block_num,
+    ('account_history_api', 'get_transaction'): transaction_block_num,
+    ('database_api', 'get_account_history'): account_history_block_num,
+    ('condenser_api', 'get_account_history'): account_history_block_num,
+    ('account_history_api', 'get_account_history'): account_history_block_num,
+}
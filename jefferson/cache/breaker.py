@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from time import perf_counter as perf
+from typing import Awaitable
+from typing import Callable
+
+import structlog
+
+from async_timeout import timeout
+
+logger = structlog.get_logger(__name__)
+
+DEFAULT_COOLDOWN = 10
+
+# below the default cache read timeout, so a hung cache counts as failing
+DEFAULT_CALL_TIMEOUT = 0.5
+
+PROBE_TIMEOUT = 1.0
+
+
+class CircuitBreaker:
+    """stops using a cache after consecutive failures
+
+    After `failure_threshold` failed calls in a row the breaker opens and
+    the cache is skipped. Once `cooldown` seconds have passed a single
+    probe runs in the background; the breaker closes when it succeeds and
+    waits another cooldown when it fails, so requests never wait on a cache
+    that is down. State changes are logged, failures while open are not.
+    Callers count calls which time out as failures.
+    """
+
+    def __init__(self,
+                 name: str,
+                 failure_threshold: int,
+                 cooldown: float = DEFAULT_COOLDOWN) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._probe = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def available(self, probe: Callable[[], Awaitable]) -> bool:
+        if self.opened_at is None:
+            return True
+        if self._probe is None and perf() - self.opened_at >= self.cooldown:
+            self._probe = asyncio.ensure_future(self._run_probe(probe))
+        return False
+
+    async def _run_probe(self, probe: Callable[[], Awaitable]) -> None:
+        try:
+            async with timeout(PROBE_TIMEOUT):
+                await probe()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.opened_at = perf()
+            logger.info('cache still failing', cache=self.name, e=e)
+        else:
+            self.close()
+        finally:
+            self._probe = None
+
+    def record_success(self) -> None:
+        self.failures = 0
+
+    def record_failure(self, e: Exception) -> None:
+        self.failures += 1
+        if self.opened_at is None and self.failures >= self.failure_threshold:
+            self.opened_at = perf()
+            self.trips += 1
+            logger.warning('cache failing, circuit breaker opened',
+                           cache=self.name,
+                           failures=self.failures,
+                           cooldown=self.cooldown,
+                           e=e)
+
+    def close(self) -> None:
+        if self.opened_at is not None:
+            logger.info('cache recovered, circuit breaker closed', cache=self.name)
+        self.opened_at = None
+        self.failures = 0
+
+    def cancel(self) -> None:
+        if self._probe is not None:
+            self._probe.cancel()
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'open': self.is_open,
+            'failures': self.failures,
+            'trips': self.trips
+        }
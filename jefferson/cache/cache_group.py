@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 import asyncio
+import functools
 from operator import itemgetter
+from time import perf_counter as perf
 from typing import Any
+from typing import Awaitable
+from typing import Callable
 from typing import Dict
 from typing import List
 from typing import NoReturn
@@ -12,7 +16,10 @@ from typing import TypeVar
 import cytoolz
 import structlog
 
+from async_timeout import timeout
 from jefferson.errors import JeffersonInteralError
+from jefferson.validators import is_empty_block_response
+from jefferson.validators import is_get_block_header_request
 from jefferson.validators import is_get_block_request
 from jefferson.validators import is_valid_get_block_response
 
@@ -25,16 +32,42 @@ from ..typedefs import SingleJrpcResponse
 from ..validators import is_valid_non_error_jefferson_response
 from ..validators import is_valid_non_error_single_jsonrpc_response
 from .backends.max_ttl import SimplerMaxTTLMemoryCache
+from .backends.write_behind import WriteBehindCache
+from .breaker import DEFAULT_CALL_TIMEOUT
+from .breaker import CircuitBreaker
+from .key_filter import KeyFilter
+from .latency import LatencyTracker
+from .recent_writes import RecentWrites
+from .reversible import ReversibleBlocks
+from .transactions import TransactionIndex
+from .canonical import LEGACY_GET_BLOCK
+from .canonical import canonical_method
+from .canonical import to_canonical_response
+from .derived import block_header_from_block
+from .derived import block_header_source_key
+from .derived import block_key
+from .derived import transaction_from_block
+from .derived import transaction_request_id
 from .ttl import TTL
+from .utils import BLOCK_INTERVAL
+from .utils import HEAD_BLOCK_NUM_KEY
+from .utils import KEY_FINGERPRINT_KEY
+from .utils import CacheEntryState
+from .utils import block_linkage_from_jsonrpc_response
+from .utils import block_num_from_jsonrpc_request
+from .utils import block_num_from_jsonrpc_response
+from .utils import cache_entry_state
+from .utils import cache_key_fingerprint
+from .utils import hashed_cache_key
 from .utils import irreversible_ttl
 from .utils import jsonrpc_cache_key
 from .utils import merge_cached_response
 from .utils import merge_cached_responses
+from .utils import stale_cache_entry
+from .zdict import CompressionDictionaries
 
 logger = structlog.getLogger(__name__)
 
-BATCH_IRREVERSIBLE_TTL_SET = frozenset([TTL.NO_EXPIRE_IF_IRREVERSIBLE])
-
 # types
 CacheTTLValue = TypeVar('CacheTTL', int, float, type(None))
 CacheTTL = TTL
@@ -46,6 +79,9 @@ CachePairs = Dict[CacheKey, CacheValue]
 CacheResultValue = TypeVar('CacheValue', int, float, str, dict)
 CacheResult = Optional[CacheResultValue]
 CacheResults = List[CacheResult]
+CacheReadFunc = Callable[[Any], Awaitable[Any]]
+RefreshFunc = Callable[[SingleJrpcRequest], Awaitable[SingleJrpcResponse]]
+DeriveFunc = Callable[[CacheValue], Optional[dict]]
 
 
 class UncacheableResponse(JeffersonInteralError):
@@ -55,17 +91,72 @@ class UncacheableResponse(JeffersonInteralError):
 SLOW_TIER = 1
 FAST_TIER = 2
 
+# most future block numbers tracked for negative cache entries
+MAX_NEGATIVE_BLOCK_NUMS = 1000
+
+# read by circuit breaker probes to check a cache is back
+BREAKER_PROBE_KEY = 'jefferson.breaker.probe'
+
+# don't start upstream requests for cache reads faster than this
+MIN_RACE_UPSTREAM_DELAY = 0.005
+
+# head block number shared by workers, for EXPIRE_ON_NEW_BLOCK entries
+SHARED_HEAD_BLOCK_NUM_KEY = 'head_block_num'
+HEAD_BLOCK_NUM_SYNC_INTERVAL = 1
+
 
 class CacheGroup:
     # pylint: disable=unused-argument, too-many-arguments, no-else-return
-    def __init__(self, caches: List[Any]) -> None:
+    def __init__(self,
+                 caches: List[Any],
+                 error_grace_period: int = 0,
+                 negative_ttl: float = 0,
+                 hashed_keys: bool = False,
+                 read_hedge_delay: float = 0,
+                 memory_cache_admission: bool = False,
+                 memory_cache_max_entry_size: int = None,
+                 key_filter: KeyFilter = None,
+                 breaker_failure_threshold: int = 0,
+                 breaker_cooldown: float = 0,
+                 breaker_call_timeout: float = DEFAULT_CALL_TIMEOUT,
+                 promote_irreversible_blocks: bool = False,
+                 reversible_block_ttl: int = None,
+                 derive_block_headers: bool = False,
+                 transaction_index_size: int = None,
+                 compression_dictionaries: CompressionDictionaries = None) -> None:
         self._cache_group_items = caches
-        self._memory_cache = SimplerMaxTTLMemoryCache()
+        self._compression_dictionaries = compression_dictionaries
+        self._transaction_index = None
+        if transaction_index_size:
+            self._transaction_index = TransactionIndex(transaction_index_size)
+        self._last_irreversible_block_num = None
+        self._derive_block_headers = derive_block_headers
+        self.derived_hits = 0
+        self._promote_irreversible_blocks = promote_irreversible_blocks
+        self._reversible_block_ttl = reversible_block_ttl
+        self._reversible_blocks = None
+        if promote_irreversible_blocks or reversible_block_ttl:
+            self._reversible_blocks = ReversibleBlocks()
+        self._key_filter = key_filter
+        self._key_filter_task = None
+        self._head_block_num_task = None
+        self._hashed_keys = hashed_keys
+        self._read_hedge_delay = read_hedge_delay or 0
+        self._error_grace_period = error_grace_period or 0
+        self._negative_ttl = negative_ttl or 0
+        self._negative_block_keys = dict()
+        self._head_block_num = None
+        self._memory_cache = SimplerMaxTTLMemoryCache(
+            admission=memory_cache_admission,
+            max_entry_size=memory_cache_max_entry_size)
+        self._memory_cache_max_entry_size = memory_cache_max_entry_size
         self._read_cache_items = []
         self._read_caches = []
         self._write_cache_items = []
         self._write_caches = []
         self._all_caches = [cache_item.cache for cache_item in self._cache_group_items]
+        self._refreshing = set()
+        self._recent_writes = RecentWrites()
 
         self._read_cache_items = list(
             sorted(
@@ -89,6 +180,20 @@ class CacheGroup:
             logger.info('setting single write cache as read/write')
             self._read_caches = self._write_caches
 
+        self._read_latency = {cache: LatencyTracker(f'read_cache.{i}')
+                              for i, cache in enumerate(self._read_caches)}
+        self._breakers = {}
+        self._breaker_call_timeout = breaker_call_timeout
+        if breaker_failure_threshold:
+            self._breakers = {cache: CircuitBreaker(f'cache.{i}',
+                                                    breaker_failure_threshold,
+                                                    breaker_cooldown)
+                              for i, cache in enumerate(self._all_caches)}
+            # queued writes only fail when they are flushed
+            for cache in self._all_caches:
+                if isinstance(cache, WriteBehindCache):
+                    cache.guard = functools.partial(self.guarded, cache)
+
         logger.info('CacheGroup configured',
                     items=self._cache_group_items,
                     read_items=self._read_cache_items,
@@ -98,10 +203,12 @@ class CacheGroup:
 
     async def get(self, key: CacheKey) -> CacheResult:
         # no memory cache read here for optimization, it has already happened
-        for cache in self._read_caches:
-            result = await cache.get(key)
-            if result is not None:
-                return result
+        if self._key_filter and not self._key_filter.may_contain(key):
+            return None
+        result = await self.read(lambda cache: cache.get(key))
+        if result is None and self._key_filter:
+            self._key_filter.record_miss(key)
+        return result
 
     async def mget(self, keys: CacheKeys) -> CacheResults:
         # set blank results object
@@ -114,126 +221,639 @@ class CacheGroup:
         if all(results):
             return results
 
-        # read from one cache at a time
-        for cache in self._read_caches:
-            missing = [
-                key for key, response in zip(
-                    keys, results) if not response]
-            cache_results = await cache.mget(missing)
-            cache_iter = iter(cache_results)
-            results = [existing or next(cache_iter) for existing in results]
-            if all(results):
+        missing = [i for i, response in enumerate(results) if not response]
+        if self._key_filter:
+            missing = [i for i in missing if self._key_filter.may_contain(keys[i])]
+            if not missing:
                 return results
+        missing_keys = [keys[i] for i in missing]
+        cache_results = await self.read(lambda cache: cache.mget(missing_keys))
+        if cache_results:
+            for i, result in zip(missing, cache_results):
+                results[i] = result
+                if result is None and self._key_filter:
+                    self._key_filter.record_miss(keys[i])
         return results
 
-    async def set(self, key: CacheKey, value: CacheValue, expire_time: CacheTTL) -> NoReturn:
+    def available(self, cache: Any) -> bool:
+        breaker = self._breakers.get(cache)
+        return breaker is None or breaker.available(lambda: cache.get(BREAKER_PROBE_KEY))
+
+    async def guarded(self, cache: Any, call: Awaitable) -> Any:
+        breaker = self._breakers.get(cache)
+        if breaker is None:
+            return await call
+        try:
+            # callers' timeouts cancel the call, which isn't counted
+            async with timeout(self._breaker_call_timeout or None):
+                result = await call
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            breaker.record_failure(e)
+            raise
+        breaker.record_success()
+        return result
+
+    def guarded_write(self, cache: Any, call: Awaitable) -> Awaitable:
+        # write-behind caches guard their flushes, queueing always succeeds
+        if isinstance(cache, WriteBehindCache):
+            return call
+        return self.guarded(cache, call)
+
+    def ranked_read_caches(self) -> List[Any]:
+        # sorted is stable, equally scored caches keep their configured order
+        now = perf()
+        return sorted(filter(self.available, self._read_caches),
+                      key=lambda cache: self._read_latency[cache].score(now))
+
+    def available_write_caches(self) -> List[Any]:
+        return list(filter(self.available, self._write_caches))
+
+    async def timed_read(self, cache: Any, read: CacheReadFunc) -> Any:
+        tracker = self._read_latency[cache]
+        start = tracker.start()
+        try:
+            result = await self.guarded(cache, read(cache))
+        except asyncio.CancelledError:
+            # an abandoned hedged read still took at least this long
+            tracker.finish(start)
+            raise
+        except Exception:
+            tracker.finish(start, error=True)
+            raise
+        tracker.finish(start)
+        return result
+
+    async def read(self, read: CacheReadFunc) -> Any:
+        """read from the read cache with the lowest latency score
+
+        Read caches are replicas of the same data, so a miss is an answer.
+        Errors fail over to the next cache, and with a hedge delay a slow
+        read is raced against the next cache.
+        """
+        caches = self.ranked_read_caches()
+        if self._read_hedge_delay and len(caches) > 1:
+            return await self.hedged_read(caches, read)
+        error = None
+        for cache in caches:
+            try:
+                return await self.timed_read(cache, read)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning('cache read failed', e=e)
+                error = e
+        if error:
+            raise error
+        return None
+
+    async def hedged_read(self, caches: List[Any], read: CacheReadFunc) -> Any:
+        error = None
+        pending = set()
+        try:
+            while caches or pending:
+                if not pending:
+                    pending.add(asyncio.ensure_future(self.timed_read(caches.pop(0), read)))
+                hedge_delay = self._read_hedge_delay if caches else None
+                done, pending = await asyncio.wait(pending,
+                                                   timeout=hedge_delay,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # slow read, race it against the next cache
+                    pending.add(asyncio.ensure_future(self.timed_read(caches.pop(0), read)))
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                    logger.warning('cache read failed', e=error)
+        finally:
+            for task in pending:
+                task.cancel()
+        if error:
+            raise error
+        return None
+
+    def race_upstream_delay(self, cache_read_timeout: float) -> Optional[float]:
+        """seconds after which a cache read is unusually slow
+
+        Taken from the fastest read cache's recent latencies. None when no
+        read cache has been measured yet or the delay would not come before
+        `cache_read_timeout`.
+        """
+        trackers = [tracker for tracker in self._read_latency.values() if tracker.requests]
+        if not trackers:
+            return None
+        delay = max(min(tracker.slow_read_threshold() for tracker in trackers),
+                    MIN_RACE_UPSTREAM_DELAY)
+        if delay >= cache_read_timeout:
+            return None
+        return delay
+
+    def read_cache_stats(self) -> List[dict]:
+        return [self._read_latency[cache].stats() for cache in self._read_caches]
+
+    async def set(self,
+                  key: CacheKey,
+                  value: CacheValue,
+                  expire_time: CacheTTL,
+                  suppress_redundant: bool = False,
+                  size: int = None) -> NoReturn:
+        """`size` is the value's length as JSON, when the caller already knows it"""
         if isinstance(expire_time, TTL):
             expire_time = expire_time.value
-        self._memory_cache.sets(key, value, expire_time=expire_time)
-        await asyncio.gather(*[cache.set(key, value, expire_time=expire_time) for cache
-                               in self._write_caches], return_exceptions=False)
-
-    async def set_many(self, data: CachePairs, expire_time: CacheTTL) -> NoReturn:
+        self._memory_cache.sets(key, value, expire_time=expire_time, size=size)
+        if self._key_filter and self._write_caches:
+            self._key_filter.add(key)
+        if suppress_redundant:
+            if self._recent_writes.is_redundant(key, expire_time):
+                return
+            self._recent_writes.record(key, expire_time)
+        kwargs = self.write_kwargs(expire_time, suppress_redundant)
+        await asyncio.gather(*[self.guarded_write(cache, cache.set(key, value, **kwargs))
+                               for cache in self.available_write_caches()],
+                             return_exceptions=False)
+
+    async def set_many(self,
+                       data: CachePairs,
+                       expire_time: CacheTTL,
+                       suppress_redundant: bool = False,
+                       size: int = None) -> NoReturn:
         # pylint: disable=no-member
         # set memory cache
         if isinstance(expire_time, TTL):
             expire_time = expire_time.value
-        self._memory_cache.set_manys(data, expire_time)
-
-        futures = [cache.set_many(data, expire_time=expire_time) for cache in self._write_caches]
+        self._memory_cache.set_manys(data, expire_time, size=size)
+        if self._key_filter and self._write_caches:
+            for key in data:
+                self._key_filter.add(key)
+        if suppress_redundant:
+            data = {key: value for key, value in data.items()
+                    if not self._recent_writes.is_redundant(key, expire_time)}
+            for key in data:
+                self._recent_writes.record(key, expire_time)
+            if not data:
+                return
+
+        kwargs = self.write_kwargs(expire_time, suppress_redundant)
+        futures = [self.guarded_write(cache, cache.set_many(data, **kwargs))
+                   for cache in self.available_write_caches()]
         if futures:
             await asyncio.gather(*futures, return_exceptions=False)
 
+    @staticmethod
+    def write_kwargs(expire_time: CacheTTLValue, suppress_redundant: bool) -> dict:
+        # entries without expiry never change, other workers' copies are as good
+        if suppress_redundant and expire_time is None:
+            return {'expire_time': expire_time, 'nx': True}
+        return {'expire_time': expire_time}
+
+    async def delete_many(self, keys: CacheKeys) -> NoReturn:
+        for key in keys:
+            self._memory_cache.deletes(key)
+            self._recent_writes.discard(key)
+        await asyncio.gather(*[self.guarded_write(cache, cache.delete(key))
+                               for cache in self.available_write_caches()
+                               for key in keys], return_exceptions=True)
+
     async def clear(self) -> NoReturn:
         self._memory_cache.clears()
+        self._recent_writes.clear()
         await asyncio.gather(*[cache.clear() for cache in self._write_caches])
 
+    def start_key_filter_sync(self) -> None:
+        if self._key_filter and self._write_caches and self._key_filter_task is None:
+            self._key_filter_task = asyncio.ensure_future(
+                self._key_filter.sync_forever(self._write_caches[0]))
+
+    def start_head_block_num_sync(self) -> None:
+        if self._read_caches and self._head_block_num_task is None:
+            self._head_block_num_task = asyncio.ensure_future(self.sync_head_block_num_forever())
+
+    async def sync_head_block_num_forever(self) -> NoReturn:
+        # the head block advances whichever worker fetched it, so entries
+        # tagged with an older head expire, and negative entries for blocks
+        # which now exist are deleted, on every worker within a second
+        while True:
+            try:
+                # read directly, the key filter may not know the key yet
+                head_block_num = await self.read(
+                    lambda cache: cache.get(SHARED_HEAD_BLOCK_NUM_KEY))
+                if head_block_num:
+                    await self.update_head_block_num(head_block_num)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning('head block num sync failed', e=e)
+            await asyncio.sleep(HEAD_BLOCK_NUM_SYNC_INTERVAL)
+
+    async def load_compression_dictionary(self) -> NoReturn:
+        if self._compression_dictionaries and self._read_caches:
+            dictionary = await self._compression_dictionaries.load(self._read_caches[0])
+            logger.info('compression dictionary loaded',
+                        version=dictionary.version if dictionary else None)
+
+    def compression_dictionary_stats(self) -> Optional[dict]:
+        if self._compression_dictionaries:
+            return self._compression_dictionaries.stats()
+        return None
+
+    def key_filter_stats(self) -> Optional[dict]:
+        if self._key_filter:
+            return self._key_filter.stats()
+        return None
+
+    def breaker_stats(self) -> List[dict]:
+        return [breaker.stats() for breaker in self._breakers.values()]
+
     async def close(self) -> NoReturn:
-        for cache in self._all_caches:
-            cache.close()
+        for breaker in self._breakers.values():
+            breaker.cancel()
+        if self._key_filter_task is not None:
+            self._key_filter_task.cancel()
+            self._key_filter_task = None
+        if self._head_block_num_task is not None:
+            self._head_block_num_task.cancel()
+            self._head_block_num_task = None
+        await asyncio.gather(*[cache.close() for cache in self._all_caches
+                               if hasattr(cache, 'close')],
+                             return_exceptions=True)
 
     # jsonrpc related methods
     #
 
     async def get_single_jsonrpc_response(self,
-                                          request: SingleJrpcRequest) -> Optional[SingleJrpcResponse]:
+                                          request: SingleJrpcRequest,
+                                          refresh: RefreshFunc = None,
+                                          allow_expired: bool = False
+                                          ) -> Optional[SingleJrpcResponse]:
         if request.upstream.ttl == TTL.NO_CACHE:
             return None
-        key = jsonrpc_cache_key(request)
+        key = self.cache_key(request)
 
         # try sync memory cache get first
         cached_response = self._memory_cache.gets(key)
-        if cached_response is not None:
-            return merge_cached_response(request, cached_response)
 
         # try async redis cache get
-        cached_response = await self.get(key)
-        if cached_response is not None:
-            return merge_cached_response(request, cached_response)
-        return None
+        if cached_response is None:
+            cached_response = await self.get(key)
+        cached_response = self.usable_cached_response(request, cached_response,
+                                                      refresh, allow_expired)
+        if cached_response is None and self.derives_responses:
+            cached_response = (await self.derived_responses([request]))[0]
+        if cached_response is None:
+            return None
+        return merge_cached_response(request, cached_response)
 
     async def get_batch_jsonrpc_responses(self,
-                                          requests: BatchJrpcRequest) -> \
+                                          requests: BatchJrpcRequest,
+                                          refresh: RefreshFunc = None,
+                                          allow_expired: bool = False) -> \
             Optional[BatchJrpcResponse]:
-        keys = [jsonrpc_cache_key(request) for request in requests]
+        keys = [self.cache_key(request) for request in requests]
         # try async mget which include sync memory-cache mget
         cached_responses = await self.mget(keys)
+        cached_responses = [self.usable_cached_response(request, cached_response,
+                                                        refresh, allow_expired)
+                            for request, cached_response in zip(requests, cached_responses)]
+        missing = [i for i, cached_response in enumerate(cached_responses)
+                   if cached_response is None]
+        if missing and self.derives_responses:
+            derived = await self.derived_responses([requests[i] for i in missing])
+            for i, cached_response in zip(missing, derived):
+                cached_responses[i] = cached_response
         return merge_cached_responses(requests, cached_responses)
 
+    @property
+    def derives_responses(self) -> bool:
+        return self._derive_block_headers or self._transaction_index is not None
+
+    def derived_source(self, request: SingleJrpcRequest) -> Optional[Tuple[CacheKey, DeriveFunc]]:
+        """the cache key a response can be derived from and how to derive it"""
+        if self._derive_block_headers:
+            key = block_header_source_key(request.urn)
+            if key is not None:
+                return key, block_header_from_block
+        if self._transaction_index is not None:
+            transaction_id = transaction_request_id(request.urn)
+            location = transaction_id and self._transaction_index.get(transaction_id)
+            # only irreversible transactions, a reversible one may yet move
+            if location and self._last_irreversible_block_num and \
+                    location[0] <= self._last_irreversible_block_num:
+                block_num, position = location
+                return block_key(block_num), functools.partial(transaction_from_block,
+                                                               transaction_id=transaction_id,
+                                                               position=position)
+        return None
+
+    async def derived_responses(self, requests: List[SingleJrpcRequest]) -> CacheResults:
+        """answer requests from other cached responses, see cache/derived.py"""
+        sources = [self.derived_source(request) for request in requests]
+        source_keys = [source and source[0] for source in sources]
+        if self._hashed_keys:
+            source_keys = [key and hashed_cache_key(key) for key in source_keys]
+        wanted = list(set(filter(None, source_keys)))
+        if not wanted:
+            return [None for request in requests]
+        cached_sources = dict(zip(wanted, await self.mget(wanted)))
+        results = []
+        for source, key in zip(sources, source_keys):
+            cached_source = cached_sources.get(key)
+            if cached_source is None or cache_entry_state(
+                    cached_source,
+                    head_block_num=self._head_block_num) is not CacheEntryState.FRESH:
+                results.append(None)
+            else:
+                results.append(source[1](cached_source))
+        self.derived_hits += sum(1 for result in results if result is not None)
+        return results
+
+    def index_transactions(self,
+                           request: SingleJrpcRequest,
+                           response: SingleJrpcResponse) -> None:
+        if self._transaction_index is None or canonical_method(request.urn) is not LEGACY_GET_BLOCK:
+            return
+        try:
+            block = response['result']
+            block_num = int(block['block_id'][:8], base=16)
+            self._transaction_index.add_block(block_num, block['transaction_ids'])
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    def usable_cached_response(self,
+                               request: SingleJrpcRequest,
+                               cached_response: CacheResult,
+                               refresh: RefreshFunc = None,
+                               allow_expired: bool = False) -> CacheResult:
+        if cached_response is None:
+            return None
+        if not self.matches_key_fingerprint(request, cached_response):
+            logger.warning('cache key fingerprint mismatch', key=self.cache_key(request))
+            return None
+        # expired entries kept for the error grace period are only
+        # returned when the upstream has failed
+        if allow_expired:
+            return cached_response
+        state = cache_entry_state(cached_response, head_block_num=self._head_block_num)
+        if state is CacheEntryState.FRESH:
+            return cached_response
+        if state is CacheEntryState.STALE and refresh is not None:
+            self.refresh_single_jsonrpc_response(request, refresh)
+            return cached_response
+        return None
+
+    def refresh_single_jsonrpc_response(self,
+                                        request: SingleJrpcRequest,
+                                        refresh: RefreshFunc) -> None:
+        # only one background refresh per key at a time
+        key = self.cache_key(request)
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        asyncio.ensure_future(self._refresh_single_jsonrpc_response(key, request, refresh))
+
+    async def _refresh_single_jsonrpc_response(self,
+                                               key: CacheKey,
+                                               request: SingleJrpcRequest,
+                                               refresh: RefreshFunc) -> None:
+        try:
+            async with timeout(request.upstream.timeout):
+                response = await refresh(request)
+            await self.cache_single_jsonrpc_response(request=request, response=response)
+        except UncacheableResponse:
+            pass
+        except Exception as e:
+            logger.warning('error refreshing stale cache entry', key=key, e=e)
+        finally:
+            self._refreshing.discard(key)
+
     async def cache_single_jsonrpc_response(self,
                                             request: SingleJrpcRequest = None,
                                             response: SingleJrpcResponse = None,
                                             ttl: str = None,
-                                            last_irreversible_block_num: int = None
+                                            last_irreversible_block_num: int = None,
+                                            response_size: int = None
                                             ) -> None:
-        key = jsonrpc_cache_key(request)
+        key = self.cache_key(request)
         ttl = ttl or request.upstream.ttl
+        if ttl == TTL.NO_CACHE:
+            return
+        if self.index_negative_response(request, response):
+            value = to_canonical_response(request.urn, response)
+            await self.set(key, self.fingerprint_value(request, value),
+                           expire_time=self._negative_ttl,
+                           size=response_size)
+            return
+        reversible = False
         if ttl == TTL.NO_EXPIRE_IF_IRREVERSIBLE:
             last_irreversible_block_num = last_irreversible_block_num or \
                 self._memory_cache.gets('last_irreversible_block_num') or \
                 await self.get('last_irreversible_block_num')
 
             ttl = irreversible_ttl(jsonrpc_response=response,
-                                   last_irreversible_block_num=last_irreversible_block_num)
-        elif ttl == TTL.NO_CACHE:
-            return
+                                   last_irreversible_block_num=last_irreversible_block_num,
+                                   jsonrpc_request=request)
+            if ttl == TTL.NO_CACHE:
+                return
+            reversible = ttl == TTL.DEFAULT_TTL and self.is_block_request(request)
         value = self.prepare_response_for_cache(request, response)
-        await self.set(key, value, expire_time=ttl)
+        self.index_transactions(request, response)
+        if reversible:
+            if self._reversible_block_ttl:
+                ttl = self._reversible_block_ttl
+            orphaned = self.index_reversible_block(request, response, value)
+            if orphaned:
+                await self.delete_many(orphaned)
+        value, expire_time = self.cache_entry(request, value, ttl)
+        await self.set(key, self.fingerprint_value(request, value),
+                       expire_time=expire_time,
+                       suppress_redundant=self.suppresses_redundant_writes(ttl),
+                       size=response_size)
 
     async def cache_batch_jsonrpc_response(self,
                                            requests: BatchJrpcRequest = None,
                                            responses: BatchJrpcResponse = None,
-                                           last_irreversible_block_num: int = None) -> None:
+                                           last_irreversible_block_num: int = None,
+                                           response_size: int = None) -> None:
 
         last_irreversible_block_num = last_irreversible_block_num or \
             self._memory_cache.gets('last_irreversible_block_num') or \
             await self.get('last_irreversible_block_num')
 
-        ttls = [r.upstream.ttl for r in requests]
-
-        # common case all TTLs equal, eg batch of get_block reqs
-        if set(ttls) == BATCH_IRREVERSIBLE_TTL_SET:
-            ttls = [irreversible_ttl(resp, last_irreversible_block_num) for resp in responses]
-            triplets = filter(lambda p: p[0] != TTL.NO_CACHE, zip(ttls, requests, responses))
-        else:
-            new_ttls = []
-            for i, ttl in enumerate(ttls):
-                if ttl == TTL.NO_EXPIRE_IF_IRREVERSIBLE:
-                    ttl = irreversible_ttl(responses[i], last_irreversible_block_num)
-                new_ttls.append(ttl)
-            triplets = filter(lambda p: p[0] != TTL.NO_CACHE, zip(ttls, requests, responses))
+        entries = []
+        orphaned = []
+        for request, response in zip(requests, responses):
+            ttl = request.upstream.ttl
+            if ttl == TTL.NO_CACHE:
+                continue
+            if self.index_negative_response(request, response):
+                value = to_canonical_response(request.urn, response)
+                # negative entries mustn't suppress the real response's write
+                entries.append((self._negative_ttl, False, self.cache_key(request),
+                                self.fingerprint_value(request, value)))
+                continue
+            reversible = False
+            if ttl == TTL.NO_EXPIRE_IF_IRREVERSIBLE:
+                ttl = irreversible_ttl(response, last_irreversible_block_num, request)
+                reversible = ttl == TTL.DEFAULT_TTL and self.is_block_request(request)
+            if ttl == TTL.NO_CACHE:
+                continue
+            try:
+                value = self.prepare_response_for_cache(request, response)
+            except UncacheableResponse:
+                continue
+            self.index_transactions(request, response)
+            if reversible:
+                if self._reversible_block_ttl:
+                    ttl = self._reversible_block_ttl
+                orphaned.extend(self.index_reversible_block(request, response, value))
+            value, expire_time = self.cache_entry(request, value, ttl)
+            entries.append((expire_time, self.suppresses_redundant_writes(ttl),
+                            self.cache_key(request), self.fingerprint_value(request, value)))
+
+        written = {key for _, _, key, _ in entries}
+        orphaned = [key for key in orphaned if key not in written]
+        if orphaned:
+            await self.delete_many(orphaned)
+
+        # no response is larger than the whole batch, so only a batch too
+        # large for the memory cache has its responses measured one by one
+        size = None
+        if response_size is not None and self._memory_cache_max_entry_size and \
+                response_size <= self._memory_cache_max_entry_size:
+            size = response_size
 
         futures = []
         # pylint: disable=no-member
-        for ttl, grouped_triplets in cytoolz.groupby(itemgetter(0), triplets).items():
-            if isinstance(ttl, TTL):
-                ttl = ttl.value
-            pairs = {jsonrpc_cache_key(req): resp for ttl, req, resp in grouped_triplets}
-            self._memory_cache.set_manys(pairs, expire_time=ttl)
-            futures.append(self.set_many(pairs, expire_time=ttl))
+        grouped = cytoolz.groupby(itemgetter(0, 1), entries)
+        for (expire_time, suppress_redundant), grouped_entries in grouped.items():
+            pairs = {key: value for _, _, key, value in grouped_entries}
+            futures.append(self.set_many(pairs, expire_time=expire_time,
+                                         suppress_redundant=suppress_redundant,
+                                         size=size))
         if futures:
             await asyncio.gather(*futures, return_exceptions=True)
 
+    def cache_key(self, request: SingleJrpcRequest) -> CacheKey:
+        key = jsonrpc_cache_key(request)
+        if self._hashed_keys:
+            return hashed_cache_key(key)
+        return key
+
+    def fingerprint_value(self, request: SingleJrpcRequest, value: CacheValue) -> CacheValue:
+        key = jsonrpc_cache_key(request)
+        if self._hashed_keys and hashed_cache_key(key) != key:
+            return dict(value, **{KEY_FINGERPRINT_KEY: cache_key_fingerprint(key)})
+        return value
+
+    def matches_key_fingerprint(self,
+                                request: SingleJrpcRequest,
+                                cached_response: CacheValue) -> bool:
+        key = jsonrpc_cache_key(request)
+        if not self._hashed_keys or hashed_cache_key(key) == key:
+            return True
+        return cached_response.get(KEY_FINGERPRINT_KEY) == cache_key_fingerprint(key)
+
+    @staticmethod
+    def suppresses_redundant_writes(ttl: CacheTTL) -> bool:
+        # a rewrite after a new block carries new state however soon it comes
+        return ttl != TTL.EXPIRE_ON_NEW_BLOCK
+
+    def cache_entry(self,
+                    request: SingleJrpcRequest,
+                    value: CacheValue,
+                    ttl: CacheTTL) -> Tuple[CacheValue, CacheTTLValue]:
+        if isinstance(ttl, TTL):
+            ttl = ttl.value
+        if ttl == TTL.EXPIRE_ON_NEW_BLOCK.value:
+            # expiry follows the shared head block, which lags by up to
+            # HEAD_BLOCK_NUM_SYNC_INTERVAL, the time bound is for when nothing
+            # is fetching the head block
+            if self._head_block_num is None:
+                return value, BLOCK_INTERVAL
+            return dict(value, **{HEAD_BLOCK_NUM_KEY: self._head_block_num}), BLOCK_INTERVAL
+        stale_ttl = request.upstream.stale_ttl
+        grace_period = max(stale_ttl, self._error_grace_period)
+        # keep entries with a stale window or error grace period around past their ttl
+        if grace_period and ttl and ttl > 0:
+            return stale_cache_entry(value, ttl, stale_ttl), ttl + grace_period
+        return value, ttl
+
+    def index_negative_response(self,
+                                request: SingleJrpcRequest,
+                                response: SingleJrpcResponse) -> bool:
+        """Track "block does not exist yet" responses which may be cached
+        until the chain head reaches their block"""
+        if not self._negative_ttl or not is_empty_block_response(request, response):
+            return False
+        block_num = block_num_from_jsonrpc_request(request)
+        if block_num is None:
+            return False
+        if self._head_block_num is None:
+            # can't tell a block which doesn't exist yet from a lagging upstream
+            return False
+        if block_num <= self._head_block_num:
+            # the block exists, the upstream is lagging
+            return False
+        self._negative_block_keys.setdefault(block_num, set()).add(self.cache_key(request))
+        if len(self._negative_block_keys) > MAX_NEGATIVE_BLOCK_NUMS:
+            del self._negative_block_keys[min(self._negative_block_keys)]
+        return True
+
+    def index_reversible_block(self,
+                               request: SingleJrpcRequest,
+                               response: SingleJrpcResponse,
+                               value: CacheValue) -> CacheKeys:
+        """index a reversible block entry, returning the keys of entries left on another fork"""
+        if self._reversible_blocks is None:
+            return []
+        block_num = block_num_from_jsonrpc_response(response)
+        if block_num is None:
+            return []
+        block_id, previous = block_linkage_from_jsonrpc_response(response)
+        orphaned = self._reversible_blocks.add(block_num, self.cache_key(request),
+                                               self.fingerprint_value(request, value),
+                                               block_id=block_id,
+                                               previous=previous)
+        if orphaned:
+            logger.info('dropping cached blocks from another fork',
+                        block_num=block_num,
+                        keys=len(orphaned))
+        return orphaned
+
+    async def update_last_irreversible_block_num(self, last_irreversible_block_num: int) -> None:
+        """stop tracking blocks which are now irreversible, promoting confirmed ones if enabled"""
+        self._last_irreversible_block_num = last_irreversible_block_num
+        if self._reversible_blocks is None:
+            return
+        pairs = self._reversible_blocks.pop_irreversible(last_irreversible_block_num)
+        if not pairs or not self._promote_irreversible_blocks:
+            return
+        self._reversible_blocks.promoted += len(pairs)
+        await self.set_many(pairs, expire_time=TTL.NO_EXPIRE)
+        for key in pairs:
+            self._recent_writes.record(key, None)
+
+    def reversible_block_stats(self) -> Optional[dict]:
+        if self._reversible_blocks is not None:
+            return self._reversible_blocks.stats()
+        return None
+
+    async def update_head_block_num(self, head_block_num: int, share: bool = False) -> None:
+        """track the newest head block, sharing it with other workers if it came from upstream"""
+        if self._head_block_num is not None and head_block_num <= self._head_block_num:
+            return
+        self._head_block_num = head_block_num
+        if share:
+            await self.set(SHARED_HEAD_BLOCK_NUM_KEY, head_block_num, expire_time=180)
+        # drop negative entries for blocks which now exist
+        passed = [block_num for block_num in self._negative_block_keys
+                  if block_num <= head_block_num]
+        keys = [key for block_num in passed for key in self._negative_block_keys.pop(block_num)]
+        if keys:
+            await self.delete_many(keys)
+
     # pylint: disable=no-self-use
     def prepare_response_for_cache(self,
                                    request: SingleJrpcRequest,
@@ -250,9 +870,13 @@ class CacheGroup:
                 raise UncacheableResponse(reason='invalid get_block response',
                                           jrpc_request=request,
                                           jrpc_response=response)
-        return response
+        return to_canonical_response(request.urn, response)
     # pylint: enable=no-self-use
 
+    @staticmethod
+    def is_block_request(request: SingleJrpcRequest) -> bool:
+        return is_get_block_request(request) or is_get_block_header_request(request)
+
     @staticmethod
     def is_complete_response(request: JrpcRequest,
                              cached_response: JrpcResponse) -> bool:
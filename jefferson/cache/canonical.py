@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Canonical cache keys
+
+Requests for the same data can arrive in several forms, eg:
+
+    get_block [1000]
+    call ["database_api", "get_block", [1000]]
+    condenser_api.get_block ["1000"]
+
+Equivalent requests whose results have the same shape share one cache key.
+Requests whose results differ only by a wrapper (eg block_api.get_block_header
+returns {"header": {...}}) share a key too, the result is stored in the
+canonical shape and converted when it is read back.
+
+block_api.get_block is not merged with the legacy get_block methods, its
+operations and assets are formatted differently and can't be converted
+without loss.
+"""
+import functools
+import re
+from typing import Any
+from typing import NamedTuple
+from typing import Optional
+
+import ujson
+
+from ..empty import _empty
+from ..urn import URN
+
+
+# block numbers sent as strings, which the upstream parses the same as ints
+BLOCK_NUM_PATTERN = re.compile(r'[0-9]+')
+
+
+class CanonicalMethod(NamedTuple):
+    key_template: str             # formatted with the block_num
+    block_num_key: Optional[str]  # None for positional [block_num] params
+    result_key: Optional[str]     # key wrapping the canonical result, if any
+
+
+LEGACY_GET_BLOCK = CanonicalMethod(
+    'appbase.condenser_api.get_block.params=[{}]', None, None)
+LEGACY_GET_BLOCK_HEADER = CanonicalMethod(
+    'appbase.condenser_api.get_block_header.params=[{}]', None, None)
+
+CANONICAL_METHODS = {
+    ('dpayd', 'database_api', 'get_block'): LEGACY_GET_BLOCK,
+    ('appbase', 'condenser_api', 'get_block'): LEGACY_GET_BLOCK,
+    ('dpayd', 'database_api', 'get_block_header'): LEGACY_GET_BLOCK_HEADER,
+    ('appbase', 'condenser_api', 'get_block_header'): LEGACY_GET_BLOCK_HEADER,
+    ('appbase', 'block_api', 'get_block_header'):
+        CanonicalMethod(LEGACY_GET_BLOCK_HEADER.key_template, 'block_num', 'header'),
+    ('appbase', 'block_api', 'get_block'):
+        CanonicalMethod('appbase.block_api.get_block.params={{"block_num":{}}}',
+                        'block_num', None),
+}
+
+
+def dumps_params(params: Any) -> str:
+    # sort_keys sorts nested dicts too, urn.from_request only sorts the top level
+    return ujson.dumps(params, ensure_ascii=False, sort_keys=True)
+
+
+def canonical_method(urn: URN) -> Optional[CanonicalMethod]:
+    if urn.api is _empty:
+        return None
+    return CANONICAL_METHODS.get((urn.namespace, urn.api, urn.method))
+
+
+def canonical_block_num(urn: URN, method: CanonicalMethod) -> Optional[int]:
+    params = urn.params
+    block_num = None
+    if method.block_num_key is None:
+        if isinstance(params, list) and len(params) == 1:
+            block_num = params[0]
+    elif isinstance(params, dict) and len(params) == 1:
+        block_num = params.get(method.block_num_key)
+    # int() would also make 1 of 1.5, true or " 1", which aren't the same request
+    if isinstance(block_num, bool):
+        return None
+    if isinstance(block_num, int):
+        return block_num
+    if isinstance(block_num, str) and BLOCK_NUM_PATTERN.fullmatch(block_num):
+        return int(block_num)
+    return None
+
+
+@functools.lru_cache(8192)
+def canonical_cache_key(urn: URN) -> str:
+    method = canonical_method(urn)
+    if method:
+        block_num = canonical_block_num(urn, method)
+        if block_num is not None:
+            return method.key_template.format(block_num)
+
+    parts = [urn.namespace, urn.api, urn.method]
+    if urn.params is not _empty:
+        parts.append(f'params={dumps_params(urn.params)}')
+    return '.'.join(str(p) for p in parts if p is not _empty)
+
+
+def to_canonical_result(urn: URN, result: Any) -> Any:
+    method = canonical_method(urn)
+    if not method or not method.result_key:
+        return result
+    if isinstance(result, dict):
+        return result.get(method.result_key)
+    return result
+
+
+def from_canonical_result(urn: URN, result: Any) -> Any:
+    method = canonical_method(urn)
+    if not method or not method.result_key:
+        return result
+    if result is None:
+        # appbase returns an empty object for blocks which don't exist yet
+        return {}
+    return {method.result_key: result}
+
+
+def to_canonical_response(urn: URN, response: dict) -> dict:
+    method = canonical_method(urn)
+    if not method or not method.result_key or 'result' not in response:
+        return response
+    return dict(response, result=to_canonical_result(urn, response['result']))
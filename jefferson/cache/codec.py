@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Binary encoding of cached get_block responses
+
+Most of a legacy get_block result is hex: ids, the merkle root and
+signatures. Stored as JSON, every byte of them takes two characters. This
+codec stores them as raw bytes after the rest of the response as zlib
+compressed JSON, and decodes to a response which serializes to exactly the
+same JSON. zlib already packs hex close to its binary size, so the savings
+are mostly the hex it no longer has to compress, and 10-15% of the bytes.
+
+Responses whose result doesn't have exactly the `GET_BLOCK_RESULT_KEYS`
+fields, or whose hex isn't lowercase and of the expected length, are not
+encoded and callers fall back to plain JSON.
+
+Layout:
+
+    magic (4) | compressed json length (4) | compressed json
+    | previous (20) | transaction_merkle_root (20) | witness_signature (65)
+    | block_id (20) | transaction id count (4) | transaction ids (20 each)
+    | per transaction: signatures position (1) | signature count (1)
+    | signatures (65 each)
+"""
+import struct
+from typing import Any
+from typing import Optional
+from zlib import compress
+
+from ujson import dumps
+from ujson import loads
+
+from ..validators import GET_BLOCK_RESULT_KEYS
+from .zdict import CompressionDictionaries
+from .zdict import decompress_value
+
+# zlib streams start with 0x78, so this can't be mistaken for one
+BLOCK_MAGIC = b'\x00jb1'
+
+# block fields stored in the json part
+BLOCK_JSON_KEYS = ('timestamp', 'witness', 'extensions', 'signing_key')
+
+ID_SIZE = 20
+SIGNATURE_SIZE = 65
+
+# signatures position of a transaction without a signatures list
+NO_SIGNATURES = 255
+
+UINT32 = struct.Struct('>I')
+
+
+def hex_bytes(value: Any, size: int) -> bytes:
+    if not isinstance(value, str) or len(value) != size * 2:
+        raise ValueError('unexpected hex length')
+    raw = bytes.fromhex(value)
+    if raw.hex() != value:
+        raise ValueError('hex is not lowercase')
+    return raw
+
+
+def is_block_response(value: Any) -> bool:
+    return isinstance(value, dict) and isinstance(value.get('result'), dict) and \
+        value['result'].keys() == GET_BLOCK_RESULT_KEYS
+
+
+def encode_block_response(value: Any,
+                          dictionaries: CompressionDictionaries = None) -> Optional[bytes]:
+    """encode a cached get_block response, None if it can't be encoded exactly"""
+    if not is_block_response(value):
+        return None
+    try:
+        return _encode(value, dictionaries)
+    except (ValueError, TypeError, AttributeError, struct.error):
+        return None
+
+
+def _encode(value: dict, dictionaries: CompressionDictionaries = None) -> bytes:
+    block = value['result']
+    transactions = []
+    signature_parts = []
+    for transaction in block['transactions']:
+        keys = list(transaction)
+        signatures = transaction.get('signatures')
+        if isinstance(signatures, list) and len(signatures) < 256:
+            position = keys.index('signatures')
+            signature_parts.append(bytes((position, len(signatures))))
+            signature_parts.extend(hex_bytes(signature, SIGNATURE_SIZE)
+                                   for signature in signatures)
+            transaction = {key: transaction[key] for key in keys if key != 'signatures'}
+        else:
+            signature_parts.append(bytes((NO_SIGNATURES, 0)))
+        transactions.append(transaction)
+    transaction_ids = block['transaction_ids']
+    json = dumps({
+        'keys': list(value),
+        'block_keys': list(block),
+        'value': {key: item for key, item in value.items() if key != 'result'},
+        'block': {key: block[key] for key in BLOCK_JSON_KEYS},
+        'transactions': transactions
+    }, ensure_ascii=False).encode('utf8')
+    json = dictionaries.compress(json) if dictionaries else compress(json)
+    return b''.join([
+        BLOCK_MAGIC,
+        UINT32.pack(len(json)),
+        json,
+        hex_bytes(block['previous'], ID_SIZE),
+        hex_bytes(block['transaction_merkle_root'], ID_SIZE),
+        hex_bytes(block['witness_signature'], SIGNATURE_SIZE),
+        hex_bytes(block['block_id'], ID_SIZE),
+        UINT32.pack(len(transaction_ids)),
+        *[hex_bytes(transaction_id, ID_SIZE) for transaction_id in transaction_ids],
+        *signature_parts
+    ])
+
+
+def decode_block_response(data: bytes,
+                          dictionaries: CompressionDictionaries = None) -> Optional[dict]:
+    """decode an encoded response, None if its dictionary isn't loaded"""
+    buffer = memoryview(data)
+    offset = len(BLOCK_MAGIC)
+
+    def read(size: int) -> bytes:
+        nonlocal offset
+        chunk = buffer[offset:offset + size]
+        offset += size
+        return bytes(chunk)
+
+    def read_hex(size: int) -> str:
+        return read(size).hex()
+
+    json_length, = UINT32.unpack(read(UINT32.size))
+    json = read(json_length)
+    json = decompress_value(json, dictionaries)
+    if json is None:
+        return None
+    parts = loads(json)
+    previous = read_hex(ID_SIZE)
+    transaction_merkle_root = read_hex(ID_SIZE)
+    witness_signature = read_hex(SIGNATURE_SIZE)
+    block_id = read_hex(ID_SIZE)
+    transaction_id_count, = UINT32.unpack(read(UINT32.size))
+    transaction_ids = [read_hex(ID_SIZE) for _ in range(transaction_id_count)]
+    transactions = []
+    for transaction in parts['transactions']:
+        position, signature_count = read(2)
+        if position != NO_SIGNATURES:
+            signatures = [read_hex(SIGNATURE_SIZE) for _ in range(signature_count)]
+            items = list(transaction.items())
+            items.insert(position, ('signatures', signatures))
+            transaction = dict(items)
+        transactions.append(transaction)
+
+    fields = dict(parts['block'],
+                  previous=previous,
+                  transaction_merkle_root=transaction_merkle_root,
+                  witness_signature=witness_signature,
+                  transactions=transactions,
+                  block_id=block_id,
+                  transaction_ids=transaction_ids)
+    block = {key: fields[key] for key in parts['block_keys']}
+    other = parts['value']
+    return {key: block if key == 'result' else other[key] for key in parts['keys']}
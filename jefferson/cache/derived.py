@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Responses derived from other cached responses
+
+A cached legacy get_block result holds every field of its block header, so
+a get_block_header request which misses the cache can be answered from the
+cached block with the same block number. block_api.get_block_header shares
+the legacy header cache key and is answered the same way. block_api.get_block
+results are not used, their formatting differs from the legacy methods.
+
+Legacy get_transaction requests are answered from the cached block a
+transaction index says holds the transaction.
+"""
+from typing import Any
+from typing import Optional
+
+from ..empty import _empty
+from ..urn import URN
+from .canonical import LEGACY_GET_BLOCK
+from .canonical import LEGACY_GET_BLOCK_HEADER
+from .canonical import canonical_block_num
+from .canonical import canonical_method
+
+# in the order dpayd serializes them
+BLOCK_HEADER_KEYS = ('previous', 'timestamp', 'witness', 'transaction_merkle_root', 'extensions')
+
+LEGACY_GET_TRANSACTION_METHODS = {
+    ('dpayd', 'database_api', 'get_transaction'),
+    ('appbase', 'condenser_api', 'get_transaction'),
+}
+
+
+def block_key(block_num: int) -> str:
+    return LEGACY_GET_BLOCK.key_template.format(block_num)
+
+
+def block_header_source_key(urn: URN) -> Optional[str]:
+    """cache key of the full block a header request can be derived from"""
+    method = canonical_method(urn)
+    if method is None or method.key_template != LEGACY_GET_BLOCK_HEADER.key_template:
+        return None
+    block_num = canonical_block_num(urn, method)
+    if block_num is None:
+        return None
+    return block_key(block_num)
+
+
+def block_header_from_block(cached_block: Any) -> Optional[dict]:
+    """a cached header response projected from a cached block response"""
+    try:
+        block = cached_block['result']
+        return {'result': {key: block[key] for key in BLOCK_HEADER_KEYS}}
+    except (KeyError, TypeError):
+        return None
+
+
+def transaction_request_id(urn: URN) -> Optional[str]:
+    """transaction id of a legacy get_transaction request"""
+    if urn.api is _empty or \
+            (urn.namespace, urn.api, urn.method) not in LEGACY_GET_TRANSACTION_METHODS:
+        return None
+    params = urn.params
+    if isinstance(params, list) and len(params) == 1 and isinstance(params[0], str):
+        return params[0]
+    return None
+
+
+def transaction_from_block(cached_block: Any,
+                           transaction_id: str,
+                           position: int) -> Optional[dict]:
+    """a cached get_transaction response built from a cached block response"""
+    try:
+        block = cached_block['result']
+        # the index may point at a block since replaced by another fork
+        if block['transaction_ids'][position] != transaction_id:
+            return None
+        transaction = block['transactions'][position]
+        block_num = int(block['block_id'][:8], base=16)
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+    return {'result': dict(transaction,
+                           transaction_id=transaction_id,
+                           block_num=block_num,
+                           transaction_num=position)}
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from collections import OrderedDict
+from time import perf_counter
+from typing import Any
+from typing import List
+from typing import Optional
+
+import structlog
+
+from .backends.redis import CacheKey
+from .probabilistic import BloomFilter
+
+logger = structlog.get_logger(__name__)
+
+DEFAULT_ERROR_RATE = 0.01
+DEFAULT_SYNC_INTERVAL = 30
+DEFAULT_MAX_MISSES = 10000
+
+# stop skipping reads once the filter is this much worse than configured
+MAX_ERROR_RATE_FACTOR = 10
+
+
+class KeyFilter:
+    """bloom filter of the keys written to redis
+
+    Workers add the keys they write and periodically OR their filter into
+    the copy shared in redis, which redis merges atomically, and take the
+    merged filter back. A key missing from the filter may still be in
+    redis, written by another worker since the last sync or before the
+    filter existed, so the filter never answers for a key on its own: reads
+    fall through to redis, and only a key redis has already missed, which
+    no worker has written since, skips redis until the next `sync_interval`
+    has passed. Entries are never removed, so expired keys are still
+    reported as present and a filter filled past its capacity stops
+    skipping reads.
+    """
+
+    def __init__(self,
+                 capacity: int,
+                 error_rate: float = DEFAULT_ERROR_RATE,
+                 sync_interval: float = DEFAULT_SYNC_INTERVAL,
+                 max_misses: int = DEFAULT_MAX_MISSES) -> None:
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.max_misses = max_misses
+        self.ready = False
+        self.saturated = False
+        self.checked = 0
+        self.skipped = 0
+        self.syncs = 0
+        self.failed_syncs = 0
+        # keys added while a sync waits on redis, missing from the merged bits
+        self._added_during_sync = None  # type: List[CacheKey]
+        # keys redis missed, and when
+        self._misses = OrderedDict()
+
+    @property
+    def redis_key(self) -> CacheKey:
+        # filters of different shapes can't be merged, so they don't share a key
+        return f'jefferson.key_filter.bits.m={self.bloom.size}.k={self.bloom.hashes}'
+
+    def add(self, key: CacheKey) -> None:
+        self.bloom.add(key)
+        self._misses.pop(key, None)
+        if self._added_during_sync is not None:
+            self._added_during_sync.append(key)
+
+    def may_contain(self, key: CacheKey, now: Optional[float] = None) -> bool:
+        if not self.ready or self.saturated:
+            return True
+        self.checked += 1
+        if key in self.bloom:
+            return True
+        missed_at = self._misses.get(key)
+        if missed_at is None:
+            return True
+        if (now or perf_counter()) - missed_at >= self.sync_interval:
+            # another worker may have written it since, ask redis again
+            del self._misses[key]
+            return True
+        self.skipped += 1
+        return False
+
+    def record_miss(self, key: CacheKey, now: Optional[float] = None) -> None:
+        if not self.ready or key in self.bloom:
+            return
+        self._misses[key] = now or perf_counter()
+        self._misses.move_to_end(key)
+        if len(self._misses) > self.max_misses:
+            self._misses.popitem(last=False)
+
+    async def sync(self, cache: Any) -> None:
+        self._added_during_sync = []
+        try:
+            merged = await cache.merge_bits(self.redis_key, self.bloom.to_bytes())
+            self.bloom.load(merged)
+            for key in self._added_during_sync:
+                self.bloom.add(key)
+        finally:
+            self._added_during_sync = None
+        self.saturated = self.bloom.false_positive_rate() > \
+            self.error_rate * MAX_ERROR_RATE_FACTOR
+        if self.saturated:
+            logger.warning('key filter saturated, no longer skipping reads',
+                           false_positive_rate=self.bloom.false_positive_rate())
+        self.ready = True
+        self.syncs += 1
+
+    async def sync_forever(self, cache: Any) -> None:
+        while True:
+            try:
+                await self.sync(cache)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed_syncs += 1
+                logger.warning('key filter sync failed', e=e)
+            await asyncio.sleep(self.sync_interval)
+
+    def stats(self) -> dict:
+        return {
+            'ready': self.ready,
+            'saturated': self.saturated,
+            'checked': self.checked,
+            'skipped': self.skipped,
+            'skip_rate': round(self.skipped / self.checked, 4) if self.checked else 0,
+            'syncs': self.syncs,
+            'failed_syncs': self.failed_syncs
+        }
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from time import perf_counter as perf
+
+# weight of the newest sample in the moving average
+DEFAULT_EWMA_DECAY = 0.3
+
+# seconds without reads in which a cache's average halves
+DEFAULT_IDLE_HALF_LIFE = 5.0
+
+# failed reads count as this many seconds so traffic shifts away from them
+ERROR_LATENCY_PENALTY = 1.0
+
+# reads slower than the average by this many mean deviations are unusually slow
+SLOW_READ_DEVIATIONS = 4
+
+
+class LatencyTracker:
+    """tracks a cache's moving average read latency and outstanding reads
+
+    Caches are ranked by `score`, the average latency scaled by the number
+    of reads already waiting on it. A cache with no samples scores 0 so it
+    is tried before the others. The moving mean deviation gives a bound on
+    normal read latency, as with TCP retransmission timeouts.
+
+    A cache ranked last gets no reads, so nothing would update its average
+    once it recovers. The average halves every `idle_half_life` seconds
+    without a read until the cache is tried again and remeasured.
+    """
+    __slots__ = ('name', 'decay', 'idle_half_life', 'ewma', 'deviation', 'updated_at',
+                 'outstanding', 'requests', 'errors')
+
+    def __init__(self,
+                 name: str,
+                 decay: float = DEFAULT_EWMA_DECAY,
+                 idle_half_life: float = DEFAULT_IDLE_HALF_LIFE) -> None:
+        self.name = name
+        self.decay = decay
+        self.idle_half_life = idle_half_life
+        self.ewma = 0.0
+        self.updated_at = 0.0
+        self.deviation = 0.0
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+
+    def idle_ewma(self, now: float) -> float:
+        if not self.idle_half_life or not self.ewma:
+            return self.ewma
+        return self.ewma * 0.5 ** ((now - self.updated_at) / self.idle_half_life)
+
+    def score(self, now: float = None) -> float:
+        return self.idle_ewma(now or perf()) * (self.outstanding + 1)
+
+    def start(self) -> float:
+        self.outstanding += 1
+        return perf()
+
+    def finish(self, start: float, error: bool = False) -> None:
+        self.outstanding -= 1
+        self.requests += 1
+        now = perf()
+        elapsed = now - start
+        if error:
+            self.errors += 1
+            elapsed = max(elapsed, ERROR_LATENCY_PENALTY)
+        if self.requests == 1:
+            self.ewma = elapsed
+            self.deviation = elapsed / 2
+        else:
+            ewma = self.idle_ewma(now)
+            self.deviation += self.decay * (abs(elapsed - ewma) - self.deviation)
+            self.ewma = ewma + self.decay * (elapsed - ewma)
+        self.updated_at = now
+
+    def slow_read_threshold(self) -> float:
+        return self.ewma + SLOW_READ_DEVIATIONS * self.deviation
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'ewma_ms': round(self.ewma * 1000, 3),
+            'deviation_ms': round(self.deviation * 1000, 3),
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'errors': self.errors
+        }
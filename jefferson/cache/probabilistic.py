@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import math
+from typing import Hashable
+from typing import List
+
+# odd 32 bit multipliers, one per sketch row
+ROW_SEEDS = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F)
+
+MAX_COUNT = 15
+
+# set bits of each byte value
+BIT_COUNTS = bytes(bin(i).count('1') for i in range(256))
+
+
+class FrequencySketch:
+    """approximate recent access counts of keys (TinyLFU)
+
+    A count-min sketch with small saturating counters. After `10 * capacity`
+    recorded accesses every counter is halved, so popularity from long ago
+    fades and keys can become cold again.
+    """
+
+    def __init__(self, capacity: int, depth: int = len(ROW_SEEDS)) -> None:
+        width = 1
+        while width < capacity * 4:
+            width <<= 1
+        self._mask = width - 1
+        self._seeds = ROW_SEEDS[:depth]
+        self._rows = [bytearray(width) for _ in self._seeds]
+        self._sample_size = 10 * capacity
+        self._additions = 0
+
+    def _indexes(self, key: Hashable):
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        mask = self._mask
+        return [((h * seed) >> 32) & mask for seed in self._seeds]
+
+    def increment(self, key: Hashable) -> None:
+        for row, index in zip(self._rows, self._indexes(key)):
+            if row[index] < MAX_COUNT:
+                row[index] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self.reset()
+
+    def frequency(self, key: Hashable) -> int:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+    def admit(self, candidate: Hashable, victim: Hashable) -> bool:
+        """should candidate replace victim in a full cache"""
+        return self.frequency(candidate) > self.frequency(victim)
+
+    def reset(self) -> None:
+        self._rows = [bytearray(count >> 1 for count in row) for row in self._rows]
+        self._additions //= 2
+
+
+class BloomFilter:
+    """approximate set membership with no false negatives
+
+    Sized for `capacity` keys at `error_rate` false positives. Bit positions
+    come from blake2b, not hash(), so filters built by different processes
+    can be merged.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.size = bits + (-bits % 8)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray(self.size // 8)
+
+    def _positions(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str) -> None:
+        bits = self._bits
+        for position in self._positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+    def update(self, other: bytes) -> None:
+        """merge in the bits of another filter with the same parameters"""
+        if len(other) != len(self._bits):
+            raise ValueError('bloom filter sizes differ')
+        merged = int.from_bytes(self._bits, 'little') | int.from_bytes(other, 'little')
+        self._bits = bytearray(merged.to_bytes(len(self._bits), 'little'))
+
+    def load(self, data: bytes) -> None:
+        """replace the bits with those of a filter with the same parameters"""
+        if len(data) != len(self._bits):
+            raise ValueError('bloom filter sizes differ')
+        self._bits = bytearray(data)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._bits)
+
+    def fill_ratio(self) -> float:
+        counts = self._bits.translate(BIT_COUNTS)
+        return sum(bits * counts.count(bits) for bits in range(1, 9)) / self.size
+
+    def false_positive_rate(self) -> float:
+        return self.fill_ratio() ** self.hashes
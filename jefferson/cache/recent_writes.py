@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from time import perf_counter
+from typing import Optional
+
+from .backends.redis import CacheKey
+from .backends.redis import CacheTTLValue
+
+DEFAULT_MAX_KEYS = 10000
+
+# the same key written again this soon is assumed to be the same response
+DEFAULT_MIN_REWRITE_INTERVAL = 1.0
+
+# redis may evict or lose a key without this worker knowing, so a record is
+# only trusted for so long, however long the entry was written to live
+DEFAULT_MAX_RECORD_AGE = 300.0
+
+NO_EXPIRY = float('inf')
+
+
+class RecentWrites:
+    """remembers which keys this worker wrote to redis and until when they live
+
+    A write is redundant when the key is already stored at least as long as
+    the new write would store it, or when it was written moments ago. Records
+    lapse after `max_record_age`, so even entries stored without expiry are
+    written again now and then.
+    """
+
+    def __init__(self,
+                 max_keys: int = DEFAULT_MAX_KEYS,
+                 min_rewrite_interval: float = DEFAULT_MIN_REWRITE_INTERVAL,
+                 max_record_age: float = DEFAULT_MAX_RECORD_AGE) -> None:
+        self.max_keys = max_keys
+        self.min_rewrite_interval = min_rewrite_interval
+        self.max_record_age = max_record_age
+        self.suppressed = 0
+        self._writes = OrderedDict()
+
+    def is_redundant(self, key: CacheKey, expire_time: CacheTTLValue,
+                     now: Optional[float] = None) -> bool:
+        write = self._writes.get(key)
+        if write is None:
+            return False
+        now = now or perf_counter()
+        written_at, expires_at = write
+        if now >= min(expires_at, written_at + self.max_record_age):
+            del self._writes[key]
+            return False
+        new_expires_at = NO_EXPIRY if expire_time is None else now + expire_time
+        # don't let a rewrite window outlast short lived entries
+        rewrite_interval = min(self.min_rewrite_interval, (expires_at - written_at) / 2)
+        if expires_at >= new_expires_at or now - written_at < rewrite_interval:
+            self.suppressed += 1
+            return True
+        return False
+
+    def record(self, key: CacheKey, expire_time: CacheTTLValue,
+               now: Optional[float] = None) -> None:
+        now = now or perf_counter()
+        expires_at = NO_EXPIRY if expire_time is None else now + expire_time
+        self._writes[key] = (now, expires_at)
+        self._writes.move_to_end(key)
+        if len(self._writes) > self.max_keys:
+            self._writes.popitem(last=False)
+
+    def discard(self, key: CacheKey) -> None:
+        self._writes.pop(key, None)
+
+    def clear(self) -> None:
+        self._writes.clear()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from typing import Optional
+
+from .backends.redis import CacheKey
+from .backends.redis import CacheKeys
+from .backends.redis import CachePairs
+
+# LIB normally trails the head block by a few dozen blocks
+DEFAULT_MAX_BLOCKS = 200
+
+
+class ReversibleBlocks:
+    """cached values of block responses above the last irreversible block
+
+    Reversible blocks are cached with a short ttl. Their values are kept
+    here by block number so that, once the last irreversible block passes
+    them, they can be stored again without expiry and without another
+    upstream request. Only the newest `max_blocks` block numbers are kept.
+
+    The `block_id` and `previous` of each block are kept too. A block whose
+    linkage disagrees with a newer response for the same or a neighbouring
+    block number is on an abandoned fork, and its entries are dropped and
+    returned so they can be deleted from the cache. Blocks passed by the
+    last irreversible block are only handed out for promotion when the next
+    block's `previous` confirms their `block_id`, the entries of the rest
+    expire as usual.
+    """
+
+    def __init__(self, max_blocks: int = DEFAULT_MAX_BLOCKS) -> None:
+        self.max_blocks = max_blocks
+        self.promoted = 0
+        self.orphaned = 0
+        self._blocks = {}
+        self._linkage = {}
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    def add(self,
+            block_num: int,
+            key: CacheKey,
+            value,
+            block_id: Optional[str] = None,
+            previous: Optional[str] = None) -> CacheKeys:
+        """index a block's entry, returning the keys of entries it shows are orphaned"""
+        known_id, known_previous = self._linkage.get(block_num, (None, None))
+        orphaned = []
+        if conflicts(known_id, block_id) or conflicts(known_previous, previous):
+            orphaned.extend(self._drop(block_num))
+            known_id, known_previous = None, None
+        if conflicts(self._linkage.get(block_num - 1, (None, None))[0], previous):
+            orphaned.extend(self._drop(block_num - 1))
+        if conflicts(self._linkage.get(block_num + 1, (None, None))[1], block_id):
+            orphaned.extend(self._drop(block_num + 1))
+
+        self._blocks.setdefault(block_num, {})[key] = value
+        self._linkage[block_num] = (block_id or known_id, previous or known_previous)
+        while len(self._linkage) > self.max_blocks:
+            oldest = min(self._linkage)
+            del self._linkage[oldest]
+            self._blocks.pop(oldest, None)
+
+        orphaned = [orphaned_key for orphaned_key in orphaned if orphaned_key != key]
+        self.orphaned += len(orphaned)
+        return orphaned
+
+    def _drop(self, block_num: int) -> CacheKeys:
+        self._linkage.pop(block_num, None)
+        return list(self._blocks.pop(block_num, {}))
+
+    def pop_irreversible(self, last_irreversible_block_num: int) -> CachePairs:
+        passed = sorted(block_num for block_num in self._blocks
+                        if block_num <= last_irreversible_block_num)
+        pairs = {}
+        for block_num in passed:
+            entries = self._blocks.pop(block_num)
+            if self._confirmed(block_num):
+                pairs.update(entries)
+        return pairs
+
+    def _confirmed(self, block_num: int) -> bool:
+        block_id = self._linkage.get(block_num, (None, None))[0]
+        successor_previous = self._linkage.get(block_num + 1, (None, None))[1]
+        return block_id is not None and block_id == successor_previous
+
+    def stats(self) -> dict:
+        return {
+            'blocks': len(self._blocks),
+            'promoted': self.promoted,
+            'orphaned': self.orphaned
+        }
+
+
+def conflicts(known: Optional[str], seen: Optional[str]) -> bool:
+    return known is not None and seen is not None and known != seen
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+DEFAULT_MAX_TRANSACTIONS = 100000
+
+
+class TransactionIndex:
+    """transaction ids of cached blocks, mapped to (block_num, position)
+
+    Filled as legacy get_block responses are cached, oldest entries are
+    evicted first. An entry only says where a transaction was seen; the
+    block is read back and checked before the transaction is served.
+    """
+
+    def __init__(self, max_transactions: int = DEFAULT_MAX_TRANSACTIONS) -> None:
+        self.max_transactions = max_transactions
+        self._transactions = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._transactions)
+
+    def add_block(self, block_num: int, transaction_ids: List[str]) -> None:
+        for position, transaction_id in enumerate(transaction_ids):
+            self._transactions[transaction_id] = (block_num, position)
+            self._transactions.move_to_end(transaction_id)
+        while len(self._transactions) > self.max_transactions:
+            self._transactions.popitem(last=False)
+
+    def get(self, transaction_id: str) -> Optional[Tuple[int, int]]:
+        return self._transactions.get(transaction_id)
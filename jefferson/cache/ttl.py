@@ -9,10 +9,13 @@ Method Settings
   - A TTL of `0` won't expire
   - A TTL of `-1` wont be cached
   - A TTL of `-2` will be cached without expiration only if it is 'irreversible' in terms of blockchain consesus
+  - A TTL of `-3` will be cached until the head block advances, for state which only changes
+    when a block is applied
 - For readabilty/writabilty, there are shorthand variables for these 'special' TTL values:
    - `NO_EXPIRE` == 0
    - `NO_CACHE` == -1
    - `NO_EXPIRE_IF_IRREVERSIBLE` == -2
+   - `EXPIRE_ON_NEW_BLOCK` == -3
 
 """
 
@@ -24,6 +27,7 @@ class TTL(Enum):
     NO_EXPIRE = None
     NO_CACHE = -1
     NO_EXPIRE_IF_IRREVERSIBLE = -2
+    EXPIRE_ON_NEW_BLOCK = -3
 
     # pylint: disable=no-else-return
     def __eq__(self, other: int) -> bool:
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 import functools
+import hashlib
+import time
+from enum import Enum
 from typing import Optional
+from typing import Tuple
 
 import cytoolz
 import structlog
@@ -10,18 +14,65 @@ from ..typedefs import CachedBatchResponse
 from ..typedefs import CachedSingleResponse
 from ..typedefs import SingleJrpcRequest
 from ..typedefs import SingleJrpcResponse
+from .block_nums import BLOCK_NUM_EXTRACTORS
+from .canonical import canonical_cache_key
+from .canonical import from_canonical_result
 from .ttl import TTL
 
 logger = structlog.get_logger(__name__)
 
+# cached responses which may outlive their ttl carry wall-clock
+# timestamps so every worker agrees on when they expire
+FRESH_UNTIL_KEY = 'fresh_until'
+STALE_UNTIL_KEY = 'stale_until'
+
+# entries cached until the next block carry the head block they were fetched at
+HEAD_BLOCK_NUM_KEY = 'head_block_num'
+
+# seconds between blocks, the longest a block aligned entry can be fresh
+BLOCK_INTERVAL = 3
+
+# values stored under hashed keys carry a fingerprint of the full key
+KEY_FINGERPRINT_KEY = 'key_fingerprint'
+
+# params shorter than a digest are left readable in hashed keys
+HASHED_KEY_MIN_PARAMS_LENGTH = 32
+
+
+class CacheEntryState(Enum):
+    FRESH = 1
+    STALE = 2
+    EXPIRED = 3
+
 
 @functools.lru_cache(8192)
 def jsonrpc_cache_key(single_jsonrpc_request: SingleJrpcRequest) -> str:
-    return str(single_jsonrpc_request.urn)
+    return canonical_cache_key(single_jsonrpc_request.urn)
+
+
+@functools.lru_cache(8192)
+def hashed_cache_key(cache_key: str) -> str:
+    """replace long params in a cache key with a 128 bit digest, eg:
+
+    appbase.condenser_api.get_discussions_by_trending.h=2f1c...
+    """
+    prefix, separator, params = cache_key.partition('.params=')
+    if not separator or len(params) <= HASHED_KEY_MIN_PARAMS_LENGTH:
+        return cache_key
+    digest = hashlib.blake2b(params.encode(), digest_size=16).hexdigest()
+    return f'{prefix}.h={digest}'
+
+
+@functools.lru_cache(8192)
+def cache_key_fingerprint(cache_key: str) -> str:
+    # independent of the key digest so a digest collision is detected on read
+    return hashlib.blake2b(cache_key.encode(), digest_size=8,
+                           person=b'key-fingerprint').hexdigest()
 
 
 def irreversible_ttl(jsonrpc_response: dict=None,
-                     last_irreversible_block_num: int=None) -> TTL:
+                     last_irreversible_block_num: int=None,
+                     jsonrpc_request: SingleJrpcRequest=None) -> TTL:
     if not jsonrpc_response:
         return TTL.NO_CACHE
     if not isinstance(last_irreversible_block_num, int):
@@ -29,7 +80,10 @@ def irreversible_ttl(jsonrpc_response: dict=None,
                      lirb=last_irreversible_block_num)
         return TTL.NO_CACHE
     try:
-        jrpc_block_num = block_num_from_jsonrpc_response(jsonrpc_response)
+        if jsonrpc_request is None:
+            jrpc_block_num = block_num_from_jsonrpc_response(jsonrpc_response)
+        else:
+            jrpc_block_num = response_block_num(jsonrpc_request, jsonrpc_response)
         if jrpc_block_num and jrpc_block_num <= last_irreversible_block_num:
             return TTL.NO_EXPIRE
         return TTL.DEFAULT_TTL
@@ -41,6 +95,32 @@ def irreversible_ttl(jsonrpc_response: dict=None,
     return TTL.NO_CACHE
 
 
+def response_block_num(jsonrpc_request: SingleJrpcRequest,
+                       jsonrpc_response: SingleJrpcResponse) -> Optional[int]:
+    """highest block number a response depends on, None if unknown"""
+    urn = jsonrpc_request.urn
+    extractor = BLOCK_NUM_EXTRACTORS.get((urn.api, urn.method))
+    if extractor is None:
+        return block_num_from_jsonrpc_response(jsonrpc_response)
+    try:
+        return extractor(jsonrpc_request.urn.params, jsonrpc_response['result'])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+def block_num_from_jsonrpc_request(
+        jsonrpc_request: SingleJrpcRequest=None) -> Optional[int]:
+    params = jsonrpc_request.urn.params
+    try:
+        if isinstance(params, list):
+            return int(params[0])
+        if isinstance(params, dict):
+            return int(params['block_num'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        pass
+    return None
+
+
 def block_num_from_jsonrpc_response(
         jsonrpc_response: dict=None) -> Optional[int]:
     # pylint: disable=no-member
@@ -69,12 +149,50 @@ def block_num_from_jsonrpc_response(
     return None
 
 
+def block_linkage_from_jsonrpc_response(
+        jsonrpc_response: dict=None) -> Tuple[Optional[str], Optional[str]]:
+    """the block_id and previous block_id of a get_block or get_block_header response"""
+    # pylint: disable=no-member
+    get_in = cytoolz.get_in
+    for path in (['result', 'block'], ['result', 'header'], ['result']):
+        block = get_in(path, jsonrpc_response)
+        if isinstance(block, dict) and block.get('previous'):
+            return block.get('block_id'), block['previous']
+    return None, None
+
+
+def stale_cache_entry(value: dict, ttl: int, stale_ttl: int, now: float=None) -> dict:
+    now = now or time.time()
+    fresh_until = now + ttl
+    return dict(value, **{FRESH_UNTIL_KEY: fresh_until,
+                          STALE_UNTIL_KEY: fresh_until + stale_ttl})
+
+
+def cache_entry_state(cached_response: dict, now: float=None,
+                      head_block_num: int=None) -> CacheEntryState:
+    if head_block_num is not None and isinstance(cached_response, dict) and \
+            cached_response.get(HEAD_BLOCK_NUM_KEY, head_block_num) < head_block_num:
+        return CacheEntryState.EXPIRED
+    try:
+        fresh_until = cached_response[FRESH_UNTIL_KEY]
+    except (KeyError, TypeError):
+        return CacheEntryState.FRESH
+    now = now or time.time()
+    if now < fresh_until:
+        return CacheEntryState.FRESH
+    if now < cached_response.get(STALE_UNTIL_KEY, fresh_until):
+        return CacheEntryState.STALE
+    return CacheEntryState.EXPIRED
+
+
 def merge_cached_response(request: SingleJrpcRequest,
                           cached_response: CachedSingleResponse,
                           ) -> Optional[SingleJrpcResponse]:
     if not cached_response:
         return None
-    return {'id': request.id, 'jsonrpc': '2.0', 'result': cached_response['result']}
+    return {'id': request.id,
+            'jsonrpc': '2.0',
+            'result': from_canonical_result(request.urn, cached_response['result'])}
 
 
 def merge_cached_responses(request: BatchJrpcRequest,
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""Compression dictionaries for cached block responses
+
+zlib compresses each cached value on its own, so the key names, witness
+names and operation types repeated in every block are paid for again in
+every value. A preset dictionary (zlib's `zdict`) built from sample blocks
+lets each value refer back to them instead.
+
+Dictionaries are trained offline with `contrib/train_zdict.py`, stored in
+redis without expiry under their version, and the current version is
+loaded by every worker at startup. Values compressed with a dictionary
+start with `ZDICT_MAGIC` and the dictionary version, values compressed
+with a version a worker hasn't loaded, or by any dictionary on a worker
+without dictionaries, read as cache misses.
+
+Workers never reload the current version. Storing a new dictionary takes
+effect as workers restart, and until all have, each side's block values
+are misses for the other, counted in `unknown_versions`. Old dictionaries
+are kept in redis so a rollback can load them again.
+"""
+import re
+from base64 import b64decode
+from base64 import b64encode
+from collections import Counter
+from hashlib import blake2b
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from zlib import compress
+from zlib import compressobj
+from zlib import decompress
+from zlib import decompressobj
+
+import structlog
+
+from ..validators import GET_BLOCK_RESULT_KEYS
+from .derived import BLOCK_HEADER_KEYS
+
+logger = structlog.get_logger(__name__)
+
+# zlib streams start with 0x78, so this can't be mistaken for one
+ZDICT_MAGIC = b'\x00jz1'
+VERSION_SIZE = 4
+
+CURRENT_VERSION_KEY = 'jefferson.zdict.current'
+
+# zlib can't refer back further than its 32KB window
+DEFAULT_DICTIONARY_SIZE = 32 * 1024
+
+BLOCK_HEADER_RESULT_KEYS = set(BLOCK_HEADER_KEYS)
+BLOCK_API_RESULT_KEYS = ({'block'}, {'header'}, {'blocks'})
+
+# strings, numbers and runs of punctuation of a JSON document
+JSON_TOKEN_PATTERN = re.compile(rb'"(?:[^"\\]|\\.)*"|-?[0-9.]+|[^"0-9.\-]+')
+# long hex strings are ids and signatures, never worth keeping
+HEX_TOKEN_PATTERN = re.compile(rb'^"[0-9a-f]{16,}"$')
+MAX_NGRAM_TOKENS = 4
+
+
+def dictionary_key(version: str) -> str:
+    return f'jefferson.zdict.{version}'
+
+
+def dictionary_version(data: bytes) -> str:
+    return blake2b(data, digest_size=VERSION_SIZE).hexdigest()
+
+
+def is_block_family(value: Any) -> bool:
+    """get_block, get_block_header and get_ops_in_block responses, legacy and appbase"""
+    result = value.get('result') if isinstance(value, dict) else None
+    if isinstance(result, dict):
+        keys = result.keys()
+        return keys == GET_BLOCK_RESULT_KEYS or keys == BLOCK_HEADER_RESULT_KEYS or \
+            keys in BLOCK_API_RESULT_KEYS
+    if isinstance(result, list) and result and isinstance(result[0], dict):
+        return 'trx_id' in result[0] and 'op' in result[0]
+    return False
+
+
+class CompressionDictionary:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.version = dictionary_version(data)
+        self.header = ZDICT_MAGIC + bytes.fromhex(self.version)
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = compressobj(zdict=self.data)
+        return self.header + compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        decompressor = decompressobj(zdict=self.data)
+        return decompressor.decompress(data[len(self.header):]) + decompressor.flush()
+
+
+class CompressionDictionaries:
+    """the dictionaries a worker can read, and the one it compresses with
+
+    One instance is shared by all of a worker's redis caches.
+    """
+
+    def __init__(self) -> None:
+        self.current = None
+        self._dictionaries = {}  # type: Dict[str, CompressionDictionary]
+        self.unknown_versions = 0
+
+    def add(self, dictionary: CompressionDictionary) -> None:
+        self._dictionaries[dictionary.version] = dictionary
+        self.current = dictionary
+
+    def compress(self, data: bytes) -> bytes:
+        if self.current is None:
+            return compress(data)
+        return self.current.compress(data)
+
+    def decompress(self, data: bytes) -> Optional[bytes]:
+        """None for data compressed with a dictionary which isn't loaded"""
+        if not data.startswith(ZDICT_MAGIC):
+            return decompress(data)
+        version = data[len(ZDICT_MAGIC):len(ZDICT_MAGIC) + VERSION_SIZE].hex()
+        dictionary = self._dictionaries.get(version)
+        if dictionary is None:
+            self.unknown_versions += 1
+            return None
+        return dictionary.decompress(data)
+
+    async def load(self, cache: Any) -> Optional[CompressionDictionary]:
+        version = await cache.get(CURRENT_VERSION_KEY)
+        if not version:
+            return None
+        if version not in self._dictionaries:
+            data = await cache.get(dictionary_key(version))
+            if not data:
+                logger.warning('compression dictionary missing', version=version)
+                return None
+            self.add(CompressionDictionary(b64decode(data)))
+        self.current = self._dictionaries[version]
+        return self.current
+
+    def stats(self) -> dict:
+        return {
+            'version': self.current.version if self.current else None,
+            'loaded': len(self._dictionaries),
+            'unknown_versions': self.unknown_versions
+        }
+
+
+def decompress_value(data: bytes,
+                     dictionaries: CompressionDictionaries = None) -> Optional[bytes]:
+    """None for data compressed with a dictionary which isn't loaded"""
+    if dictionaries:
+        return dictionaries.decompress(data)
+    if data.startswith(ZDICT_MAGIC):
+        return None
+    return decompress(data)
+
+
+async def store_dictionary(cache: Any, dictionary: CompressionDictionary) -> None:
+    """store a dictionary and make it the one workers load"""
+    await cache.set(dictionary_key(dictionary.version),
+                    b64encode(dictionary.data).decode(),
+                    expire_time=None)
+    await cache.set(CURRENT_VERSION_KEY, dictionary.version, expire_time=None)
+
+
+def train_dictionary(samples: List[bytes],
+                     size: int = DEFAULT_DICTIONARY_SIZE,
+                     min_samples: int = 2) -> bytes:
+    """build a dictionary from the token sequences most samples share
+
+    Runs of up to `MAX_NGRAM_TOKENS` JSON tokens are scored by the number
+    of samples they appear in times their length. The best are placed at
+    the end of the dictionary, where they are cheapest to refer to.
+    """
+    counts = Counter()
+    for sample in samples:
+        tokens = JSON_TOKEN_PATTERN.findall(sample)
+        ngrams = set()
+        for n in range(1, MAX_NGRAM_TOKENS + 1):
+            for i in range(len(tokens) - n + 1):
+                ngram = tokens[i:i + n]
+                if any(HEX_TOKEN_PATTERN.match(token) for token in ngram):
+                    continue
+                ngrams.add(b''.join(ngram))
+        counts.update(ngrams)
+
+    candidates = sorted(((count * len(ngram), ngram) for ngram, count in counts.items()
+                         if count >= min_samples and len(ngram) > 3),
+                        reverse=True)
+    chosen = []
+    used = 0
+    for _, ngram in candidates:
+        if used + len(ngram) > size:
+            continue
+        if any(ngram in kept for kept in chosen):
+            continue
+        chosen.append(ngram)
+        used += len(ngram)
+        if used >= size:
+            break
+    return b''.join(reversed(chosen))
@@ -2,8 +2,8 @@
 import asyncio
 import concurrent.futures
 import datetime
-from time import perf_counter as perf
 from typing import Coroutine
+from typing import Optional
 
 import cytoolz
 import structlog
@@ -13,6 +13,8 @@ from sanic import response
 from ujson import loads
 from websockets.exceptions import ConnectionClosed
 
+from .cache.backends.coalesce import CoalescingCache
+from .cache.backends.write_behind import WriteBehindCache
 from .errors import InvalidUpstreamURL
 from .errors import RequestTimeoutError
 from .errors import UpstreamResponseError
@@ -28,20 +30,54 @@ logger = structlog.get_logger(__name__)
 
 async def handle_jsonrpc(http_request: HTTPRequest) -> HTTPResponse:
     # retreive parsed jsonrpc_requests after request middleware processing
-    http_request.timings.append((perf(), 'handle_jsonrpc.enter'))
+    http_request.timings.record('handle_jsonrpc.enter')
     # make upstream requests
-    async with timeout(http_request.request_timeout):
-        if http_request.is_single_jrpc:
+    try:
+        async with timeout(http_request.request_timeout):
+            if http_request.is_single_jrpc:
+
+                jsonrpc_response = await dispatch_single(http_request,
+                                                         http_request.jsonrpc)
+            else:
 
-            jsonrpc_response = await dispatch_single(http_request,
-                                                     http_request.jsonrpc)
-        else:
+                futures = [dispatch_single(http_request, request)
+                           for request in http_request.jsonrpc]
+                jsonrpc_response = await asyncio.gather(*futures)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # fall back to expired cache entries rather than passing the error on
+        cached_response = await expired_cached_response(http_request)
+        if cached_response is None:
+            raise e
+        logger.info('upstream failed, serving expired cached response',
+                    e=e, request_id=http_request.jefferson_request_id)
+        http_request.timings.record('handle_jsonrpc.exit')
+        return cached_response
+    http_request.timings.record('handle_jsonrpc.exit')
+    return response.json(jsonrpc_response)
 
-            futures = [dispatch_single(http_request, request)
-                       for request in http_request.jsonrpc]
-            jsonrpc_response = await asyncio.gather(*futures)
-        http_request.timings.append((perf(), 'handle_jsonrpc.exit'))
-        return response.json(jsonrpc_response)
+
+async def expired_cached_response(http_request: HTTPRequest) -> Optional[HTTPResponse]:
+    try:
+        cache_group = http_request.app.config.cache_group
+        async with timeout(http_request.app.config.cache_read_timeout):
+            if http_request.is_single_jrpc:
+                cached_response = await cache_group.get_single_jsonrpc_response(
+                    http_request.jsonrpc, allow_expired=True)
+            else:
+                cached_response = await cache_group.get_batch_jsonrpc_responses(
+                    http_request.jsonrpc, allow_expired=True)
+        if not cached_response or \
+                not cache_group.is_complete_response(http_request.jsonrpc, cached_response):
+            return None
+        jefferson_cache_key = cache_group.x_jefferson_cache_key(http_request.jsonrpc)
+        return response.json(cached_response,
+                             headers={'x-jefferson-cache-hit': jefferson_cache_key,
+                                      'x-jefferson-cache-stale': 'error'})
+    except Exception as e:
+        logger.info('error reading expired cached response', e=e)
+    return None
 
 
 async def healthcheck(http_request: HTTPRequest) -> HTTPResponse:
@@ -65,20 +101,58 @@ async def monitor(http_request: HTTPRequest) -> HTTPResponse:
         cache_group = app.config.cache_group
         cache_data.append({
             'cache.memory_cache': {
-                'keys': len(cache_group._memory_cache._keys)
+                'keys': len(cache_group._memory_cache._keys),
+                'rejected': cache_group._memory_cache.rejected
             }
         })
+        cache_data.append({
+            'read_cache.latency': cache_group.read_cache_stats()
+        })
+        cache_data.append({
+            'write_cache.suppressed_writes': cache_group._recent_writes.suppressed
+        })
+        cache_data.append({
+            'cache.breakers': cache_group.breaker_stats()
+        })
+        cache_data.append({
+            'cache.derived_hits': cache_group.derived_hits
+        })
+        reversible_block_stats = cache_group.reversible_block_stats()
+        if reversible_block_stats:
+            cache_data.append({
+                'cache.reversible_blocks': reversible_block_stats
+            })
+        compression_dictionary_stats = cache_group.compression_dictionary_stats()
+        if compression_dictionary_stats:
+            cache_data.append({
+                'cache.compression_dictionary': compression_dictionary_stats
+            })
+        key_filter_stats = cache_group.key_filter_stats()
+        if key_filter_stats:
+            cache_data.append({
+                'read_cache.key_filter': key_filter_stats
+            })
         for i, cache in enumerate(cache_group._read_caches):
-            data = {
-                'read_cache.pool.available': len(cache.client.connection_pool._available_connections),
-                'read_cache.pool.in_use': len(cache.client.connection_pool._in_use_connections)
-            }
+            data = {}
+            if isinstance(cache, CoalescingCache):
+                data['read_cache.coalesce'] = cache.stats()
+            # sharded caches have a client per shard
+            if hasattr(cache, 'client'):
+                data['read_cache.pool.available'] = len(
+                    cache.client.connection_pool._available_connections)
+                data['read_cache.pool.in_use'] = len(
+                    cache.client.connection_pool._in_use_connections)
             cache_data.append(data)
         for i, cache in enumerate(cache_group._write_caches):
-            data = {
-                'write_cache.pool.available': len(cache.client.connection_pool._available_connections),
-                'write_cache.pool.in_use': len(cache.client.connection_pool._in_use_connections)
-            }
+            data = {}
+            if isinstance(cache, WriteBehindCache):
+                data['write_cache.write_behind'] = cache.stats()
+            # sharded caches have a client per shard
+            if hasattr(cache, 'client'):
+                data['write_cache.pool.available'] = len(
+                    cache.client.connection_pool._available_connections)
+                data['write_cache.pool.in_use'] = len(
+                    cache.client.connection_pool._in_use_connections)
             cache_data.append(data)
     except Exception as e:
         logger.error('error adding cache info', e=e)
@@ -132,7 +206,8 @@ async def monitor(http_request: HTTPRequest) -> HTTPResponse:
         'asyncio': async_data,
         'cache': cache_data,
         'server': server_data,
-        'ws_pools': ws_pools
+        'ws_pools': ws_pools,
+        'payload_executor': http_request.app.config.payload_executor.stats()
 
     }
     return response.json(data)
@@ -143,22 +218,22 @@ async def monitor(http_request: HTTPRequest) -> HTTPResponse:
 
 async def fetch_ws(http_request: HTTPRequest,
                    jrpc_request: SingleJrpcRequest) -> SingleJrpcResponse:
-    jrpc_request.timings.append((perf(), 'fetch_ws.enter'))
+    jrpc_request.timings.record('fetch_ws.enter')
     pools = http_request.app.config.websocket_pools
     pool = pools[jrpc_request.upstream.url]
     upstream_request = jrpc_request.to_upstream_request()
     try:
         conn = await pool.acquire()
-        jrpc_request.timings.append((perf(), 'fetch_ws.acquire'))
+        jrpc_request.timings.record('fetch_ws.acquire')
         await conn.send(upstream_request)
-        jrpc_request.timings.append((perf(), 'fetch_ws.send'))
+        jrpc_request.timings.record('fetch_ws.send')
         upstream_response_json = await conn.recv()
-        jrpc_request.timings.append((perf(), 'fetch_ws.response'))
+        jrpc_request.timings.record('fetch_ws.response')
         upstream_response = loads(upstream_response_json)
         await pool.release(conn)
         assert int(upstream_response.get('id')) == jrpc_request.upstream_id
         upstream_response['id'] = jrpc_request.id
-        jrpc_request.timings.append((perf(), 'fetch_ws.exit'))
+        jrpc_request.timings.record('fetch_ws.exit')
         return upstream_response
 
     except Exception as e:
@@ -175,17 +250,17 @@ async def fetch_ws(http_request: HTTPRequest,
 
 async def fetch_http(http_request: HTTPRequest,
                      jrpc_request: SingleJrpcRequest) -> SingleJrpcResponse:
-    jrpc_request.timings.append((perf(), 'fetch_http.enter'))
+    jrpc_request.timings.record('fetch_http.enter')
     session = http_request.app.config.aiohttp['session']
     upstream_request = jrpc_request.to_upstream_request(as_json=False)
 
     async with session.post(jrpc_request.upstream.url,
                             json=upstream_request,
                             headers=jrpc_request.upstream_headers) as resp:
-        jrpc_request.timings.append((perf(), 'fetch_http.response'))
+        jrpc_request.timings.record('fetch_http.response')
         upstream_response = await resp.json(encoding='utf-8', content_type=None)
     upstream_response['id'] = jrpc_request.id
-    jrpc_request.timings.append((perf(), 'fetch_http.exit'))
+    jrpc_request.timings.record('fetch_http.exit')
     return upstream_response
 # pylint: enable=no-value-for-parameter
 
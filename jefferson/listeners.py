@@ -12,6 +12,9 @@ import ujson
 from jefferson.ws.pool import Pool
 
 from .cache import setup_caches
+from .executors import PayloadExecutor
+from .sampling import StatsSampler
+from .sampling import parse_method_rates
 from .typedefs import WebApp
 from .upstream import _Upstreams
 
@@ -95,6 +98,15 @@ def setup_listeners(app: WebApp) -> WebApp:
         # pylint: disable=protected-access
         app.config.websocket_pools = pools
 
+    @app.listener('before_server_start')
+    def setup_payload_executor(app: WebApp, loop) -> None:
+        logger = app.config.logger
+        logger.info('setup_payload_executor', when='before_server_start')
+        args = app.config.args
+        app.config.payload_executor = PayloadExecutor(
+            max_workers=args.payload_executor_workers,
+            threshold=args.payload_executor_threshold)
+
     @app.listener('before_server_start')
     async def setup_caching(app: WebApp, loop) -> None:
         logger = app.config.logger
@@ -109,9 +121,16 @@ def setup_listeners(app: WebApp) -> WebApp:
                 app.config.last_irreversible_block_num = lirb
         except Exception as e:
             logger.exception('setup_caching error', e=e)
+        try:
+            await cache_group.load_compression_dictionary()
+        except Exception as e:
+            logger.exception('setup_caching error', e=e)
         logger.info('setup_caching',
                     lirb=app.config.last_irreversible_block_num)
         app.config.cache_read_timeout = args.cache_read_timeout
+        app.config.cache_race_upstream = args.cache_race_upstream
+        cache_group.start_key_filter_sync()
+        cache_group.start_head_block_num_sync()
 
     @app.listener('before_server_start')
     async def setup_limits(app: WebApp, loop) -> None:
@@ -131,6 +150,7 @@ def setup_listeners(app: WebApp) -> WebApp:
         logger.info('setup_statsd', when='before_server_start')
         args = app.config.args
         app.config.statsd_client = None
+        app.config.stats_sampler = None
         if args.statsd_url is not None:
             url = urlparse(args.statsd_url)
             port = url.port or 8125
@@ -139,6 +159,10 @@ def setup_listeners(app: WebApp) -> WebApp:
                                                         port=port,
                                                         prefix='jefferson')
             await app.config.statsd_client.init()
+            app.config.stats_sampler = StatsSampler(
+                rate=args.statsd_sample_rate,
+                slow_request_threshold=args.statsd_slow_request_threshold,
+                method_rates=parse_method_rates(args.statsd_method_sample_rates))
             logger.info('setup_statsd',
                         statsd_hostname=url.hostname,
                         statsd_port=port,
@@ -168,4 +192,10 @@ def setup_listeners(app: WebApp) -> WebApp:
         cache_group = app.config.cache_group
         await cache_group.close()
 
+    @app.listener('after_server_stop')
+    async def shutdown_payload_executor(app: WebApp, loop) -> None:
+        logger = app.config.logger
+        logger.info('shutdown_payload_executor', when='after_server_stop')
+        app.config.payload_executor.shutdown()
+
     return app
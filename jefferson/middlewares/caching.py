@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 import asyncio
-from time import perf_counter as perf
+import functools
+from typing import Awaitable
+from typing import Optional
+from typing import Tuple
 
 
 import structlog
@@ -10,8 +13,11 @@ from sanic import response
 from ujson import loads
 
 from ..cache.cache_group import UncacheableResponse
+from ..handlers import dispatch_single
+from ..handlers import handle_jsonrpc
 from ..typedefs import HTTPRequest
 from ..typedefs import HTTPResponse
+from ..typedefs import JrpcResponse
 from ..utils import async_nowait_middleware
 
 logger = structlog.get_logger(__name__)
@@ -22,30 +28,43 @@ async def get_response(request: HTTPRequest) -> None:
     if not request.jsonrpc:
         return
 
-    request.timings.append((perf(), 'get_cached_response.enter'))
+    request.timings.record('get_cached_response.enter')
     cache_group = request.app.config.cache_group
     cache_read_timeout = request.app.config.cache_read_timeout
+    # stale entries are served immediately and refreshed from upstream
+    refresh = functools.partial(dispatch_single, request)
 
+    race_delay = None
+    if request.app.config.cache_race_upstream:
+        race_delay = cache_group.race_upstream_delay(cache_read_timeout)
+
+    upstream_task = None
     try:
         cached_response = None
-        async with timeout(cache_read_timeout):
-            if request.is_single_jrpc:
-                cached_response_future =  \
-                    cache_group.get_single_jsonrpc_response(request.jsonrpc)
-            elif request.is_batch_jrpc:
-                cached_response_future = \
-                    cache_group.get_batch_jsonrpc_responses(request.jsonrpc)
-            else:
-                request.timings.append((perf(), 'get_cached_response.exit'))
-                return
-
-            cached_response = await cached_response_future
-        request.timings.append((perf(), 'get_cached_response.response'))
+        if request.is_single_jrpc:
+            cached_response_future =  \
+                cache_group.get_single_jsonrpc_response(request.jsonrpc, refresh=refresh)
+        elif request.is_batch_jrpc:
+            cached_response_future = \
+                cache_group.get_batch_jsonrpc_responses(request.jsonrpc, refresh=refresh)
+        else:
+            request.timings.record('get_cached_response.exit')
+            return
+
+        if race_delay is None:
+            async with timeout(cache_read_timeout):
+                cached_response = await cached_response_future
+        else:
+            cached_response, upstream_task = await race_upstream(
+                request,
+                asyncio.wait_for(cached_response_future, cache_read_timeout),
+                race_delay)
+        request.timings.record('get_cached_response.response')
 
         if cached_response and \
                 cache_group.is_complete_response(request.jsonrpc, cached_response):
             jefferson_cache_key = cache_group.x_jefferson_cache_key(request.jsonrpc)
-            request.timings.append((perf(), 'get_cached_response.exit'))
+            request.timings.record('get_cached_response.exit')
             return response.json(cached_response,
                                  headers={'x-jefferson-cache-hit': jefferson_cache_key})
 
@@ -57,7 +76,49 @@ async def get_response(request: HTTPRequest) -> None:
                      request_id=request.jefferson_request_id)
     except Exception as e:
         logger.error('error querying cache for response', e=e, exc_info=e)
-    request.timings.append((perf(), 'get_cached_response.exit'))
+    request.timings.record('get_cached_response.exit')
+    if upstream_task is not None:
+        # upstream errors are raised here to be handled like handler errors
+        return upstream_task.result()
+
+
+async def race_upstream(request: HTTPRequest,
+                        cache_read: Awaitable,
+                        delay: float) -> Tuple[Optional[JrpcResponse], Optional[asyncio.Future]]:
+    """read the cache, starting the upstream request too if it takes over `delay` seconds
+
+    Returns the cached response, or the finished upstream request when the
+    upstream answered first or the cache couldn't answer.
+    """
+    cache_group = request.app.config.cache_group
+    cache_task = asyncio.ensure_future(cache_read)
+    upstream_task = None
+    try:
+        done, _ = await asyncio.wait({cache_task}, timeout=delay)
+        if done:
+            return cache_task.result(), None
+        request.timings.record('get_cached_response.race_upstream')
+        logger.debug('slow cache read, racing upstream',
+                     delay=delay,
+                     request_id=request.jefferson_request_id)
+        upstream_task = asyncio.ensure_future(handle_jsonrpc(request))
+        done, _ = await asyncio.wait({cache_task, upstream_task},
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if cache_task in done and cache_task.exception() is None:
+            cached_response = cache_task.result()
+            if cached_response and \
+                    cache_group.is_complete_response(request.jsonrpc, cached_response):
+                return cached_response, None
+        await asyncio.wait({upstream_task})
+        return None, upstream_task
+    finally:
+        if not cache_task.done():
+            cache_task.cancel()
+        elif not cache_task.cancelled():
+            # nobody waited for this read once the upstream answered
+            cache_task.exception()
+        if upstream_task is not None and not upstream_task.done():
+            upstream_task.cancel()
 
 
 @async_nowait_middleware
@@ -71,15 +132,17 @@ async def cache_response(request: HTTPRequest, response: HTTPResponse) -> None:
         if not jsonrpc_response:
             return
         cache_group = request.app.config.cache_group
-        last_irreversible_block_num = request.app.config.last_irreversible_block_num
+        lirb = request.app.config.last_irreversible_block_num
         if request.is_single_jrpc:
             await cache_group.cache_single_jsonrpc_response(request=request.jsonrpc,
                                                             response=jsonrpc_response,
-                                                            last_irreversible_block_num=last_irreversible_block_num)
+                                                            last_irreversible_block_num=lirb,
+                                                            response_size=len(response.body))
         elif request.is_batch_jrpc:
             await cache_group.cache_batch_jsonrpc_response(requests=request.jsonrpc,
                                                            responses=jsonrpc_response,
-                                                           last_irreversible_block_num=last_irreversible_block_num)
+                                                           last_irreversible_block_num=lirb,
+                                                           response_size=len(response.body))
 
     except UncacheableResponse:
         pass
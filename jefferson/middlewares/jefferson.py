@@ -29,7 +29,7 @@ async def finalize_jefferson_response(request: HTTPRequest,
     try:
         response.headers['x-jefferson-request-id'] = request.jefferson_request_id
         response.headers['x-amzn-trace-id'] = request.amzn_trace_id
-        response.headers['x-jefferson-response-time'] = str(perf() - request.timings[0][0])
+        response.headers['x-jefferson-response-time'] = str(perf() - request.timings.start)
         if request.is_single_jrpc:
             response.headers['x-jefferson-namespace'] = request.jsonrpc.urn.namespace
             response.headers['x-jefferson-api'] = request.jsonrpc.urn.api
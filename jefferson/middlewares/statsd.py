@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import logging
 from asyncio.tasks import Task
 
 import structlog
@@ -19,9 +20,9 @@ async def init_stats(request: HTTPRequest) -> None:
         if not statsd_client:
             return
         if request.is_single_jrpc:
-            statsd_client.incr('jrpc.inflight')
-        elif request.is_batch_jrpc and statsd_client:
-            _ = [statsd_client.incr('jrpc.inflight') for r in request.jsonrpc]
+            statsd_client.count('jrpc.inflight')
+        elif request.is_batch_jrpc:
+            statsd_client.count('jrpc.inflight', len(request.jsonrpc))
     except BaseException as e:
         logger.warning('send_stats', e=e)
 
@@ -37,17 +38,21 @@ async def send_stats(request: HTTPRequest,
         if not statsd_client:
             return
         if request.is_single_jrpc:
-            statsd_client.from_timings(request.timings)
-            statsd_client.from_timings(request.jsonrpc.timings)
-            statsd_client.decr('jrpc.inflight')
-            statsd_client.gauge('tasks', len(Task.all_tasks()))
-            statsd_client._sendbatch()
+            jsonrpc_requests = [request.jsonrpc]
         elif request.is_batch_jrpc:
+            jsonrpc_requests = request.jsonrpc
+        else:
+            return
+        statsd_client.count('jrpc.inflight', -len(jsonrpc_requests))
+        sampler = request.app.config.stats_sampler
+        if sampler is None or sampler.sampled(request, response):
             statsd_client.from_timings(request.timings)
-            for r in request.jsonrpc:
+            for r in jsonrpc_requests:
                 statsd_client.from_timings(r.timings)
-                statsd_client.decr('jrpc.inflight')
-            statsd_client._sendbatch()
+            statsd_client.gauge('tasks', len(Task.all_tasks()))
+            statsd_client.flush()
+        elif statsd_client.flush_due():
+            statsd_client.flush()
     except BaseException as e:
         logger.warning('send_stats', e=e)
 
@@ -57,6 +62,9 @@ async def log_stats(request: HTTPRequest,
                     response: HTTPResponse) -> None:
     # pylint: disable=bare-except
     try:
+        # formatting timings costs more than the logging call, skip it unless it's emitted
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
         if request.is_single_jrpc:
             request_timings = fmt_timings(request.timings)
             jsonrpc_timings = fmt_timings(request.jsonrpc.timings)
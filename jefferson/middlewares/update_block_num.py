@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 import asyncio
-from time import perf_counter
 
 import structlog
 import ujson
@@ -17,7 +16,9 @@ logger = structlog.get_logger(__name__)
 async def update_last_irreversible_block_num(request: HTTPRequest, response: HTTPResponse) -> None:
     if not request.is_single_jrpc or 'x-jefferson-error-id' in response.headers:
         return
-    request.timings.append((perf_counter(), 'update_last_irreversible_block_num.enter'))
+    if 'x-jefferson-cache-stale' in response.headers:
+        return
+    request.timings.record('update_last_irreversible_block_num.enter')
     try:
         jsonrpc_response = ujson.loads(response.body)
         if is_get_dynamic_global_properties_request(request.jsonrpc):
@@ -27,8 +28,14 @@ async def update_last_irreversible_block_num(request: HTTPRequest, response: HTT
             await asyncio.shield(cache_group.set('last_irreversible_block_num',
                                                  last_irreversible_block_num,
                                                  expire_time=180))
+            await asyncio.shield(
+                cache_group.update_last_irreversible_block_num(last_irreversible_block_num))
+            head_block_num = jsonrpc_response['result'].get('head_block_number')
+            if head_block_num:
+                await asyncio.shield(cache_group.update_head_block_num(head_block_num,
+                                                                       share=True))
     except Exception as e:
         logger.error('skipping update of last_irreversible_block_num',
                      request=request.jefferson_request_id,
                      e=e, response_body=response.body)
-        request.timings.append((perf_counter(), 'update_last_irreversible_block_num.exit'))
+        request.timings.record('update_last_irreversible_block_num.exit')
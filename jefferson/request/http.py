@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 from random import getrandbits
-from time import perf_counter
 from typing import Dict
 from typing import List
 from typing import Optional
@@ -15,6 +14,7 @@ from ujson import loads as json_loads
 from jefferson.empty import _empty
 from jefferson.request.jsonrpc import JSONRPCRequest
 from jefferson.request.jsonrpc import from_http_request as jsonrpc_from_request
+from jefferson.timings import Timings
 
 # pylint: enable=no-name-in-module
 
@@ -67,7 +67,7 @@ class HTTPRequest:
         self.is_batch_jrpc = False
         self.is_single_jrpc = False
 
-        self.timings = [(perf_counter(), 'http_create')]
+        self.timings = Timings('http_create')
         self._log = _empty
 
     @property
@@ -192,7 +192,7 @@ class HTTPRequest:
 
     @property
     def request_start_time(self) -> float:
-        return self.timings[0][0]
+        return self.timings.start
 
     @property
     def request_timeout(self) -> Union[int, float]:
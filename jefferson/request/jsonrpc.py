@@ -1,14 +1,12 @@
 # -*- coding: utf-8 -*-
-from time import perf_counter
 from typing import Dict
-from typing import List
-from typing import Tuple
 from typing import TypeVar
 from typing import Union
 
 from ujson import dumps
 
 from jefferson.empty import _empty
+from jefferson.timings import Timings
 
 # JSONRPC Request/Response fields
 JrpcRequestIdField = TypeVar('JRPCIdField', str, int, float, type(None))
@@ -53,7 +51,7 @@ class JSONRPCRequest:
                  jefferson_request_id: str,
                  batch_index: int,
                  original_request: SingleRawRequest,
-                 timings: List[Tuple[float, str]]) -> None:
+                 timings: Timings) -> None:
         self.id = _id
         self.jsonrpc = jsonrpc
         self.method = method
@@ -132,7 +130,7 @@ def from_http_request(http_request, batch_index: int, request: SingleRawRequest)
     jsonrpc = request['jsonrpc']
     method = request['method']
     params = request.get('params', _empty)
-    timings = [(perf_counter(), 'jsonrpc_create')]
+    timings = Timings('jsonrpc_create')
     return JSONRPCRequest(_id,
                           jsonrpc,
                           method,
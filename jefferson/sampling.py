@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Which requests have their timings sent to statsd
+
+Timings and gauges are only formatted and sent for sampled requests,
+counters are aggregated for every request and stay exact. Errors and slow
+requests are always sampled, other requests at the rate of their method
+or the default rate. Method rates are keyed by `namespace.api.method`,
+`api.method` or `method`, the most specific match wins, eg:
+
+    --statsd_method_sample_rates get_block=0.01 condenser_api.get_block=0.1
+"""
+from random import random
+from time import perf_counter
+from typing import Dict
+from typing import List
+
+from .empty import _empty
+from .typedefs import HTTPRequest
+from .typedefs import HTTPResponse
+
+
+def parse_method_rates(method_rates: List[str]) -> Dict[str, float]:
+    rates = {}
+    for method_rate in method_rates or []:
+        method, rate = method_rate.rsplit('=', 1)
+        rates[method.strip()] = float(rate)
+    return rates
+
+
+class StatsSampler:
+    def __init__(self,
+                 rate: float = 1.0,
+                 slow_request_threshold: float = 0,
+                 method_rates: Dict[str, float] = None) -> None:
+        self.rate = rate
+        self.slow_request_threshold = slow_request_threshold
+        self.method_rates = method_rates or {}
+
+    def method_rate(self, jsonrpc_request) -> float:
+        if not self.method_rates:
+            return self.rate
+        urn = jsonrpc_request.urn
+        names = [urn.method]
+        if urn.api is not _empty:
+            names = [f'{urn.namespace}.{urn.api}.{urn.method}', f'{urn.api}.{urn.method}'] + names
+        else:
+            names.insert(0, f'{urn.namespace}.{urn.method}')
+        for name in names:
+            rate = self.method_rates.get(name)
+            if rate is not None:
+                return rate
+        return self.rate
+
+    def sampled(self, request: HTTPRequest, response: HTTPResponse) -> bool:
+        if response.status >= 400 or 'x-jefferson-error-id' in response.headers:
+            return True
+        if self.slow_request_threshold and \
+                perf_counter() - request.timings.start >= self.slow_request_threshold:
+            return True
+        if request.is_single_jrpc:
+            rate = self.method_rate(request.jsonrpc)
+        else:
+            rate = max((self.method_rate(r) for r in request.jsonrpc), default=self.rate)
+        return rate >= 1 or random() < rate
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Per-request stage timings
+
+Each request records `perf_counter()` readings as it passes through
+handlers and middlewares. Readings go into a preallocated array of
+doubles, with the stage name interned to a small integer id in a parallel
+array, so recording allocates no tuples. Elapsed times are only computed
+and formatted when they are sent to statsd or logged.
+"""
+from array import array
+from time import perf_counter
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Tuple
+
+# about ten stages are recorded per request
+DEFAULT_CAPACITY = 16
+
+_stage_ids = {}  # type: Dict[str, int]
+_stage_names = []  # type: List[str]
+
+
+def stage_id(stage: str) -> int:
+    try:
+        return _stage_ids[stage]
+    except KeyError:
+        _stage_names.append(stage)
+        return _stage_ids.setdefault(stage, len(_stage_names) - 1)
+
+
+def stage_name(stage: int) -> str:
+    return _stage_names[stage]
+
+
+class Timings:
+    __slots__ = ('_times', '_stages', '_count')
+
+    def __init__(self, stage: str, capacity: int = DEFAULT_CAPACITY) -> None:
+        self._times = array('d', bytes(8 * capacity))
+        self._stages = array('H', bytes(2 * capacity))
+        self._count = 0
+        self.record(stage)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def record(self, stage: str) -> None:
+        now = perf_counter()
+        i = self._count
+        if i == len(self._times):
+            self._times.extend(self._times)
+            self._stages.extend(self._stages)
+        self._times[i] = now
+        self._stages[i] = stage_id(stage)
+        self._count = i + 1
+
+    @property
+    def start(self) -> float:
+        return self._times[0]
+
+    def elapsed(self) -> Iterator[Tuple[str, float]]:
+        """each stage after the first, with the milliseconds since the stage before it"""
+        times = self._times
+        stages = self._stages
+        for i in range(1, self._count):
+            yield _stage_names[stages[i]], (times[i] - times[i - 1]) * 1000
+
+    def to_list(self) -> List[Tuple[float, str]]:
+        return [(self._times[i], _stage_names[self._stages[i]]) for i in range(self._count)]
+
+    def format(self, prefix: str = '') -> List[str]:
+        """statsd timer lines"""
+        return [f'{prefix}{stage}:{ms:0.6f}|ms' for stage, ms in self.elapsed()]
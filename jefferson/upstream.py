@@ -27,6 +27,9 @@ ACCOUNT_TRANSFER_PATTERN = re.compile(r'^\/?@([^\/\s]+)/transfers$')
 # NO CACHE: -1
 # NO EXPIRE IF IRREVERSIBLE: -2
 # -------------------
+#  STALE TTLS
+#  NO STALE SERVING: 0
+# -------------------
 #  TIMEOUTS
 #  NO TIMEOUT: 0
 # -------------------
@@ -47,6 +50,7 @@ class _Upstreams(object):
     __URLS = None
     __TTLS = None
     __TIMEOUTS = None
+    __STALE_TTLS = None
     __TRANSLATE_TO_APPBASE = None
 
     def __init__(self, config, validate=True):
@@ -65,6 +69,7 @@ class _Upstreams(object):
         self.__URLS = self.__build_trie('urls')
         self.__TTLS = self.__build_trie('ttls')
         self.__TIMEOUTS = self.__build_trie('timeouts')
+        self.__STALE_TTLS = self.__build_trie('stale_ttls')
 
         self.__TRANSLATE_TO_APPBASE = frozenset(
             c['name'] for c in self.config if c.get('translate_to_appbase', False) is True)
@@ -74,7 +79,7 @@ class _Upstreams(object):
 
     def __build_trie(self, key):
         trie = pygtrie.StringTrie(separator='.')
-        for item in it.chain.from_iterable(c[key] for c in self.config):
+        for item in it.chain.from_iterable(c.get(key, []) for c in self.config):
             if isinstance(item, list):
                 prefix, value = item
             else:
@@ -116,6 +121,11 @@ class _Upstreams(object):
             timeout = None
         return timeout
 
+    @functools.lru_cache(8192)
+    def stale_ttl(self, request_urn) -> int:
+        _, stale_ttl = self.__STALE_TTLS.longest_prefix(str(request_urn))
+        return stale_ttl or 0
+
     @property
     def urls(self) -> frozenset:
         return frozenset(u for u in self.__URLS.values())
@@ -149,10 +159,12 @@ class Upstream(NamedTuple):
     url: str
     ttl: int
     timeout: int
+    stale_ttl: int = 0
 
     @classmethod
     @functools.lru_cache(4096)
     def from_urn(cls, urn, upstreams: _Upstreams=None):
         return Upstream(upstreams.url(urn),
                         upstreams.ttl(urn),
-                        upstreams.timeout(urn))
+                        upstreams.timeout(urn),
+                        upstreams.stale_ttl(urn))
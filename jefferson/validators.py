@@ -37,6 +37,9 @@ PARAMS_TYPES = (list, dict, NONE_TYPE)
 CUSTOM_JSON_SIZE_LIMIT = 2000
 CUSTOM_JSON_FOLLOW_RATE = 2
 
+# results returned for blocks which do not exist yet
+EMPTY_BLOCK_RESULTS = (None, {}, [], {'ops': []})
+
 BROADCAST_TRANSACTION_METHODS = {
     'broadcast_transaction',
     'broadcast_transaction_synchronous'
@@ -96,7 +99,8 @@ def is_valid_non_error_jefferson_response(
             if not is_valid_non_error_single_jsonrpc_response(response):
                 return False
             if is_get_block_request(request):
-                return is_valid_get_block_response(request, response)
+                return is_valid_get_block_response(request, response) or \
+                    is_empty_block_response(request, response)
             return True
         if isinstance(request, list):
             return len(response) > 0 and \
@@ -120,6 +124,11 @@ def is_get_block_header_request(request: JSONRPCRequest) -> bool:
         'dpayd', 'appbase') and request.urn.method == 'get_block_header'
 
 
+def is_get_ops_in_block_request(request: JSONRPCRequest) -> bool:
+    return request.urn.namespace in (
+        'dpayd', 'appbase') and request.urn.method == 'get_ops_in_block'
+
+
 def is_get_dynamic_global_properties_request(request: JSONRPCRequest) -> bool:
     return request.urn.namespace in (
         'dpayd', 'appbase') and request.urn.method == 'get_dynamic_global_properties'
@@ -171,6 +180,17 @@ def is_valid_get_block_response(
     return False
 
 
+def is_empty_block_response(
+        request: JSONRPCRequest,
+        response: SingleJrpcResponse) -> bool:
+    if not (is_get_block_request(request) or
+            is_get_block_header_request(request) or
+            is_get_ops_in_block_request(request)):
+        return False
+    return is_valid_non_error_single_jsonrpc_response(response) and \
+        response['result'] in EMPTY_BLOCK_RESULTS
+
+
 def is_broadcast_transaction_request(request: JSONRPCRequest) -> bool:
     return request.urn.method in BROADCAST_TRANSACTION_METHODS
 
@@ -1,15 +1,41 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
 import time
+from hashlib import blake2b
 import pytest
+from jefferson.cache.backends.coalesce import CoalescingCache
 from jefferson.cache.backends.max_ttl import SimplerMaxTTLMemoryCache
+from jefferson.cache.backends.redis import Cache
+from jefferson.cache.backends.redis import MockClient
+from jefferson.cache.backends.redis import expire_kwargs
+from jefferson.cache.backends.sharded import Shard
+from jefferson.cache.backends.sharded import ShardedCache
+from jefferson.cache.backends.write_behind import WriteBehindCache
+from jefferson.cache.codec import BLOCK_MAGIC
+from jefferson.cache.probabilistic import BloomFilter
+from jefferson.cache.probabilistic import FrequencySketch
+from jefferson.cache.zdict import ZDICT_MAGIC
+from jefferson.cache.zdict import CompressionDictionaries
+from jefferson.cache.zdict import CompressionDictionary
+from jefferson.cache.zdict import store_dictionary
+from jefferson.cache.zdict import train_dictionary
+from jefferson.executors import PayloadExecutor
+
+from ujson import dumps
 
 from .conftest import make_request
 from .conftest import build_mocked_cache
 dummy_request = make_request()
 
 
-@pytest.mark.parametrize('cache', [SimplerMaxTTLMemoryCache(), build_mocked_cache()])
+def build_sharded_cache(shard_count=3):
+    return ShardedCache([Shard(f'shard{i}', build_mocked_cache())
+                         for i in range(shard_count)])
+
+
+@pytest.mark.parametrize('cache', [SimplerMaxTTLMemoryCache(), build_mocked_cache(),
+                                   build_sharded_cache(), CoalescingCache(build_mocked_cache())])
 async def test_cache_clear(cache):
     await cache.clear()
     assert await cache.get('key') is None
@@ -25,7 +51,8 @@ def test_cache_gets(cache):
     assert cache.gets('key') == 'value'
 
 
-@pytest.mark.parametrize('cache', [SimplerMaxTTLMemoryCache(), build_mocked_cache()])
+@pytest.mark.parametrize('cache', [SimplerMaxTTLMemoryCache(), build_mocked_cache(),
+                                   build_sharded_cache(), CoalescingCache(build_mocked_cache())])
 async def test_cache_get(cache):
     await cache.clear()
     await cache.set('key', 'value', None)
@@ -39,7 +66,8 @@ def test_cache_mgets(cache):
     assert cache.mgets(['key', 'key2']) == ['value', 'value2']
 
 
-@pytest.mark.parametrize('cache', [SimplerMaxTTLMemoryCache(), build_mocked_cache()])
+@pytest.mark.parametrize('cache', [SimplerMaxTTLMemoryCache(), build_mocked_cache(),
+                                   build_sharded_cache(), CoalescingCache(build_mocked_cache())])
 async def test_cache_mget(cache):
     await cache.clear()
     await cache.set('key', 'value', None)
@@ -54,7 +82,8 @@ def test_cache_set_manys(cache):
     assert cache.gets('key2') == 'value2'
 
 
-@pytest.mark.parametrize('cache', [SimplerMaxTTLMemoryCache(), build_mocked_cache()])
+@pytest.mark.parametrize('cache', [SimplerMaxTTLMemoryCache(), build_mocked_cache(),
+                                   build_sharded_cache(), CoalescingCache(build_mocked_cache())])
 async def test_cache_set_many(cache):
     await cache.clear()
     await cache.set_many({'key': 'value', 'key2': 'value2'}, 180)
@@ -69,7 +98,8 @@ def test_cache_deletes(cache):
     assert cache.gets('key') is None
 
 
-@pytest.mark.parametrize('cache', [SimplerMaxTTLMemoryCache(), build_mocked_cache()])
+@pytest.mark.parametrize('cache', [SimplerMaxTTLMemoryCache(), build_mocked_cache(),
+                                   build_sharded_cache(), CoalescingCache(build_mocked_cache())])
 async def test_cache_delete(cache):
     await cache.set('key', 'value', None)
     await cache.delete('key')
@@ -104,3 +134,462 @@ def test_cache_max_size(cache):
     for i in range(max_size + 10):
         cache.sets(f'{i}', 'value', cache._max_ttl + 100)
     assert len(cache._cache) == max_size
+
+
+def test_cache_clears_keeps_views():
+    cache = SimplerMaxTTLMemoryCache()
+    cache.sets('key', 'value', None)
+    cache.clears()
+    cache.sets('key2', 'value2', None)
+    assert list(cache._keys) == ['key2']
+
+
+def test_cache_admission_protects_popular_keys():
+    cache = SimplerMaxTTLMemoryCache(max_size=50, admission=True)
+    for i in range(40):
+        cache.gets(f'warm{i}')
+        cache.sets(f'warm{i}', i, None)
+    for i in range(10):
+        for _ in range(3):
+            cache.gets(f'hot{i}')
+        cache.sets(f'hot{i}', i, None)
+
+    # a crawler reading each key once while the hot keys are still read
+    for i in range(200):
+        assert cache.gets(f'hot{i % 10}') == i % 10
+        key = f'cold{i}'
+        assert cache.gets(key) is None
+        cache.sets(key, i, None)
+    assert cache.mgets([f'hot{i}' for i in range(10)]) == list(range(10))
+    # the sketch is approximate, a few crawled keys may be admitted
+    assert cache.rejected > 180
+
+
+def test_cache_admission_admits_popular_keys():
+    cache = SimplerMaxTTLMemoryCache(max_size=100, admission=True)
+    for i in range(100):
+        cache.gets(f'key{i}')
+        cache.sets(f'key{i}', i, None)
+    for _ in range(5):
+        cache.gets('new')
+    cache.sets('new', 'value', None)
+    assert cache.gets('new') == 'value'
+    assert cache.gets('key0') is None
+    assert len(cache._cache) == 100
+
+
+def test_cache_max_entry_size():
+    cache = SimplerMaxTTLMemoryCache(max_entry_size=20)
+    cache.sets('key', {'small': 1}, None)
+    assert cache.gets('key') == {'small': 1}
+    cache.sets('key', {'large': 'x' * 20}, None)
+    assert cache.gets('key') is None
+    assert cache.rejected == 1
+    # a size known by the caller is used instead of encoding the value
+    cache.sets('key', {'large': 'x' * 20}, None, size=10)
+    assert cache.gets('key') == {'large': 'x' * 20}
+    cache.sets('key', {'small': 1}, None, size=30)
+    assert cache.gets('key') is None
+    assert cache.rejected == 2
+
+
+def test_frequency_sketch():
+    sketch = FrequencySketch(100)
+    for _ in range(5):
+        sketch.increment('hot')
+    sketch.increment('warm')
+    assert sketch.frequency('hot') == 5
+    assert sketch.frequency('warm') == 1
+    assert sketch.frequency('cold') == 0
+    assert sketch.admit('hot', 'warm') is True
+    assert sketch.admit('warm', 'hot') is False
+    for _ in range(20):
+        sketch.increment('hot')
+    assert sketch.frequency('hot') == 15
+    sketch.reset()
+    assert sketch.frequency('hot') == 7
+
+
+def test_frequency_sketch_ages():
+    sketch = FrequencySketch(100)
+    for _ in range(4):
+        sketch.increment('old')
+    for i in range(996):
+        sketch.increment(f'other{i % 50}')
+    assert sketch.frequency('old') <= 2
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    keys = [f'key{i}' for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f'absent{i}' in bloom for i in range(10000))
+    assert false_positives < 300
+    assert 0.01 / 2 < bloom.false_positive_rate() < 0.01 * 2
+
+
+def test_bloom_filter_update():
+    bloom = BloomFilter(100)
+    other = BloomFilter(100)
+    bloom.add('mine')
+    other.add('theirs')
+    bloom.update(other.to_bytes())
+    assert 'mine' in bloom
+    assert 'theirs' in bloom
+    with pytest.raises(ValueError):
+        bloom.update(BloomFilter(1000).to_bytes())
+
+
+def hex_digest(seed, size):
+    return blake2b(seed.encode(), digest_size=size).hexdigest()
+
+
+def build_block_response(transaction_count=20, seed=''):
+    transactions = [{
+        'ref_block_num': 1000 + i,
+        'ref_block_prefix': 3000000000 + i,
+        'expiration': '2018-04-01T00:00:30',
+        'operations': [['vote', {'voter': f'voter{i}', 'author': 'dpay',
+                                 'permlink': f'post{seed}', 'weight': 10000}]],
+        'extensions': [],
+        'signatures': [hex_digest(f'signature{seed}{i}', 64) + '1f']
+    } for i in range(transaction_count)]
+    return {
+        'id': 1,
+        'jsonrpc': '2.0',
+        'result': {
+            'previous': '000003e7' + hex_digest('previous', 16),
+            'timestamp': '2018-04-01T00:00:03',
+            'witness': 'dpay',
+            'transaction_merkle_root': hex_digest('root', 20),
+            'extensions': [],
+            'witness_signature': '20' + hex_digest('witness', 64),
+            'transactions': transactions,
+            'block_id': '000003e8' + hex_digest('block', 16),
+            'signing_key': 'DWB88FC9nDFczSTfVxrzHvVe8ZuvajLHKikfJYWiKkNvrUebBovzF',
+            'transaction_ids': [hex_digest(f'transaction{seed}{i}', 20)
+                                for i in range(transaction_count)]
+        }
+    }
+
+
+async def test_block_codec():
+    client = MockClient(cache=SimplerMaxTTLMemoryCache())
+    cache = Cache(client, block_codec=True)
+    block = build_block_response()
+    # a transaction whose signatures aren't its last key
+    block['result']['transactions'][0]['transaction_num'] = 0
+    await cache.set('block', block)
+    stored = client.cache.gets('block')
+    assert stored.startswith(BLOCK_MAGIC)
+    assert len(stored) < len(Cache(client)._pack(block)) * 0.9
+    cached = await cache.get('block')
+    assert dumps(cached) == dumps(block)
+    # readers without the codec enabled still decode it
+    assert await Cache(client).get('block') == block
+
+
+@pytest.mark.parametrize('value', [
+    {'id': 1, 'result': {'previous': 'c1' * 20}},
+    dict(build_block_response(), result=dict(build_block_response()['result'],
+                                             block_id='000003E8' + 'F4' * 16)),
+    dict(build_block_response(), result=dict(build_block_response()['result'],
+                                             previous='00'))
+])
+async def test_block_codec_falls_back_to_json(value):
+    client = MockClient(cache=SimplerMaxTTLMemoryCache())
+    cache = Cache(client, block_codec=True)
+    await cache.set('key', value)
+    assert not client.cache.gets('key').startswith(BLOCK_MAGIC)
+    assert dumps(await cache.get('key')) == dumps(value)
+
+
+def build_dictionaries():
+    samples = [dumps(build_block_response(seed=str(i))).encode() for i in range(10)]
+    dictionaries = CompressionDictionaries()
+    dictionaries.add(CompressionDictionary(train_dictionary(samples, size=2048)))
+    return dictionaries
+
+
+@pytest.mark.parametrize('block_codec', [False, True])
+async def test_compression_dictionary(block_codec):
+    client = MockClient(cache=SimplerMaxTTLMemoryCache())
+    dictionaries = build_dictionaries()
+    cache = Cache(client, block_codec=block_codec, dictionaries=dictionaries)
+    block = build_block_response(seed='new')
+    await cache.set('block', block)
+    await cache.set('other', {'id': 1, 'result': 'value'})
+    plain = Cache(client, block_codec=block_codec)._pack(block)
+    assert len(client.cache.gets('block')) < len(plain)
+    assert dumps(await cache.get('block')) == dumps(block)
+    assert not client.cache.gets('other').startswith(ZDICT_MAGIC)
+    assert await cache.get('other') == {'id': 1, 'result': 'value'}
+    # values compressed with a dictionary which isn't loaded are misses
+    assert await Cache(client, block_codec=block_codec,
+                       dictionaries=CompressionDictionaries()).get('block') is None
+    # and so are they on workers without dictionaries
+    assert await Cache(client, block_codec=block_codec).get('block') is None
+
+
+async def test_cache_mget_undecodable_value_is_a_miss():
+    client = MockClient(cache=SimplerMaxTTLMemoryCache())
+    cache = Cache(client)
+    await cache.set('key1', 'value1')
+    await cache.set('key3', 'value3')
+    client.cache.sets('key2', b'\x78not zlib', None)
+    assert await cache.mget(['key1', 'key2', 'key3']) == ['value1', None, 'value3']
+    assert await cache.get('key2') is None
+
+
+async def test_compression_dictionary_load():
+    cache = build_mocked_cache()
+    dictionaries = CompressionDictionaries()
+    assert await dictionaries.load(cache) is None
+    dictionary = build_dictionaries().current
+    await store_dictionary(cache, dictionary)
+    loaded = await dictionaries.load(cache)
+    assert loaded.version == dictionary.version
+    assert loaded.data == dictionary.data
+    assert dictionaries.stats() == {'version': dictionary.version,
+                                    'loaded': 1,
+                                    'unknown_versions': 0}
+
+
+async def test_cache_offloads_large_values():
+    client = MockClient(cache=SimplerMaxTTLMemoryCache())
+    executor = PayloadExecutor(max_workers=1, threshold=1000)
+    cache = Cache(client, executor=executor)
+    block = build_block_response()
+    await cache.set('small', {'id': 1})
+    await cache.set_many({'block': block})
+    assert executor.offloaded == 1
+    assert await cache.get('small') == {'id': 1}
+    assert await cache.mget(['block', 'small']) == [block, {'id': 1}]
+    assert executor.offloaded == 2
+    executor.shutdown()
+
+
+@pytest.mark.parametrize('expire_time,expected', [
+    (None, {'ex': None}),
+    (3, {'ex': 3}),
+    (3.0, {'ex': 3}),
+    (0.5, {'px': 500})
+])
+def test_expire_kwargs(expire_time, expected):
+    assert expire_kwargs(expire_time) == expected
+
+
+async def test_sharded_cache_spreads_keys():
+    cache = build_sharded_cache()
+    keys = [f'key{i}' for i in range(300)]
+    await cache.set_many({key: key for key in keys}, 180)
+    assert await cache.mget(keys) == keys
+    for shard in cache.shards:
+        stored = await shard.primary.mget(keys)
+        assert 50 < len([value for value in stored if value]) < 150
+
+
+async def test_sharded_cache_add_shard_moves_few_keys():
+    cache = build_sharded_cache()
+    keys = [f'key{i}' for i in range(1000)]
+    before = {key: cache.shard_for_key(key).name for key in keys}
+    cache.add_shard(Shard('shard3', build_mocked_cache()))
+    after = {key: cache.shard_for_key(key).name for key in keys}
+    moved = [key for key in keys if before[key] != after[key]]
+    assert all(after[key] == 'shard3' for key in moved)
+    assert 150 < len(moved) < 350
+
+
+async def test_sharded_cache_reads_from_replicas():
+    primary = build_mocked_cache()
+    replica = build_mocked_cache()
+    cache = ShardedCache([Shard('shard0', primary, (replica,))])
+    await cache.set('key', 'value', 180)
+    assert await primary.get('key') == 'value'
+    assert await cache.get('key') is None
+    await replica.set('key', 'replicated', 180)
+    assert await cache.get('key') == 'replicated'
+    assert await cache.mget(['key', 'missing']) == ['replicated', None]
+
+
+async def test_sharded_cache_mget_with_failed_shard():
+    cache = build_sharded_cache(2)
+    keys = [f'key{i}' for i in range(20)]
+    await cache.set_many({key: key for key in keys}, 180)
+    failed_shard = cache.shards[0]
+
+    async def failing_mget(keys):
+        raise ConnectionError()
+    failed_shard.primary.mget = failing_mget
+
+    results = await cache.mget(keys)
+    for key, result in zip(keys, results):
+        if cache.shard_for_key(key) is failed_shard:
+            assert result is None
+        else:
+            assert result == key
+
+
+class CountingCache:
+    def __init__(self, cache):
+        self.cache = cache
+        self.mgets = []
+
+    async def mget(self, keys):
+        self.mgets.append(keys)
+        return await self.cache.mget(keys)
+
+
+async def test_coalescing_cache_batches_concurrent_reads():
+    backend = build_mocked_cache()
+    await backend.set_many({'key1': 'value1', 'key2': 'value2'}, 180)
+    counting = CountingCache(backend)
+    cache = CoalescingCache(counting)
+    results = await asyncio.gather(cache.get('key1'),
+                                   cache.get('key1'),
+                                   cache.mget(['key2', 'missing']),
+                                   cache.get('missing'))
+    assert results == ['value1', 'value1', ['value2', None], None]
+    assert counting.mgets == [['key1', 'key2', 'missing']]
+    assert cache.stats() == {'keys_requested': 5, 'batches': 1}
+
+    # later reads start a new batch
+    assert await cache.get('key2') == 'value2'
+    assert len(counting.mgets) == 2
+
+
+async def test_coalescing_cache_window():
+    backend = build_mocked_cache()
+    counting = CountingCache(backend)
+    cache = CoalescingCache(counting, window=0.01)
+    first = asyncio.ensure_future(cache.get('key1'))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(cache.get('key2'))
+    assert await asyncio.gather(first, second) == [None, None]
+    assert counting.mgets == [['key1', 'key2']]
+
+
+async def test_coalescing_cache_max_batch_keys():
+    counting = CountingCache(build_mocked_cache())
+    cache = CoalescingCache(counting, window=10, max_batch_keys=2)
+    assert await cache.mget(['key1', 'key2']) == [None, None]
+    assert counting.mgets == [['key1', 'key2']]
+
+
+async def test_coalescing_cache_cancelled_waiter():
+    counting = CountingCache(build_mocked_cache())
+    cache = CoalescingCache(counting, window=0.01)
+    await counting.cache.set('key', 'value', 180)
+    cancelled = asyncio.ensure_future(cache.get('key'))
+    waiting = asyncio.ensure_future(cache.get('key'))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    assert await waiting == 'value'
+
+
+async def test_coalescing_cache_error():
+    class BrokenCache:
+        async def mget(self, keys):
+            raise ConnectionError()
+    cache = CoalescingCache(BrokenCache())
+    with pytest.raises(ConnectionError):
+        await asyncio.gather(cache.get('key1'), cache.get('key2'))
+
+
+@pytest.mark.parametrize('cache', [build_mocked_cache(), build_sharded_cache()])
+async def test_cache_set_many_by_ttl(cache):
+    await cache.clear()
+    await cache.set_many_by_ttl({180: {'key1': 'value1'}, None: {'key2': 'value2'}})
+    assert await cache.mget(['key1', 'key2']) == ['value1', 'value2']
+
+
+class RecordingCache:
+    def __init__(self):
+        self.cache = build_mocked_cache()
+        self.writes = []
+
+    async def set_many_by_ttl(self, data, nx=False):
+        self.writes.append(data)
+        await self.cache.set_many_by_ttl(data, nx=nx)
+
+    async def get(self, key):
+        return await self.cache.get(key)
+
+
+async def test_write_behind_cache_merges_writes():
+    backend = RecordingCache()
+    cache = WriteBehindCache(backend, flush_interval=0.01)
+    await cache.set('key1', 'old', 3)
+    await cache.set('key1', 'new', 3)
+    await cache.set_many({'key2': 'value2', 'key3': 'value3'}, None)
+    assert backend.writes == []
+    assert cache.stats()['pending'] == 3
+    await asyncio.sleep(0.02)
+    assert backend.writes == [{3: {'key1': 'new'}, None: {'key2': 'value2', 'key3': 'value3'}}]
+    assert await cache.get('key1') == 'new'
+    assert cache.stats() == {'pending': 0, 'queued': 4, 'dropped': 0,
+                             'flushes': 1, 'failed_flushes': 0}
+
+
+async def test_write_behind_cache_batch_size_and_drops():
+    backend = RecordingCache()
+    cache = WriteBehindCache(backend, flush_interval=10, max_batch_size=2, max_queue_size=3)
+    await cache.set_many({'key1': 1, 'key2': 2}, 3)
+    await cache.drain()
+    assert backend.writes == [{3: {'key1': 1, 'key2': 2}}]
+
+    # the flush hasn't run yet, so writes pile up until the queue is full
+    cache.max_batch_size = 10
+    await cache.set_many({f'key{i}': i for i in range(5)}, 3)
+    assert cache.stats()['dropped'] == 2
+    await cache.drain()
+    assert backend.writes[-1] == {3: {'key0': 0, 'key1': 1, 'key2': 2}}
+
+
+async def test_write_behind_cache_delete_drops_pending_write():
+    backend = RecordingCache()
+    backend.delete = backend.cache.delete
+    cache = WriteBehindCache(backend, flush_interval=10)
+    await cache.set('key', 'value', 3)
+    await cache.delete('key')
+    await cache.drain()
+    assert backend.writes == []
+
+
+async def test_write_behind_cache_delete_waits_for_flush():
+    backend = RecordingCache()
+    backend.delete = backend.cache.delete
+    set_many_by_ttl = backend.set_many_by_ttl
+
+    async def slow_set_many_by_ttl(data, nx=False):
+        await asyncio.sleep(0.01)
+        await set_many_by_ttl(data, nx=nx)
+    backend.set_many_by_ttl = slow_set_many_by_ttl
+    cache = WriteBehindCache(backend, flush_interval=10)
+    await cache.set('key', 'value', 3)
+    cache.flush()
+    await cache.delete('key')
+    assert backend.writes == [{3: {'key': 'value'}}]
+    assert await cache.get('key') is None
+
+
+async def test_write_behind_cache_set_if_absent():
+    backend = RecordingCache()
+    cache = WriteBehindCache(backend, flush_interval=10)
+    await backend.cache.set('key1', 'existing', None)
+    await cache.set('key1', 'new', None, nx=True)
+    await cache.set('key2', 'value2', 3)
+    await cache.drain()
+    assert sorted(backend.writes, key=len) == [{3: {'key2': 'value2'}}, {None: {'key1': 'new'}}]
+    assert await cache.get('key1') == 'existing'
+
+
+@pytest.mark.parametrize('cache', [build_mocked_cache(), build_sharded_cache()])
+async def test_cache_set_if_absent(cache):
+    await cache.clear()
+    await cache.set('key1', 'value1', None, nx=True)
+    await cache.set('key1', 'value2', None, nx=True)
+    await cache.set_many({'key1': 'value3', 'key2': 'value2'}, None, nx=True)
+    assert await cache.mget(['key1', 'key2']) == ['value1', 'value2']
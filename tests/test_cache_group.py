@@ -1,12 +1,22 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import time
 import pytest
 from time import perf_counter
 
 from jefferson.cache.backends.max_ttl import SimplerMaxTTLMemoryCache
+from jefferson.cache.backends.write_behind import WriteBehindCache
 from jefferson.cache import CacheGroupItem
 from jefferson.cache import SpeedTier
 from jefferson.cache.cache_group import CacheGroup
+from jefferson.cache.key_filter import KeyFilter
+from jefferson.cache.recent_writes import RecentWrites
 from jefferson.cache.utils import jsonrpc_cache_key
+from jefferson.cache.utils import FRESH_UNTIL_KEY
+from jefferson.cache.utils import HEAD_BLOCK_NUM_KEY
+from jefferson.cache.utils import KEY_FINGERPRINT_KEY
+from jefferson.cache.utils import hashed_cache_key
+from jefferson.cache.utils import STALE_UNTIL_KEY
 
 
 from .conftest import make_request
@@ -114,6 +124,18 @@ bad_response2 = {
         "transaction_ids": []}}
 
 
+def build_cache_group(cache=None, **kwargs):
+    # a single redis-like cache, read and written
+    if cache is None:
+        cache = build_mocked_cache()
+    return CacheGroup([CacheGroupItem(cache, True, True, SpeedTier.SLOW)], **kwargs)
+
+
+def block_id(block_num):
+    # block ids lead with the block number in hex
+    return f'{block_num:08x}' + '1b5056ef5b610531031204f173aef7a8'
+
+
 async def test_cache_group_clear():
     caches = [
         CacheGroupItem(build_mocked_cache(), True, True, SpeedTier.FAST),
@@ -274,14 +296,14 @@ async def test_cache_group_get_batch_jsonrpc_responses():
 
     batch_resp = [{
         'id': _id, "jsonrpc": "2.0", 'result': {
-            "previous": "000003e7c4fd3221cf407efcf7c1730e2ca54b05",
+            "previous": block_id(_id - 1),
             "timestamp": "2018-09-04T16:36:27",
             "witness": "dpay",
             "transaction_merkle_root": "0000000000000000000000000000000000000000",
             "extensions": [],
             "witness_signature": "201522e89ede4eea643486772bb7cf5fd59224f0de226840124651dcb7a22251d772e1a8a953d7218eddf83618351f33ec401007713070b435253d44a3ad937db2",
             "transactions": [],
-            "block_id": "000000011b5056ef5b610531031204f173aef7a8",
+            "block_id": block_id(_id),
             "signing_key": "DWB88FC9nDFczSTfVxrzHvVe8ZuvajLHKikfJYWiKkNvrUebBovzF",
             "transaction_ids": []
         }
@@ -310,14 +332,14 @@ async def test_cache_group_cache_batch_jsonrpc_responses():
     }) for _id in range(1, 10)]
 
     batch_resp = [{'id': _id, "jsonrpc": "2.0", 'result': {
-        "previous": "0000000000000000000000000000000000000000",
+        "previous": block_id(_id - 1),
         "timestamp": "2018-09-04T16:36:27",
         "witness": "dpay",
         "transaction_merkle_root": "0000000000000000000000000000000000000000",
         "extensions": [],
         "witness_signature": "201522e89ede4eea643486772bb7cf5fd59224f0de226840124651dcb7a22251d772e1a8a953d7218eddf83618351f33ec401007713070b435253d44a3ad937db2",
         "transactions": [],
-        "block_id": "000000011b5056ef5b610531031204f173aef7a8",
+        "block_id": block_id(_id),
         "signing_key": "DWB88FC9nDFczSTfVxrzHvVe8ZuvajLHKikfJYWiKkNvrUebBovzF",
         "transaction_ids": []}} for _id in range(1, 10)]
 
@@ -340,6 +362,102 @@ async def test_cache_group_cache_batch_jsonrpc_responses():
         assert await cache_group.get(key) == batch_resp[i]
 
 
+async def test_cache_group_stale_while_revalidate():
+    cache_group = build_cache_group()
+    req = jsonrpc_from_request(dummy_request, 0, {
+        "id": "1", "jsonrpc": "2.0",
+        "method": "get_state", "params": ["/trending"]
+    })
+    req.upstream = req.upstream._replace(ttl=30, stale_ttl=60)
+    resp = {"id": "1", "jsonrpc": "2.0", "result": {"trending": 1}}
+    refreshed_resp = {"id": "1", "jsonrpc": "2.0", "result": {"trending": 2}}
+    refreshes = []
+
+    async def refresh(request):
+        refreshes.append(request)
+        return refreshed_resp
+
+    key = jsonrpc_cache_key(req)
+    await cache_group.cache_single_jsonrpc_response(req, resp)
+    cached = await cache_group.get(key)
+    assert await cache_group.get_single_jsonrpc_response(req, refresh=refresh) == resp
+    assert refreshes == []
+
+    # expired but inside the stale window
+    await cache_group.set(key, dict(cached, **{FRESH_UNTIL_KEY: time.time() - 1}), 90)
+    assert await cache_group.get_single_jsonrpc_response(req) is None
+    assert await cache_group.get_single_jsonrpc_response(req, refresh=refresh) == resp
+    assert await cache_group.get_single_jsonrpc_response(req, refresh=refresh) == resp
+    await asyncio.sleep(0.01)
+    assert len(refreshes) == 1
+    assert await cache_group.get_single_jsonrpc_response(req, refresh=refresh) == refreshed_resp
+
+
+async def test_cache_group_error_grace_period():
+    cache_group = build_cache_group(error_grace_period=300)
+    req = jsonrpc_from_request(dummy_request, 0, {
+        "id": "1", "jsonrpc": "2.0",
+        "method": "get_state", "params": ["/trending"]
+    })
+    req.upstream = req.upstream._replace(ttl=30)
+    resp = {"id": "1", "jsonrpc": "2.0", "result": {"trending": 1}}
+
+    key = jsonrpc_cache_key(req)
+    await cache_group.cache_single_jsonrpc_response(req, resp)
+    cached = await cache_group.get(key)
+    await cache_group.set(key, dict(cached, **{FRESH_UNTIL_KEY: time.time() - 1,
+                                                STALE_UNTIL_KEY: time.time() - 1}), 300)
+
+    async def refresh(request):
+        return resp
+
+    assert await cache_group.get_single_jsonrpc_response(req, refresh=refresh) is None
+    assert await cache_group.get_batch_jsonrpc_responses([req]) == [None]
+    assert await cache_group.get_single_jsonrpc_response(req, allow_expired=True) == resp
+    assert await cache_group.get_batch_jsonrpc_responses([req], allow_expired=True) == [resp]
+
+
+async def test_cache_group_negative_caching():
+    redis_cache = build_mocked_cache()
+    cache_group = build_cache_group(redis_cache, negative_ttl=3)
+    req = jsonrpc_from_request(dummy_request, 0, {
+        "id": "1", "jsonrpc": "2.0",
+        "method": "get_block", "params": [1001]
+    })
+    null_resp = {"id": "1", "jsonrpc": "2.0", "result": None}
+    key = jsonrpc_cache_key(req)
+
+    # without a head the block may exist on a lagging upstream
+    await cache_group.cache_single_jsonrpc_response(req, null_resp)
+    assert await cache_group.get_single_jsonrpc_response(req) is None
+
+    await cache_group.update_head_block_num(1000)
+    await cache_group.cache_single_jsonrpc_response(req, null_resp)
+    assert await cache_group.get_single_jsonrpc_response(req) == null_resp
+    assert CacheGroup.is_complete_response(req, null_resp) is True
+
+    # head passes the block
+    await cache_group.update_head_block_num(1001)
+    assert await cache_group.get_single_jsonrpc_response(req) is None
+    assert await redis_cache.get(key) is None
+
+    # the block exists now, a null response is not cached
+    await cache_group.cache_single_jsonrpc_response(req, null_resp)
+    assert await cache_group.get_single_jsonrpc_response(req) is None
+
+
+async def test_cache_group_negative_caching_disabled():
+    cache_group = build_cache_group()
+    batch_req = [jsonrpc_from_request(dummy_request, _id, {
+        "id": _id, "jsonrpc": "2.0", "method": "get_block",
+        "params": [_id]
+    }) for _id in range(1, 3)]
+    batch_resp = [{"id": _id, "jsonrpc": "2.0", "result": None} for _id in range(1, 3)]
+    await cache_group.cache_batch_jsonrpc_response(batch_req, batch_resp,
+                                                   last_irreversible_block_num=15_000_000)
+    assert await cache_group.get_batch_jsonrpc_responses(batch_req) == [None, None]
+
+
 def test_cache_group_is_complete_response(dpayd_request_and_response):
     req, resp = dpayd_request_and_response
     req = jsonrpc_from_request(dummy_request, 0, req)
@@ -375,6 +493,8 @@ def test_cache_group_is_complete_response(dpayd_request_and_response):
     ([request, request], [response, bad_response2], False),
     ([request, request], [bad_response1], False)
 ])
+
+
 def test_cache_group_is_complete_response_bad_responses(req, resp, expected):
     assert CacheGroup.is_complete_response(req, resp) is expected
 
@@ -385,3 +505,605 @@ def test_cache_group_x_jefferson_cache_key(dpayd_request_and_response):
     batch_req = [req, req, req]
     assert jsonrpc_cache_key(req) == CacheGroup.x_jefferson_cache_key(req)
     assert CacheGroup.x_jefferson_cache_key(batch_req) == 'batch'
+
+
+async def test_cache_group_canonical_block_header():
+    redis_cache = build_mocked_cache()
+    cache_group = build_cache_group(redis_cache)
+    header = {
+        "previous": "000003e7b2b5a1ec3b8b3b4b2e4c5c3e5d6a7f8e",
+        "timestamp": "2018-09-04T17:26:30",
+        "witness": "dpay",
+        "transaction_merkle_root": "0000000000000000000000000000000000000000",
+        "extensions": []
+    }
+    block_api_req = jsonrpc_from_request(dummy_request, 0, {
+        "id": 1, "jsonrpc": "2.0",
+        "method": "block_api.get_block_header", "params": {"block_num": 1000}
+    })
+    legacy_req = jsonrpc_from_request(dummy_request, 0, {
+        "id": 2, "jsonrpc": "2.0",
+        "method": "get_block_header", "params": ["1000"]
+    })
+    assert jsonrpc_cache_key(block_api_req) == jsonrpc_cache_key(legacy_req)
+
+    await cache_group.cache_single_jsonrpc_response(
+        block_api_req, {"id": 1, "jsonrpc": "2.0", "result": {"header": header}}, ttl=60)
+    assert await redis_cache.get(jsonrpc_cache_key(legacy_req)) == {
+        "id": 1, "jsonrpc": "2.0", "result": header}
+    assert await cache_group.get_single_jsonrpc_response(legacy_req) == {
+        "id": 2, "jsonrpc": "2.0", "result": header}
+    assert await cache_group.get_single_jsonrpc_response(block_api_req) == {
+        "id": 1, "jsonrpc": "2.0", "result": {"header": header}}
+
+
+async def test_cache_group_derives_block_header_from_block():
+    cache_group = build_cache_group(derive_block_headers=True)
+    header = {
+        "previous": "000003e7b2b5a1ec3b8b3b4b2e4c5c3e5d6a7f8e",
+        "timestamp": "2018-09-04T17:26:30",
+        "witness": "dpay",
+        "transaction_merkle_root": "0000000000000000000000000000000000000000",
+        "extensions": []
+    }
+    block = dict(header,
+                 witness_signature="1f39",
+                 transactions=[],
+                 block_id="000003e8cc14da92f6beb0f9949a672cda19dd7b",
+                 signing_key="DWB88FC9nDFczSTfVxrzHvVe8ZuvajLHKikfJYWiKkNvrUebBovzF",
+                 transaction_ids=[])
+    block_req = jsonrpc_from_request(dummy_request, 0, {
+        "id": 1, "jsonrpc": "2.0", "method": "get_block", "params": [1000]
+    })
+    legacy_req = jsonrpc_from_request(dummy_request, 0, {
+        "id": 2, "jsonrpc": "2.0", "method": "get_block_header", "params": [1000]
+    })
+    block_api_req = jsonrpc_from_request(dummy_request, 0, {
+        "id": 3, "jsonrpc": "2.0",
+        "method": "block_api.get_block_header", "params": {"block_num": 1000}
+    })
+    other_req = jsonrpc_from_request(dummy_request, 0, {
+        "id": 4, "jsonrpc": "2.0", "method": "get_block_header", "params": [1001]
+    })
+    assert await cache_group.get_single_jsonrpc_response(legacy_req) is None
+
+    await cache_group.cache_single_jsonrpc_response(
+        block_req, {"id": 1, "jsonrpc": "2.0", "result": block}, ttl=60)
+    assert await cache_group.get_single_jsonrpc_response(legacy_req) == {
+        "id": 2, "jsonrpc": "2.0", "result": header}
+    assert await cache_group.get_batch_jsonrpc_responses([block_api_req, other_req]) == [
+        {"id": 3, "jsonrpc": "2.0", "result": {"header": header}}, None]
+    assert cache_group.derived_hits == 2
+
+    # cached entries which are no longer usable are derived too
+    await cache_group.update_head_block_num(2000)
+    await cache_group.set(cache_group.cache_key(legacy_req),
+                          {"id": 2, "jsonrpc": "2.0", "result": {}, HEAD_BLOCK_NUM_KEY: 1999},
+                          expire_time=60)
+    assert await cache_group.get_single_jsonrpc_response(legacy_req) == {
+        "id": 2, "jsonrpc": "2.0", "result": header}
+    assert cache_group.derived_hits == 3
+
+
+async def test_cache_group_transaction_index():
+    cache_group = build_cache_group(transaction_index_size=100)
+    transactions = [
+        {"ref_block_num": 999, "ref_block_prefix": 1, "expiration": "2018-09-04T17:27:00",
+         "operations": [["vote", {"voter": "dpay", "author": "dpay",
+                                  "permlink": "a", "weight": 1}]],
+         "extensions": [], "signatures": ["1f00"]},
+        {"ref_block_num": 999, "ref_block_prefix": 2, "expiration": "2018-09-04T17:27:00",
+         "operations": [["vote", {"voter": "dpay", "author": "dpay",
+                                  "permlink": "b", "weight": 1}]],
+         "extensions": [], "signatures": ["1f01"]},
+    ]
+    block_req = jsonrpc_from_request(dummy_request, 0, {
+        "id": 1, "jsonrpc": "2.0", "method": "get_block", "params": [1000]
+    })
+    block_resp = {"id": 1, "jsonrpc": "2.0", "result": {
+        "previous": "000003e7b2b5a1ec3b8b3b4b2e4c5c3e5d6a7f8e",
+        "timestamp": "2018-09-04T17:26:30",
+        "witness": "dpay",
+        "transaction_merkle_root": "0000000000000000000000000000000000000000",
+        "extensions": [],
+        "witness_signature": "1f39",
+        "transactions": transactions,
+        "block_id": "000003e8cc14da92f6beb0f9949a672cda19dd7b",
+        "signing_key": "DWB88FC9nDFczSTfVxrzHvVe8ZuvajLHKikfJYWiKkNvrUebBovzF",
+        "transaction_ids": ["aaaa", "bbbb"]}}
+    trx_req = jsonrpc_from_request(dummy_request, 0, {
+        "id": 2, "jsonrpc": "2.0", "method": "get_transaction", "params": ["bbbb"]
+    })
+    await cache_group.cache_single_jsonrpc_response(block_req, block_resp,
+                                                    last_irreversible_block_num=999)
+    # reversible transactions aren't served
+    assert await cache_group.get_single_jsonrpc_response(trx_req) is None
+
+    await cache_group.update_last_irreversible_block_num(1000)
+    assert await cache_group.get_single_jsonrpc_response(trx_req) == {
+        "id": 2, "jsonrpc": "2.0",
+        "result": dict(transactions[1], transaction_id="bbbb", block_num=1000, transaction_num=1)}
+    unknown_req = jsonrpc_from_request(dummy_request, 0, {
+        "id": 3, "jsonrpc": "2.0", "method": "get_transaction", "params": ["cccc"]
+    })
+    assert await cache_group.get_batch_jsonrpc_responses([unknown_req, trx_req]) == [
+        None, {"id": 2, "jsonrpc": "2.0",
+               "result": dict(transactions[1], transaction_id="bbbb",
+                              block_num=1000, transaction_num=1)}]
+
+
+async def test_cache_group_hashed_keys():
+    redis_cache = build_mocked_cache()
+    cache_group = build_cache_group(redis_cache, hashed_keys=True)
+    req = jsonrpc_from_request(dummy_request, 0, {
+        "id": "1", "jsonrpc": "2.0",
+        "method": "get_discussions_by_trending",
+        "params": [{"tag": "photography", "limit": 20, "truncate_body": 1024}]
+    })
+    req.upstream = req.upstream._replace(ttl=30)
+    resp = {"id": "1", "jsonrpc": "2.0", "result": [{"author": "dpay"}]}
+    key = cache_group.cache_key(req)
+    assert key == hashed_cache_key(jsonrpc_cache_key(req))
+    assert key != jsonrpc_cache_key(req)
+
+    await cache_group.cache_single_jsonrpc_response(req, resp)
+    assert KEY_FINGERPRINT_KEY in await redis_cache.get(key)
+    assert await cache_group.get_single_jsonrpc_response(req) == resp
+    assert await cache_group.get_batch_jsonrpc_responses([req]) == [resp]
+
+    # a different key's value stored under the same digest is a miss
+    colliding_value = dict(resp, **{KEY_FINGERPRINT_KEY: 'deadbeefdeadbeef'})
+    await cache_group.set(key, colliding_value, expire_time=30)
+    assert await cache_group.get_single_jsonrpc_response(req) is None
+    assert await cache_group.get_batch_jsonrpc_responses([req]) == [None]
+
+
+class SlowCache:
+    def __init__(self, value, delay=0, error=None):
+        self.value = value
+        self.delay = delay
+        self.error = error
+        self.reads = 0
+
+    async def get(self, key):
+        self.reads += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.value
+
+    async def mget(self, keys):
+        return [await self.get(key) for key in keys]
+
+
+async def test_cache_group_reads_prefer_low_latency():
+    slow, fast = SlowCache('slow', delay=0.02), SlowCache('fast')
+    cache_group = CacheGroup([
+        CacheGroupItem(slow, True, False, SpeedTier.FAST),
+        CacheGroupItem(fast, True, False, SpeedTier.FAST)
+    ])
+    # unmeasured caches are tried in configured order first
+    assert await cache_group.get('key') == 'slow'
+    assert await cache_group.get('key') == 'fast'
+    for _ in range(10):
+        assert await cache_group.get('key') == 'fast'
+    assert slow.reads == 1
+    assert await cache_group.mget(['key1', 'key2']) == ['fast', 'fast']
+    stats = cache_group.read_cache_stats()
+    assert [s['requests'] for s in stats] == [1, 12]
+    assert stats[0]['ewma_ms'] > stats[1]['ewma_ms']
+
+
+async def test_cache_group_read_fails_over_on_error():
+    broken, working = SlowCache(None, error=ConnectionError()), SlowCache('value')
+    cache_group = CacheGroup([
+        CacheGroupItem(broken, True, False, SpeedTier.FAST),
+        CacheGroupItem(working, True, False, SpeedTier.FAST)
+    ])
+    assert await cache_group.get('key') == 'value'
+    assert cache_group.read_cache_stats()[0]['errors'] == 1
+    # the failed cache is penalized
+    assert await cache_group.get('key') == 'value'
+    assert broken.reads == 1
+
+
+async def test_cache_group_penalized_cache_is_retried_when_idle():
+    broken, working = SlowCache(None, error=ConnectionError()), SlowCache('value', delay=0.005)
+    cache_group = CacheGroup([
+        CacheGroupItem(broken, True, False, SpeedTier.FAST),
+        CacheGroupItem(working, True, False, SpeedTier.FAST)
+    ])
+    cache_group._read_latency[broken].idle_half_life = 0.001
+    assert await cache_group.get('key') == 'value'
+    broken.error = None
+    # the penalty decays while the cache gets no reads
+    await asyncio.sleep(0.02)
+    assert await cache_group.get('key') is None
+    assert broken.reads == 2
+    assert cache_group.read_cache_stats()[0]['ewma_ms'] < 100
+
+
+async def test_cache_group_hedged_read():
+    slow, fast = SlowCache('slow', delay=1), SlowCache('fast')
+    cache_group = CacheGroup([
+        CacheGroupItem(slow, True, False, SpeedTier.FAST),
+        CacheGroupItem(fast, True, False, SpeedTier.FAST)
+    ], read_hedge_delay=0.01)
+    start = time.perf_counter()
+    assert await cache_group.get('key') == 'fast'
+    assert time.perf_counter() - start < 0.5
+    assert slow.reads == 1 and fast.reads == 1
+    # let the abandoned read finish cancelling
+    await asyncio.sleep(0)
+    assert all(s['outstanding'] == 0 for s in cache_group.read_cache_stats())
+
+
+def test_recent_writes():
+    recent_writes = RecentWrites(max_keys=2, min_rewrite_interval=1, max_record_age=300)
+    assert recent_writes.is_redundant('key', 3, now=100) is False
+    recent_writes.record('key', 3, now=100)
+    # written moments ago
+    assert recent_writes.is_redundant('key', 3, now=100.5) is True
+    # the new write would outlive the stored entry
+    assert recent_writes.is_redundant('key', 3, now=101.5) is False
+    # the stored entry outlives the new write
+    assert recent_writes.is_redundant('key', 1, now=101.5) is True
+    # expired
+    assert recent_writes.is_redundant('key', 1, now=103) is False
+
+    recent_writes.record('immutable', None, now=100)
+    assert recent_writes.is_redundant('immutable', None, now=350) is True
+    assert recent_writes.suppressed == 3
+    # records lapse even when the entry doesn't
+    assert recent_writes.is_redundant('immutable', None, now=10_000) is False
+    recent_writes.record('immutable', None, now=10_000)
+
+    recent_writes.record('other', 3, now=100)
+    recent_writes.record('another', 3, now=100)
+    assert recent_writes.is_redundant('immutable', None, now=10_000) is False
+
+
+class WriteRecordingCache:
+    def __init__(self):
+        self.cache = build_mocked_cache()
+        self.writes = []
+
+    async def get(self, key):
+        return await self.cache.get(key)
+
+    async def mget(self, keys):
+        return await self.cache.mget(keys)
+
+    async def set(self, key, value, expire_time=None, nx=False):
+        self.writes.append((key, expire_time, nx))
+        await self.cache.set(key, value, expire_time=expire_time, nx=nx)
+
+    async def set_many(self, data, expire_time=None, nx=False):
+        self.writes.extend((key, expire_time, nx) for key in data)
+        await self.cache.set_many(data, expire_time=expire_time, nx=nx)
+
+    async def delete(self, key):
+        await self.cache.delete(key)
+
+
+async def test_cache_group_skips_redundant_writes():
+    counting = WriteRecordingCache()
+    cache_group = CacheGroup([CacheGroupItem(counting, False, True, SpeedTier.SLOW)])
+    req = jsonrpc_from_request(dummy_request, 0, {
+        "id": "1", "jsonrpc": "2.0", "method": "get_block", "params": [1]
+    })
+    resp = {"id": "1", "jsonrpc": "2.0", "result": {
+        "previous": "0000000000000000000000000000000000000000",
+        "block_id": "000000011b5056ef5b610531031204f173aef7a8"}}
+    key = cache_group.cache_key(req)
+
+    for _ in range(3):
+        await cache_group.cache_single_jsonrpc_response(req, resp,
+                                                        last_irreversible_block_num=1000)
+        await cache_group.cache_batch_jsonrpc_response([req], [resp],
+                                                       last_irreversible_block_num=1000)
+    # irreversible blocks are written once, set-if-absent
+    assert counting.writes == [(key, None, True)]
+
+    # plain writes are never suppressed
+    await cache_group.set('last_irreversible_block_num', 1, expire_time=180)
+    await cache_group.set('last_irreversible_block_num', 2, expire_time=180)
+    assert counting.writes[1:] == [('last_irreversible_block_num', 180, False)] * 2
+
+    # deleted keys are written again
+    await cache_group.delete_many([key])
+    await cache_group.cache_single_jsonrpc_response(req, resp, last_irreversible_block_num=1000)
+    assert counting.writes[-1] == (key, None, True)
+
+
+async def test_cache_group_key_filter_skips_unwritten_keys():
+    class CountingCache:
+        def __init__(self):
+            self.cache = build_mocked_cache()
+            self.keys_read = []
+
+        def __getattr__(self, name):
+            return getattr(self.cache, name)
+
+        async def get(self, key):
+            self.keys_read.append(key)
+            return await self.cache.get(key)
+
+        async def mget(self, keys):
+            self.keys_read.extend(keys)
+            return await self.cache.mget(keys)
+
+    redis_cache = CountingCache()
+    key_filter = KeyFilter(1000)
+    cache_group = build_cache_group(redis_cache, key_filter=key_filter)
+    await redis_cache.cache.set('elsewhere', 'value')
+    await cache_group.set('written', 'value', expire_time=None)
+
+    # nothing is skipped before the first sync
+    cache_group._memory_cache.clears()
+    assert await cache_group.get('elsewhere') == 'value'
+    assert key_filter.skipped == 0
+
+    await key_filter.sync(redis_cache)
+    redis_cache.keys_read.clear()
+    cache_group._memory_cache.clears()
+    # keys cached before the filter existed are still read
+    assert await cache_group.get('elsewhere') == 'value'
+    # only keys redis has already missed are skipped
+    assert await cache_group.get('absent') is None
+    assert await cache_group.mget(['absent', 'written', 'also-absent']) == \
+        [None, 'value', None]
+    assert await cache_group.mget(['absent', 'also-absent']) == [None, None]
+    assert redis_cache.keys_read == ['elsewhere', 'absent', 'written', 'also-absent']
+    assert key_filter.stats()['skipped'] == 3
+
+    # writes end the skipping
+    await cache_group.set('absent', 'value', expire_time=None)
+    cache_group._memory_cache.clears()
+    assert await cache_group.get('absent') == 'value'
+
+    # workers share their keys through redis
+    other_filter = KeyFilter(1000)
+    await other_filter.sync(redis_cache)
+    assert other_filter.may_contain('written') is True
+    other_filter.record_miss('also-absent', now=100)
+    assert other_filter.may_contain('also-absent', now=101) is False
+    # another worker may have written it since
+    assert other_filter.may_contain('also-absent', now=130) is True
+
+
+async def test_key_filter_concurrent_syncs_keep_all_keys():
+    redis_cache = build_mocked_cache()
+    filters = [KeyFilter(1000) for _ in range(3)]
+    for i, key_filter in enumerate(filters):
+        key_filter.add(f'key{i}')
+    await asyncio.gather(*[key_filter.sync(redis_cache) for key_filter in filters])
+    await filters[0].sync(redis_cache)
+    assert all(filters[0].may_contain(f'key{i}') for i in range(3))
+
+    # keys added while waiting on redis aren't lost when the merged bits load
+    merge_bits = redis_cache.merge_bits
+
+    async def slow_merge_bits(key, bits):
+        filters[1].add('during')
+        return await merge_bits(key, bits)
+    redis_cache.merge_bits = slow_merge_bits
+    await filters[1].sync(redis_cache)
+    assert filters[1].may_contain('during') is True
+
+
+async def test_cache_group_race_upstream_delay():
+    slow = SlowCache('value', delay=0.01)
+    cache_group = build_cache_group(slow)
+    assert cache_group.race_upstream_delay(1.0) is None
+    for _ in range(5):
+        await cache_group.get('key')
+    delay = cache_group.race_upstream_delay(1.0)
+    assert 0.01 < delay < 0.1
+    # racing only helps if it starts before the read times out
+    assert cache_group.race_upstream_delay(delay) is None
+
+
+async def test_cache_group_breaker_skips_failing_cache():
+    failing = SlowCache('value', error=ConnectionRefusedError())
+    cache_group = build_cache_group(failing, breaker_failure_threshold=2,
+                                    breaker_cooldown=0.05)
+    for _ in range(2):
+        with pytest.raises(ConnectionRefusedError):
+            await cache_group.get('key')
+    assert cache_group.breaker_stats()[0]['open'] is True
+
+    # skipped while open, without errors
+    assert await cache_group.get('key') is None
+    assert failing.reads == 2
+
+    # a probe after the cooldown closes the breaker once the cache recovers
+    failing.error = None
+    await asyncio.sleep(0.05)
+    assert await cache_group.get('key') is None
+    await asyncio.sleep(0.01)
+    assert failing.reads == 3
+    assert cache_group.breaker_stats()[0]['open'] is False
+    assert await cache_group.get('key') == 'value'
+
+
+async def test_cache_group_breaker_reopens_after_failed_probe():
+    failing = SlowCache('value', error=ConnectionRefusedError())
+    cache_group = build_cache_group(failing, breaker_failure_threshold=1,
+                                    breaker_cooldown=0.05)
+    with pytest.raises(ConnectionRefusedError):
+        await cache_group.get('key')
+    await asyncio.sleep(0.05)
+    assert await cache_group.get('key') is None
+    await asyncio.sleep(0.01)
+    assert failing.reads == 2
+    assert await cache_group.get('key') is None
+    assert failing.reads == 2
+    assert cache_group.breaker_stats()[0]['trips'] == 1
+
+
+async def test_cache_group_breaker_counts_timeouts():
+    hung = SlowCache('value', delay=1)
+    cache_group = build_cache_group(hung, breaker_failure_threshold=1,
+                                    breaker_cooldown=10,
+                                    breaker_call_timeout=0.01)
+    with pytest.raises(asyncio.TimeoutError):
+        await cache_group.get('key')
+    assert cache_group.breaker_stats()[0]['open'] is True
+    assert await cache_group.get('key') is None
+    assert hung.reads == 1
+
+
+async def test_cache_group_breaker_sees_write_behind_flush_failures():
+    failing = build_mocked_cache()
+
+    async def set_many_by_ttl(data, nx=False):
+        raise ConnectionRefusedError()
+    failing.set_many_by_ttl = set_many_by_ttl
+    write_behind = WriteBehindCache(failing, flush_interval=10)
+    cache_group = build_cache_group(write_behind, breaker_failure_threshold=2,
+                                    breaker_cooldown=10)
+    for i in range(2):
+        # queueing succeeds, so it doesn't reset the failure count
+        await cache_group.set(f'key{i}', 'value', 3)
+        await write_behind.drain()
+    assert cache_group.breaker_stats()[0]['open'] is True
+    assert write_behind.stats()['failed_flushes'] == 2
+
+
+async def test_cache_group_expire_on_new_block():
+    cache_group = build_cache_group()
+    req = jsonrpc_from_request(dummy_request, 0, {
+        "id": "1", "jsonrpc": "2.0",
+        "method": "get_accounts", "params": [["dpay"]]
+    })
+    req.upstream = req.upstream._replace(ttl=-3)
+    resp = {"id": "1", "jsonrpc": "2.0", "result": [{"name": "dpay", "balance": 1}]}
+    next_resp = {"id": "1", "jsonrpc": "2.0", "result": [{"name": "dpay", "balance": 2}]}
+    key = cache_group.cache_key(req)
+
+    await cache_group.update_head_block_num(100)
+    await cache_group.cache_single_jsonrpc_response(req, resp)
+    assert (await cache_group.get(key))[HEAD_BLOCK_NUM_KEY] == 100
+    assert await cache_group.get_single_jsonrpc_response(req) == resp
+    assert await cache_group.get_batch_jsonrpc_responses([req]) == [resp]
+
+    await cache_group.update_head_block_num(101)
+    assert await cache_group.get_single_jsonrpc_response(req) is None
+    assert await cache_group.get_batch_jsonrpc_responses([req]) == [None]
+
+    # written again straight away within the same second
+    await cache_group.cache_batch_jsonrpc_response([req], [next_resp])
+    assert await cache_group.get_single_jsonrpc_response(req) == next_resp
+
+
+async def test_cache_group_shares_head_block_num(monkeypatch):
+    monkeypatch.setattr('jefferson.cache.cache_group.HEAD_BLOCK_NUM_SYNC_INTERVAL', 0.01)
+    redis_cache = build_mocked_cache()
+    fetching = build_cache_group(redis_cache)
+    other = build_cache_group(redis_cache)
+    other.start_head_block_num_sync()
+    try:
+        await fetching.update_head_block_num(100, share=True)
+        await asyncio.sleep(0.03)
+        assert other._head_block_num == 100
+        # heads which didn't come from upstream aren't shared again
+        await other.update_head_block_num(101)
+        await asyncio.sleep(0.03)
+        assert fetching._head_block_num == 100
+    finally:
+        await other.close()
+
+
+async def test_cache_group_promotes_irreversible_blocks():
+    recording = WriteRecordingCache()
+    cache_group = build_cache_group(recording, promote_irreversible_blocks=True)
+    req = jsonrpc_from_request(dummy_request, 0, {
+        "id": "1", "jsonrpc": "2.0", "method": "get_block", "params": [1000]
+    })
+    header_req = jsonrpc_from_request(dummy_request, 0, {
+        "id": "1", "jsonrpc": "2.0", "method": "get_block_header", "params": [1000]
+    })
+    resp = {"id": "1", "jsonrpc": "2.0", "result": {
+        "previous": "000003e70301334402ae97d8cef292a21247777f",
+        "block_id": "000003e8cc14da92f6beb0f9949a672cda19dd7b"}}
+    header_resp = {"id": "1", "jsonrpc": "2.0", "result": {
+        "previous": "000003e70301334402ae97d8cef292a21247777f"}}
+    next_header_req = jsonrpc_from_request(dummy_request, 0, {
+        "id": "1", "jsonrpc": "2.0", "method": "get_block_header", "params": [1001]
+    })
+    next_header_resp = {"id": "1", "jsonrpc": "2.0", "result": {
+        "previous": "000003e8cc14da92f6beb0f9949a672cda19dd7b"}}
+    key = cache_group.cache_key(req)
+    header_key = cache_group.cache_key(header_req)
+
+    await cache_group.cache_single_jsonrpc_response(req, resp, last_irreversible_block_num=999)
+    await cache_group.cache_batch_jsonrpc_response([header_req, next_header_req],
+                                                   [header_resp, next_header_resp],
+                                                   last_irreversible_block_num=999)
+    next_header_key = cache_group.cache_key(next_header_req)
+    assert recording.writes == [(key, 3, False), (header_key, 3, False),
+                                (next_header_key, 3, False)]
+
+    await cache_group.update_last_irreversible_block_num(999)
+    assert len(recording.writes) == 3
+
+    # block 1001 confirms block 1000
+    await cache_group.update_last_irreversible_block_num(1000)
+    assert sorted(recording.writes[3:]) == sorted([(key, None, False), (header_key, None, False)])
+    assert await cache_group.get_single_jsonrpc_response(req) == resp
+    assert cache_group.reversible_block_stats()['blocks'] == 1
+    assert cache_group.reversible_block_stats()['promoted'] == 2
+
+    # already stored without expiry
+    await cache_group.cache_single_jsonrpc_response(req, resp, last_irreversible_block_num=1000)
+    assert len(recording.writes) == 5
+
+    # nothing confirms block 1001 is on the main chain, it's left to expire
+    await cache_group.update_last_irreversible_block_num(1001)
+    assert len(recording.writes) == 5
+    assert cache_group.reversible_block_stats()['blocks'] == 0
+    assert cache_group.reversible_block_stats()['promoted'] == 2
+
+
+async def test_cache_group_drops_orphaned_reversible_blocks():
+    recording = WriteRecordingCache()
+    cache_group = build_cache_group(recording, reversible_block_ttl=60)
+
+    def block_request(method, block_num):
+        return jsonrpc_from_request(dummy_request, 0, {
+            "id": "1", "jsonrpc": "2.0", "method": method, "params": [block_num]
+        })
+
+    def block_response(block_id, previous):
+        return {"id": "1", "jsonrpc": "2.0", "result": {"previous": previous,
+                                                        "block_id": block_id}}
+
+    req_1000 = block_request('get_block', 1000)
+    req_1001 = block_request('get_block', 1001)
+    header_req_1001 = block_request('get_block_header', 1001)
+    fork_resp_1000 = block_response('000003e8aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa',
+                                    '000003e70301334402ae97d8cef292a21247777f')
+    resp_1001 = block_response('000003e9cccccccccccccccccccccccccccccccc',
+                               '000003e8bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb')
+    header_resp_1001 = {"id": "1", "jsonrpc": "2.0", "result": {
+        "previous": "000003e8bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb"}}
+
+    await cache_group.cache_single_jsonrpc_response(req_1000, fork_resp_1000,
+                                                    last_irreversible_block_num=999)
+    assert recording.writes == [(cache_group.cache_key(req_1000), 60, False)]
+    assert await cache_group.get_single_jsonrpc_response(req_1000) == fork_resp_1000
+
+    # block 1001 doesn't build on the cached block 1000
+    await cache_group.cache_batch_jsonrpc_response([req_1001, header_req_1001],
+                                                   [resp_1001, header_resp_1001],
+                                                   last_irreversible_block_num=999)
+    assert await cache_group.get_single_jsonrpc_response(req_1000) is None
+    assert await cache_group.get_single_jsonrpc_response(req_1001) == resp_1001
+    assert await cache_group.get_single_jsonrpc_response(header_req_1001) == header_resp_1001
+    assert cache_group.reversible_block_stats()['orphaned'] == 1
+
+    # without promotion irreversible blocks are just no longer tracked
+    await cache_group.update_last_irreversible_block_num(1001)
+    assert cache_group.reversible_block_stats()['blocks'] == 0
+    assert len(recording.writes) == 3
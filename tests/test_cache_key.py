@@ -1,8 +1,65 @@
 # -*- coding: utf-8 -*-
+import pytest
+
 from jefferson.cache.utils import jsonrpc_cache_key
+from jefferson.request.jsonrpc import from_http_request as jsonrpc_from_request
+
+from .conftest import make_request
+
+# requests which share a canonical key with an equivalent request
+CANONICAL_KEYS = {
+    'dpayd.database_api.get_block.params=[1]': 'appbase.condenser_api.get_block.params=[1]'
+}
+
+dummy_request = make_request()
 
 
 def test_cache_key(urn_test_requests):
     jsonrpc_request, urn, url, ttl, timeout, jefferson_request = urn_test_requests
     result = jsonrpc_cache_key(jefferson_request)
-    assert result == urn
+    assert result == CANONICAL_KEYS.get(urn, urn)
+
+
+@pytest.mark.parametrize('method,params,expected', [
+    # get_block
+    ('get_block', [1000], 'appbase.condenser_api.get_block.params=[1000]'),
+    ('get_block', ['1000'], 'appbase.condenser_api.get_block.params=[1000]'),
+    ('call', ['database_api', 'get_block', [1000]],
+     'appbase.condenser_api.get_block.params=[1000]'),
+    ('call', [0, 'get_block', ['1000']],
+     'appbase.condenser_api.get_block.params=[1000]'),
+    ('condenser_api.get_block', [1000], 'appbase.condenser_api.get_block.params=[1000]'),
+    ('call', ['condenser_api', 'get_block', ['1000']],
+     'appbase.condenser_api.get_block.params=[1000]'),
+    ('block_api.get_block', {'block_num': 1000},
+     'appbase.block_api.get_block.params={"block_num":1000}'),
+    ('block_api.get_block', {'block_num': '1000'},
+     'appbase.block_api.get_block.params={"block_num":1000}'),
+
+    # get_block_header
+    ('get_block_header', [1000], 'appbase.condenser_api.get_block_header.params=[1000]'),
+    ('condenser_api.get_block_header', ['1000'],
+     'appbase.condenser_api.get_block_header.params=[1000]'),
+    ('block_api.get_block_header', {'block_num': 1000},
+     'appbase.condenser_api.get_block_header.params=[1000]'),
+
+    # unparseable block nums are left alone
+    ('get_block', ['a'], 'dpayd.database_api.get_block.params=["a"]'),
+    ('get_block', [], 'dpayd.database_api.get_block.params=[]'),
+    ('get_block', [1000.5], 'dpayd.database_api.get_block.params=[1000.5]'),
+    ('get_block', [True], 'dpayd.database_api.get_block.params=[true]'),
+    ('get_block', [' 1000'], 'dpayd.database_api.get_block.params=[" 1000"]'),
+    ('block_api.get_block', {'block_num': False},
+     'appbase.block_api.get_block.params={"block_num":false}'),
+
+    # nested dicts are sorted
+    ('condenser_api.get_discussions_by_trending', [{'tag': 'dpay', 'limit': 1}],
+     'appbase.condenser_api.get_discussions_by_trending.params=[{"limit":1,"tag":"dpay"}]'),
+    ('database_api.find_votes', {'b': {'z': 1, 'a': 2}, 'a': 1},
+     'appbase.database_api.find_votes.params={"a":1,"b":{"a":2,"z":1}}'),
+])
+def test_canonical_cache_key(method, params, expected):
+    request = jsonrpc_from_request(dummy_request, 0, {
+        'id': 1, 'jsonrpc': '2.0', 'method': method, 'params': params
+    })
+    assert jsonrpc_cache_key(request) == expected
@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import json
+from types import SimpleNamespace
 
 
 import pytest
 
+import jefferson.middlewares.caching
+from jefferson.middlewares.caching import race_upstream
+from jefferson.timings import Timings
+
 
 req = {"id": 1, "jsonrpc": "2.0", "method": "get_dynamic_global_properties"}
 
@@ -97,3 +103,55 @@ async def test_mocked_cache_response_middleware(mocked_app_test_cli):
     response = await test_cli.post('/', json=req, headers={'x-jefferson-request-id': '1'})
     assert response.headers['x-jefferson-cache-hit'] == 'dpayd.database_api.get_dynamic_global_properties'
     assert await response.json() == expected_response
+
+
+def build_race_request():
+    cache_group = SimpleNamespace(is_complete_response=lambda request, response: True)
+    return SimpleNamespace(app=SimpleNamespace(config=SimpleNamespace(cache_group=cache_group)),
+                           jsonrpc=req,
+                           timings=Timings('http_create'),
+                           jefferson_request_id='1')
+
+
+async def delayed(delay, result):
+    await asyncio.sleep(delay)
+    return result
+
+
+@pytest.mark.parametrize('cache_delay,upstream_delay,expected', [
+    # fast cache reads never start an upstream request
+    (0, None, 'cached'),
+    # a slow cache read still wins if it answers first
+    (0.02, 0.1, 'cached'),
+    (0.1, 0.02, 'upstream'),
+])
+async def test_race_upstream(monkeypatch, cache_delay, upstream_delay, expected):
+    upstream_calls = []
+
+    async def handle_jsonrpc(request):
+        upstream_calls.append(request)
+        return await delayed(upstream_delay, 'upstream')
+
+    monkeypatch.setattr(jefferson.middlewares.caching, 'handle_jsonrpc', handle_jsonrpc)
+    cached_response, upstream_task = await race_upstream(build_race_request(),
+                                                         delayed(cache_delay, 'cached'),
+                                                         delay=0.01)
+    if expected == 'cached':
+        assert cached_response == 'cached'
+        assert upstream_task is None
+    else:
+        assert cached_response is None
+        assert upstream_task.result() == 'upstream'
+    assert len(upstream_calls) == (0 if upstream_delay is None else 1)
+
+
+async def test_race_upstream_cache_miss_waits_for_upstream(monkeypatch):
+    async def handle_jsonrpc(request):
+        return await delayed(0.05, 'upstream')
+
+    monkeypatch.setattr(jefferson.middlewares.caching, 'handle_jsonrpc', handle_jsonrpc)
+    cached_response, upstream_task = await race_upstream(build_race_request(),
+                                                         delayed(0.02, None),
+                                                         delay=0.01)
+    assert cached_response is None
+    assert upstream_task.result() == 'upstream'
@@ -1,8 +1,16 @@
 # -*- coding: utf-8 -*-
+import time
+
 import pytest
 
 
 from jefferson.cache.utils import block_num_from_jsonrpc_response
+from jefferson.cache.utils import HEAD_BLOCK_NUM_KEY
+from jefferson.cache.utils import cache_entry_state
+from jefferson.cache.utils import cache_key_fingerprint
+from jefferson.cache.utils import hashed_cache_key
+from jefferson.cache.utils import stale_cache_entry
+from jefferson.cache.utils import CacheEntryState
 
 # FIXME add all formats of get_block and get_block_header responses
 ttl_rpc_req = {"id": "1", "jsonrpc": "2.0",
@@ -33,3 +41,57 @@ non_ttl_rpc_req = {"id": "1", "jsonrpc": "2.0",
 def test_block_num_from_jsonrpc_response(response, expected):
     num = block_num_from_jsonrpc_response(response)
     assert num == expected
+
+
+@pytest.mark.parametrize('elapsed,expected', [
+    (0, CacheEntryState.FRESH),
+    (9, CacheEntryState.FRESH),
+    (10, CacheEntryState.STALE),
+    (29, CacheEntryState.STALE),
+    (30, CacheEntryState.EXPIRED),
+    (300, CacheEntryState.EXPIRED)
+])
+def test_cache_entry_state(elapsed, expected):
+    now = time.time()
+    entry = stale_cache_entry(rpc_resp, ttl=10, stale_ttl=20, now=now)
+    assert entry['result'] == rpc_resp['result']
+    assert cache_entry_state(entry, now=now + elapsed) is expected
+
+
+def test_cache_entry_state_without_timestamps():
+    assert cache_entry_state(rpc_resp) is CacheEntryState.FRESH
+
+
+@pytest.mark.parametrize('entry_head_block_num,head_block_num,expected', [
+    (100, None, CacheEntryState.FRESH),
+    (100, 100, CacheEntryState.FRESH),
+    (100, 101, CacheEntryState.EXPIRED),
+    (None, 101, CacheEntryState.FRESH),
+])
+def test_cache_entry_state_head_block(entry_head_block_num, head_block_num, expected):
+    entry = dict(rpc_resp)
+    if entry_head_block_num is not None:
+        entry[HEAD_BLOCK_NUM_KEY] = entry_head_block_num
+    assert cache_entry_state(entry, head_block_num=head_block_num) is expected
+
+
+@pytest.mark.parametrize('key', [
+    'appbase.condenser_api.get_block.params=[1000]',
+    'dpayd.database_api.get_dynamic_global_properties',
+    'appbase.condenser_api.get_accounts.params=[["dpay"]]',
+])
+def test_hashed_cache_key_short_params(key):
+    assert hashed_cache_key(key) == key
+
+
+def test_hashed_cache_key_long_params():
+    key = 'appbase.condenser_api.get_discussions_by_trending.params=' \
+        '[{"limit":20,"tag":"photography","truncate_body":1024}]'
+    other_key = 'appbase.condenser_api.get_discussions_by_trending.params=' \
+        '[{"limit":21,"tag":"photography","truncate_body":1024}]'
+    hashed_key = hashed_cache_key(key)
+    assert hashed_key.startswith('appbase.condenser_api.get_discussions_by_trending.h=')
+    assert len(hashed_key) == len('appbase.condenser_api.get_discussions_by_trending.h=') + 32
+    assert hashed_key == hashed_cache_key(key)
+    assert hashed_key != hashed_cache_key(other_key)
+    assert cache_key_fingerprint(key) != cache_key_fingerprint(other_key)
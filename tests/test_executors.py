@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from jefferson.executors import PayloadExecutor
+
+
+def current_thread_name(_):
+    return threading.current_thread().name
+
+
+async def test_payload_executor_threshold():
+    executor = PayloadExecutor(max_workers=1, threshold=100)
+    assert await executor.run(99, current_thread_name, None) == threading.current_thread().name
+    assert (await executor.run(100, current_thread_name, None)).startswith('payload')
+    assert executor.stats() == {'workers': 1,
+                                'threshold': 100,
+                                'pending': 0,
+                                'max_pending': 1,
+                                'offloaded': 1}
+    executor.shutdown()
+
+
+async def test_payload_executor_without_workers():
+    executor = PayloadExecutor(threshold=1)
+    assert not executor.offloads(10 ** 9)
+    assert await executor.run(10 ** 9, current_thread_name, None) == threading.current_thread().name
+    assert executor.stats()['offloaded'] == 0
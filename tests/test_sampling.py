@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+import pytest
+
+from jefferson.async_stats import AsyncStatsClient
+from jefferson.empty import _empty
+from jefferson.sampling import StatsSampler
+from jefferson.sampling import parse_method_rates
+from jefferson.timings import Timings
+
+
+def build_jsonrpc_request(namespace, api, method):
+    return SimpleNamespace(urn=SimpleNamespace(namespace=namespace, api=api, method=method))
+
+
+def build_request(*jsonrpc_requests):
+    return SimpleNamespace(is_single_jrpc=len(jsonrpc_requests) == 1,
+                           jsonrpc=jsonrpc_requests[0] if len(jsonrpc_requests) == 1
+                           else list(jsonrpc_requests),
+                           timings=Timings('http_create'))
+
+
+def build_response(status=200, headers=None):
+    return SimpleNamespace(status=status, headers=headers or {})
+
+
+get_block = build_jsonrpc_request('appbase', 'condenser_api', 'get_block')
+legacy_get_block = build_jsonrpc_request('dpayd', _empty, 'get_block')
+get_accounts = build_jsonrpc_request('appbase', 'condenser_api', 'get_accounts')
+
+
+def test_parse_method_rates():
+    assert parse_method_rates(None) == {}
+    assert parse_method_rates(['get_block=0.01', 'condenser_api.get_block = 0.5']) == {
+        'get_block': 0.01,
+        'condenser_api.get_block': 0.5
+    }
+
+
+@pytest.mark.parametrize('jsonrpc_request,expected', [
+    (get_block, 0.5),
+    (legacy_get_block, 0.01),
+    (get_accounts, 1.0),
+])
+def test_method_rate(jsonrpc_request, expected):
+    sampler = StatsSampler(method_rates={'get_block': 0.01, 'condenser_api.get_block': 0.5})
+    assert sampler.method_rate(jsonrpc_request) == expected
+
+
+def test_sampled():
+    sampler = StatsSampler(rate=0, slow_request_threshold=10)
+    assert not sampler.sampled(build_request(get_block), build_response())
+    assert sampler.sampled(build_request(get_block), build_response(status=502))
+    assert sampler.sampled(build_request(get_block),
+                           build_response(headers={'x-jefferson-error-id': '1'}))
+    slow_request = build_request(get_block)
+    slow_request.timings = SimpleNamespace(start=-100)
+    assert sampler.sampled(slow_request, build_response())
+    # a batch is sampled at the highest rate of its methods
+    sampler = StatsSampler(rate=0, method_rates={'get_accounts': 1})
+    assert sampler.sampled(build_request(get_block, get_accounts), build_response())
+
+
+async def test_stats_client_aggregates_counters():
+    sent = []
+    client = AsyncStatsClient(prefix='jefferson')
+    client._transport = SimpleNamespace(sendto=sent.append)
+    for _ in range(3):
+        client.count('jrpc.inflight')
+    client.count('jrpc.inflight', -3)
+    client.count('jrpc.requests', 3)
+    assert not sent
+    client.flush()
+    assert sent == [b'jefferson.jrpc.requests:3|c']
+    client.flush()
+    assert len(sent) == 1
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from jefferson.async_stats import fmt_timings
+from jefferson.timings import Timings
+from jefferson.timings import stage_id
+from jefferson.timings import stage_name
+
+
+def test_timings_record():
+    timings = Timings('http_create', capacity=2)
+    for stage in ('handle_jsonrpc.enter', 'fetch_http.enter', 'handle_jsonrpc.exit'):
+        timings.record(stage)
+    assert len(timings) == 4
+    recorded = timings.to_list()
+    assert [stage for _, stage in recorded] == ['http_create', 'handle_jsonrpc.enter',
+                                                'fetch_http.enter', 'handle_jsonrpc.exit']
+    assert timings.start == recorded[0][0]
+    assert [time for time, _ in recorded] == sorted(time for time, _ in recorded)
+    elapsed = list(timings.elapsed())
+    assert [stage for stage, _ in elapsed] == ['handle_jsonrpc.enter',
+                                               'fetch_http.enter', 'handle_jsonrpc.exit']
+    assert all(ms >= 0 for _, ms in elapsed)
+
+
+def test_timings_format():
+    timings = Timings('jsonrpc_create')
+    timings.record('fetch_ws.enter')
+    lines = timings.format('jefferson.')
+    assert len(lines) == 1
+    assert lines[0].startswith('jefferson.fetch_ws.enter:')
+    assert lines[0].endswith('|ms')
+    assert fmt_timings(timings)[0].startswith('fetch_ws.enter:')
+
+
+def test_stage_ids_are_interned():
+    assert stage_id('fetch_ws.send') == stage_id('fetch_ws.send')
+    assert stage_name(stage_id('fetch_ws.send')) == 'fetch_ws.send'
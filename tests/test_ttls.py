@@ -51,6 +51,52 @@ def test_ttls(rpc_req, rpc_resp, last_block_num, expected):
     assert ttl == expected
 
 
+def build_request(method, params):
+    return jsonrpc_from_request(dummy_request, 0, {"id": "1", "jsonrpc": "2.0",
+                                                   "method": method, "params": params})
+
+
+def history_response(first_seq, last_seq, block_num):
+    return {"id": 1, "result": [[seq, {"block": block_num + seq, "op": ["vote", {}]}]
+                                for seq in range(first_seq, last_seq + 1)]}
+
+
+@pytest.mark.parametrize('rpc_req, rpc_resp, last_block_num, expected', [
+    (build_request('get_ops_in_block', [1000, False]), {"id": 1, "result": []},
+     999, TTL.DEFAULT_TTL),
+    (build_request('get_ops_in_block', [1000, False]), {"id": 1, "result": []},
+     1000, TTL.NO_EXPIRE),
+    (build_request('account_history_api.get_ops_in_block',
+                   {"block_num": 1000, "only_virtual": False}),
+     {"id": 1, "result": {"ops": []}}, 1000, TTL.NO_EXPIRE),
+    (build_request('block_api.get_block_range', {"starting_block_num": 990, "count": 11}),
+     {"id": 1, "result": {"blocks": []}}, 999, TTL.DEFAULT_TTL),
+    (build_request('block_api.get_block_range', {"starting_block_num": 990, "count": 11}),
+     {"id": 1, "result": {"blocks": []}}, 1000, TTL.NO_EXPIRE),
+    (build_request('get_transaction', ["c6f0"]), {"id": 1, "result": {"block_num": 1000}},
+     1000, TTL.NO_EXPIRE),
+    (build_request('get_transaction', ["c6f0"]), {"id": 1, "result": {"block_num": 1000}},
+     999, TTL.DEFAULT_TTL),
+    (build_request('get_account_history', ["dpay", 10, 2]), history_response(8, 10, 990),
+     1000, TTL.NO_EXPIRE),
+    (build_request('get_account_history', ["dpay", 10, 2]), history_response(8, 10, 990),
+     999, TTL.DEFAULT_TTL),
+    # the newest page, or one which may still grow, is never irreversible
+    (build_request('get_account_history', ["dpay", -1, 2]), history_response(8, 10, 0),
+     1000, TTL.DEFAULT_TTL),
+    (build_request('get_account_history', ["dpay", 20, 2]), history_response(8, 10, 0),
+     1000, TTL.DEFAULT_TTL),
+    # extractors are keyed by api, a method of the same name elsewhere isn't matched
+    (build_request('transaction_status_api.get_transaction', {"id": "c6f0"}),
+     {"id": 1, "result": {"block_num": 1000}}, 1000, TTL.DEFAULT_TTL),
+    # block responses still use the block number in the result
+    (ttl_rpc_req, rpc_resp, 1000, TTL.NO_EXPIRE),
+    (ttl_rpc_req, rpc_resp, 999, TTL.DEFAULT_TTL),
+])
+def test_irreversible_ttl_by_method(rpc_req, rpc_resp, last_block_num, expected):
+    assert irreversible_ttl(rpc_resp, last_block_num, rpc_req) == expected.value
+
+
 @pytest.mark.parametrize('ttl,eq', [
     (TTL.NO_CACHE, -1),
     (TTL.DEFAULT_TTL, 3),
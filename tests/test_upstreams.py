@@ -39,6 +39,12 @@ SIMPLE_CONFIG = {
                     "upstream_ttl": 2
                 }
             ],
+            "stale_ttls": [
+                {
+                    "prefix": "test2",
+                    "upstream_stale_ttl": 20
+                }
+            ],
             "timeouts": [
                 {
                     "prefix": "test2",
@@ -183,6 +189,20 @@ def test_ttl_object():
     assert upstreams.ttl(urn) == 2
 
 
+def test_stale_ttl_missing():
+    from jefferson.urn import URN
+    urn = URN('test', 'api', 'method', False)
+    upstreams = _Upstreams(SIMPLE_CONFIG, validate=False)
+    assert upstreams.stale_ttl(urn) == 0
+
+
+def test_stale_ttl_object():
+    from jefferson.urn import URN
+    urn = URN('test2', 'api', 'method', False)
+    upstreams = _Upstreams(SIMPLE_CONFIG, validate=False)
+    assert upstreams.stale_ttl(urn) == 20
+
+
 def test_validate_urls_raises():
     with pytest.raises(InvalidUpstreamHost):
         upstreams = _Upstreams(SIMPLE_CONFIG)
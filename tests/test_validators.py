@@ -10,6 +10,7 @@ from jefferson.request.jsonrpc import JSONRPCRequest
 from jefferson.request.jsonrpc import from_http_request as jsonrpc_from_request
 from jefferson.validators import is_get_block_header_request
 from jefferson.validators import is_get_block_request
+from jefferson.validators import is_empty_block_response
 from jefferson.validators import is_valid_get_block_response
 from jefferson.validators import is_valid_non_error_jefferson_response
 from jefferson.validators import is_valid_non_error_single_jsonrpc_response
@@ -237,6 +238,22 @@ def test_is_valid_non_error_single_jsonrpc_response_using_dpayd(
     assert is_valid_non_error_single_jsonrpc_response(resp) is True
 
 
+@pytest.mark.parametrize('req,resp,expected', [
+    (request, {"id": 1, "jsonrpc": "2.0", "result": None}, True),
+    (request, {"id": 1, "jsonrpc": "2.0", "result": {}}, True),
+    (request2, {"id": 1, "jsonrpc": "2.0", "result": None}, True),
+    (bh_request1, {"id": 1, "jsonrpc": "2.0", "result": None}, True),
+    (request, response, False),
+    (request, error_response, False),
+    (dict(jsonrpc='2.0', method='get_accounts', params=[[]]),
+     {"id": 1, "jsonrpc": "2.0", "result": []}, False)
+])
+def test_is_empty_block_response(req, resp, expected):
+    if not isinstance(req, JSONRPCRequest):
+        req = jsonrpc_from_request(dummy_request, 0, req)
+    assert is_empty_block_response(req, resp) is expected
+
+
 @pytest.mark.parametrize('req,resp,expected', [
     (request, response, True),
     (request2, response, True),